@@ -10,3 +10,23 @@ class CommAPI(ABC):
     @abstractmethod
     def push(self):
         pass
+
+    def ack(self, requests):
+        """Called once pulled requests were processed and pushed successfully
+
+        Args:
+            requests (list[Request]): requests to acknowledge
+        """
+        pass
+
+    def nack(self, requests):
+        """Called when pulled requests failed to be processed or pushed
+
+        Args:
+            requests (list[Request]): requests to give up on
+        """
+        pass
+
+    def close(self):
+        """Called once the server stops pulling, to release buffered work and threads"""
+        pass
@@ -1,2 +1,10 @@
 SQS_WAIT_TIME_SEC = 5
 S3_ENDPOINT_BUCKET = "cv-response-jsons"
+PUSH_QUEUE_SIZE = 16
+PUSH_RETRIES = 2
+PUSH_TIMEOUT_SEC = 60
+PUSH_BACKOFF_SEC = 1
+SQS_MAX_BATCH = 10
+SQS_VISIBILITY_TIMEOUT_SEC = 300
+SQS_HEARTBEAT_SEC = 60
+SQS_DELETE_INTERVAL_SEC = 30
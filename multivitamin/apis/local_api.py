@@ -55,7 +55,8 @@ class LocalAPI(CommAPI):
         for _ in range(n):
             if self.json_queue.empty():
                 log.info("Queue of jsons is empty. Exiting.")
-                return [Request({"kill_flag": "true"})]
+                requests.append(Request({"kill_flag": "true"}))
+                break
             m = self.json_queue.get()
             log.info(f"Appending request: {m}")
             requests.append(Request(m))
@@ -86,7 +87,10 @@ class LocalAPI(CommAPI):
             log.info(f"Writing {fn}")
             if res.request.bin_encoding is True:
                 with open(fn, "wb") as wf:
-                    wf.write(res.to_bytes())
+                    if res.request.base64_encoding is True:
+                        wf.write(res.to_bytes())
+                    else:
+                        res.write_avro(wf)
             else:
                 with open(fn, "w") as wf:
                     wf.write(json.dumps(res.to_dict(), indent=INDENTATION))
@@ -0,0 +1,190 @@
+import time
+import threading
+import traceback
+import itertools
+
+import glog as log
+
+from multivitamin.apis import config
+from multivitamin.utils.work_handler import WorkerManager
+
+
+class PushDispatcher:
+    def __init__(
+        self,
+        output_comms,
+        n_workers=1,
+        max_queue_size=config.PUSH_QUEUE_SIZE,
+        retries=config.PUSH_RETRIES,
+        timeout=config.PUSH_TIMEOUT_SEC,
+        backoff=config.PUSH_BACKOFF_SEC,
+        on_complete=None,
+    ):
+        """Fans responses out to all output comms concurrently on a pool of worker threads
+
+        push() only enqueues, so the caller never blocks on egress unless max_queue_size
+        responses are already waiting to be pushed.
+
+        A push that times out is abandoned, not interrupted, and is not retried, as it may
+        still succeed. Its response stops counting towards max_queue_size, so comms that hang
+        do not block push(), and is completed once the abandoned push finishes, so its
+        request is not nacked and redelivered while the push may still upload it. Pushes
+        that finish after close() are only logged. Delivery is still at least once: e.g. a
+        push that uploaded but raised is retried, and a request whose visibility expires
+        meanwhile is redelivered.
+
+        Args:
+            output_comms (list[CommAPI]): comms every response is pushed to
+            n_workers (int): number of pushing threads
+            max_queue_size (int): max number of responses queued or being pushed
+            retries (int): number of retries per comm after a failed push
+            timeout (float): seconds to wait for a single push before abandoning it
+            backoff (float): seconds to wait before the first retry, doubled on each retry
+            on_complete (callable): called as on_complete(response, success) once a response
+                                    was pushed to every comm, success is False if any failed
+        """
+        self.output_comms = output_comms
+        self.retries = max(int(retries), 0)
+        self.timeout = timeout
+        self.backoff = backoff
+        self.on_complete = on_complete
+        self._slots = threading.BoundedSemaphore(max(int(max_queue_size), 1))
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._keys = itertools.count()
+        self._abandoned = set()
+        self._closed = False
+        self._manager = WorkerManager(
+            func=self._push_job, n=max(int(n_workers), 1), parallelization="thread"
+        )
+
+    def push(self, response):
+        """Queue a response to be pushed to every output comm
+
+        Args:
+            response (Response): outgoing response
+        """
+        self._slots.acquire()
+        # keyed by a counter, as the id of a response may be reused once it is freed
+        key = next(self._keys)
+        with self._lock:
+            # comms left to push to, success so far, whether the response holds a slot
+            self._pending[key] = [len(self.output_comms), True, True]
+        for output_comm in self.output_comms:
+            self._manager.queue.put((key, response, output_comm))
+
+    def close(self):
+        """Wait for all queued responses to be pushed and stop the workers
+
+        Abandoned pushes are waited for up to timeout seconds each, those that finish later
+        are only logged
+        """
+        self._manager.kill_workers_on_completion()
+        with self._lock:
+            abandoned = list(self._abandoned)
+        for thread in abandoned:
+            thread.join(self.timeout)
+        with self._lock:
+            self._closed = True
+
+    def _push_job(self, job):
+        key, response, output_comm = job
+        success = False
+        try:
+            success = self._push_with_retry(key, output_comm, response)
+        finally:
+            if success is not None:
+                self._job_done(key, response, success)
+
+    def _push_with_retry(self, key, output_comm, response):
+        """Push a response to a comm, retrying with exponential backoff
+
+        Returns:
+            bool | None: True if the push succeeded, None if it timed out and was abandoned
+        """
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                wait = self.backoff * 2 ** (attempt - 1)
+                log.warning(f"Retrying push to {output_comm} in {wait} sec")
+                time.sleep(wait)
+            success = self._push_with_timeout(key, output_comm, response)
+            if success is None or success:
+                return success
+        log.error(f"Giving up pushing to output_comm: {output_comm}")
+        return False
+
+    def _push_with_timeout(self, key, output_comm, response):
+        """Push on a separate thread so a hanging comm only costs `timeout` seconds
+
+        A push that times out is abandoned, not interrupted. It completes the job itself
+        once it finishes.
+
+        Returns:
+            bool | None: True if the push finished without raising, None if it timed out
+        """
+        state = {"success": None, "abandoned": False}
+        state_lock = threading.Lock()
+
+        def target():
+            success = False
+            try:
+                output_comm.push(response)
+                success = True
+            except Exception as e:
+                log.error(e)
+                log.error(traceback.format_exc())
+                log.error(f"Error pushing to output_comm: {output_comm}")
+            with state_lock:
+                state["success"] = success
+                abandoned = state["abandoned"]
+            if abandoned:
+                log.warning(f"Abandoned push to {output_comm} finished, success: {success}")
+                with self._lock:
+                    self._abandoned.discard(thread)
+                self._job_done(key, response, success)
+
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        thread.join(self.timeout)
+        with state_lock:
+            if state["success"] is not None:
+                return state["success"]
+            state["abandoned"] = True
+            with self._lock:
+                self._abandoned.add(thread)
+            # under state_lock, so the abandoned push cannot complete the response first
+            self._release_slot(key)
+        log.error(
+            f"Timed out after {self.timeout} sec pushing to: {output_comm}, "
+            "completing the response once the push finishes"
+        )
+        return None
+
+    def _release_slot(self, key):
+        """Stop counting a response towards max_queue_size, if it still does"""
+        with self._lock:
+            pending = self._pending[key]
+            held, pending[2] = pending[2], False
+        if held:
+            self._slots.release()
+
+    def _job_done(self, key, response, success):
+        with self._lock:
+            pending = self._pending[key]
+            pending[0] -= 1
+            pending[1] = pending[1] and success
+            if pending[0] > 0:
+                return
+            del self._pending[key]
+            held, pending[2] = pending[2], False
+            closed = self._closed
+        if held:
+            self._slots.release()
+        if closed:
+            log.warning(f"Push finished after close, success: {pending[1]}, not completing it")
+            return
+        if self.on_complete is not None:
+            try:
+                self.on_complete(response, pending[1])
+            except Exception:
+                log.error(traceback.format_exc())
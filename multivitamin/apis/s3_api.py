@@ -50,7 +50,10 @@ class S3API(CommAPI):
 
             if self.bin_encoding is True:
                 with open(outfn, "wb") as wf:
-                    wf.write(res.to_bytes())
+                    if res.request is not None and res.request.base64_encoding is True:
+                        wf.write(res.to_bytes())
+                    else:
+                        res.write_avro(wf)
             else:
                 with open(outfn, "w") as wf:
                     wf.write(json.dumps(res.to_dict(), indent=INDENTATION))
@@ -59,8 +62,8 @@ class S3API(CommAPI):
             assert(self.s3_key is not None)
             key_fullpath = os.path.join(self.s3_key, fn)
             log.info("Pushing {} to {}/{}".format(outfn, self.s3_bucket, key_fullpath))
-            with open(outfn, "rb") as data:
-                s3client.put_object(Bucket=self.s3_bucket, Key=key_fullpath, Body=data)
+            # upload_file switches to a multipart upload for large responses
+            s3client.upload_file(outfn, self.s3_bucket, key_fullpath)
 
             if os.path.exists(tmp_dir):
                 log.info("Removing temp dir {}".format(tmp_dir))
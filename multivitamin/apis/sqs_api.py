@@ -1,6 +1,9 @@
+import time
+import threading
+import traceback
+
 import glog as log
 import boto3
-import json
 
 from multivitamin.data import Request
 from multivitamin.apis.comm_api import CommAPI
@@ -10,14 +13,36 @@ boto3.client("iam")  # required to expose iam roles to boto3?
 
 
 class SQSAPI(CommAPI):
-    def __init__(self, queue_name):
-        """Class to pull messages from and push messages to SQS 
+    def __init__(
+        self,
+        queue_name,
+        sqs_client=None,
+        heartbeat=True,
+        visibility_timeout=config.SQS_VISIBILITY_TIMEOUT_SEC,
+        heartbeat_interval=config.SQS_HEARTBEAT_SEC,
+        delete_interval=config.SQS_DELETE_INTERVAL_SEC,
+    ):
+        """Class to pull messages from and push messages to SQS
+
+        Messages are received with a visibility timeout of visibility_timeout, rather than the
+        default of the queue, and tracked as in flight until they are acked or nacked. Acked
+        messages are deleted in batches, once config.SQS_MAX_BATCH of them are buffered,
+        delete_interval after the last delete, on each heartbeat, or on close. While heartbeat
+        is on, a background thread keeps extending the visibility timeout of in flight
+        messages, so long videos are not redelivered to another worker while they are still
+        being processed.
 
         Args:
             queue_name (str): SQS name in AI account
+            sqs_client (botocore.client.SQS): client to use, defaults to boto3.client("sqs")
+            heartbeat (bool): extend visibility of in flight messages in the background
+            visibility_timeout (int): seconds of visibility set on receipt and by each heartbeat
+            heartbeat_interval (float): seconds between heartbeats
+            delete_interval (float): max seconds acked messages are buffered while acks or
+                polls keep coming
         """
         assert(isinstance(queue_name, str))
-        self.sqs = boto3.client("sqs")
+        self.sqs = sqs_client if sqs_client is not None else boto3.client("sqs")
         log.info(f"Attempting to retrieve queue: {queue_name}")
         try:
             queue = self.sqs.get_queue_url(QueueName=queue_name)
@@ -30,36 +55,87 @@ class SQSAPI(CommAPI):
         self.queue_url = queue["QueueUrl"]
         log.info(f"Retrieved queue_url: {self.queue_url}")
 
+        self.visibility_timeout = visibility_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.delete_interval = delete_interval
+        self._lock = threading.Lock()
+        self._inflight = set()
+        self._to_delete = []
+        self._last_delete = time.monotonic()
+        self._stop_heartbeat = threading.Event()
+        self._heartbeat_thread = None
+        if heartbeat:
+            self._heartbeat_thread = threading.Thread(target=self._heartbeat, daemon=True)
+            self._heartbeat_thread.start()
+
     def pull(self, n=1):
         """Pull messages from SQS queue
 
+        Blocks until at least one message is available, then keeps receiving up to n messages
+        without waiting, in batches of up to config.SQS_MAX_BATCH.
+
         Args:
-            n (int): batch pulling. NOT IMPLEMENTED
-        
+            n (int): max number of messages to pull
+
         Returns:
             list[Request]: list of requests
         """
+        n = max(int(n), 1)
         log.info(f"Polling request from queue {self.queue_url}...")
-        response = self.sqs.receive_message(
-            QueueUrl=self.queue_url, WaitTimeSeconds=config.SQS_WAIT_TIME_SEC
-        )
-        while "Messages" not in response:
+        messages = self._receive(n, config.SQS_WAIT_TIME_SEC)
+        while not messages:
+            self._delete_acked_if_due()
             log.debug(f"Polling request from queue {self.queue_url}...")
-            response = self.sqs.receive_message(
-                QueueUrl=self.queue_url, WaitTimeSeconds=config.SQS_WAIT_TIME_SEC
-            )
-        log.debug(f"sqs.receive_message response: {response}")
+            messages = self._receive(n, config.SQS_WAIT_TIME_SEC)
+        while len(messages) < n:
+            batch = self._receive(n - len(messages), 0)
+            if not batch:
+                break
+            messages.extend(batch)
+
         requests = []
-        for m in response["Messages"]:
+        for m in messages:
             log.debug(str(m))
             requests.append(
                 Request(request_input=m["Body"], request_id=m["ReceiptHandle"])
             )
+        with self._lock:
+            self._inflight.update(m["ReceiptHandle"] for m in messages)
         return requests
 
     def push(self, request):
         raise NotImplementedError("Intentionally not implemented--we don't want to push resposnes to SQS")
 
+    def ack(self, requests):
+        """Mark requests as done. Their messages are deleted in batches
+
+        Args:
+            requests (list[Request]): processed requests
+        """
+        with self._lock:
+            for request in requests:
+                self._inflight.discard(request.request_id)
+                self._to_delete.append(request.request_id)
+        self._delete_acked_if_due()
+
+    def nack(self, requests):
+        """Stop extending the visibility of failed requests, so they are redelivered once
+        their visibility timeout expires
+
+        Args:
+            requests (list[Request]): failed requests
+        """
+        with self._lock:
+            for request in requests:
+                self._inflight.discard(request.request_id)
+
+    def close(self):
+        """Stop the heartbeat and delete acked messages"""
+        self._stop_heartbeat.set()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join()
+        self._delete_acked()
+
     def delete_message(self, request_id):
         """Delete a message from the SQS queue given a request_id
 
@@ -67,3 +143,66 @@ class SQSAPI(CommAPI):
             request_id: request_id from sqs.receive_message
         """
         self.sqs.delete_message(QueueUrl=self.queue_url, ReceiptHandle=request_id)
+
+    def _receive(self, n, wait_time_sec):
+        response = self.sqs.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(n, config.SQS_MAX_BATCH),
+            WaitTimeSeconds=wait_time_sec,
+            VisibilityTimeout=self.visibility_timeout,
+        )
+        log.debug(f"sqs.receive_message response: {response}")
+        return response.get("Messages", [])
+
+    def _delete_acked_if_due(self):
+        """Delete acked messages if a full batch is buffered, or delete_interval elapsed"""
+        with self._lock:
+            due = len(self._to_delete) >= config.SQS_MAX_BATCH or (
+                self._to_delete and time.monotonic() - self._last_delete >= self.delete_interval
+            )
+        if due:
+            self._delete_acked()
+
+    def _delete_acked(self):
+        """Delete acked messages with delete_message_batch"""
+        with self._lock:
+            receipt_handles = self._to_delete
+            self._to_delete = []
+            self._last_delete = time.monotonic()
+        for batch in _chunks(receipt_handles, config.SQS_MAX_BATCH):
+            entries = [{"Id": str(i), "ReceiptHandle": rh} for i, rh in enumerate(batch)]
+            try:
+                ret = self.sqs.delete_message_batch(QueueUrl=self.queue_url, Entries=entries)
+                for failed in ret.get("Failed", []):
+                    log.error(f"Failed to delete message: {failed}")
+            except Exception:
+                log.error(traceback.format_exc())
+                log.error("Error deleting messages")
+
+    def _heartbeat(self):
+        """Extend the visibility of in flight messages until close() is called"""
+        while not self._stop_heartbeat.wait(self.heartbeat_interval):
+            with self._lock:
+                receipt_handles = list(self._inflight)
+            for batch in _chunks(receipt_handles, config.SQS_MAX_BATCH):
+                entries = [
+                    {
+                        "Id": str(i),
+                        "ReceiptHandle": rh,
+                        "VisibilityTimeout": self.visibility_timeout,
+                    }
+                    for i, rh in enumerate(batch)
+                ]
+                try:
+                    self.sqs.change_message_visibility_batch(
+                        QueueUrl=self.queue_url, Entries=entries
+                    )
+                except Exception:
+                    log.error(traceback.format_exc())
+                    log.error("Error extending message visibility")
+            self._delete_acked()
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
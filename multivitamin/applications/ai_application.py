@@ -1,4 +1,3 @@
-import json
 from abc import (ABC, abstractmethod)
 
 import glog as log
@@ -26,7 +25,7 @@ class AiApplication(ABC):
             for module in self.get_modules():
                 log.debug(f"Processing request for module: {module}")
                 response = module.process(response)
-                log.debug(f"response.to_dict(): {json.dumps(response.to_dict(), indent=2)}")
+                log.debug("response.to_dict(): %s", response)
 
             if req.bin_encoding:
                 return response.to_bytes()
@@ -7,11 +7,13 @@ import importlib
 import numbers
 
 from multivitamin.module import ImagesModule
+from multivitamin.module.imagesmodule import BATCH_SIZE
 from multivitamin.data.response.utils import (
     p0p1_from_bbox_contour,
     crop_image_from_bbox_contour,
 )
 from multivitamin.module.utils import min_conf_filter_predictions
+from multivitamin.applications.utils import preprocess_batch_skipping_errors
 from multivitamin.data.response.dtypes import Region, Property
 
 glog_level = os.environ.get("GLOG_minloglevel", None)
@@ -65,6 +67,9 @@ class CaffeClassifier(ImagesModule):
         postprocess_predictions=None,
         postprocess_args=None,
         gpuid=0,
+        batch_size=BATCH_SIZE,
+        batch_crops=False,
+        resize_at_decode=False,
     ):
 
         super().__init__(
@@ -73,6 +78,8 @@ class CaffeClassifier(ImagesModule):
             prop_type=prop_type,
             prop_id_map=prop_id_map,
             module_id_map=module_id_map,
+            batch_size=batch_size,
+            resize_at_decode=resize_at_decode,
         )
 
         self.confidence_min = confidence_min
@@ -89,8 +96,8 @@ class CaffeClassifier(ImagesModule):
             self.prop_type = "label"
 
         log.info("Constructing CaffeClassifier")
-        caffe.set_mode_gpu()
-        caffe.set_device(gpuid)
+        self.gpuid = gpuid
+        self.init_thread()
 
         labels_file = os.path.join(net_data_dir, "labels.txt")
         try:
@@ -102,6 +109,9 @@ class CaffeClassifier(ImagesModule):
             raise ValueError(err)
 
         self.labels = {idx: label for idx, label in enumerate(self.labels)}
+        self.excluded_indexes = np.array(
+            [idx for idx, label in self.labels.items() if label in LOGOEXCLUDE], dtype=int
+        )
         # Set min conf for all labels to 0, but exclude logos in LOGOEXCLDUE
         self.min_conf_filter = {}
         for idx, label in self.labels.items():
@@ -126,79 +136,135 @@ class CaffeClassifier(ImagesModule):
             meanfile = np.squeeze(np.array(caffe.io.blobproto_to_array(blob_meanfile)))
             self.transformer.set_mean("data", meanfile)
         self.transformer.set_transpose("data", (2, 0, 1))
+        self.input_size = tuple(self.net.blobs["data"].data.shape[2:])
+        if batch_crops:
+            # Crop prev regions straight to the input size of the net, as they are batched
+            self.crop_size = self.input_size
+
+    def init_thread(self):
+        """Set the mode and device of Caffe, which are kept per thread, for the calling thread
+        """
+        if self.gpuid is None:
+            caffe.set_mode_cpu()
+        else:
+            caffe.set_mode_gpu()
+            caffe.set_device(self.gpuid)
 
     def process_images(self, images, tstamps, prev_regions):
-        # log.debug("Processing images")
-        # log.debug("tstamps: "  + str(tstamps))
+        """Classify a batch of frames, or crops of prev_regions, with a single forward pass
+
+        Args:
+            images (list[np.array] | np.array): frames, or crops of prev_regions already
+                batched by ImagesModule when crop_size is set
+            tstamps (list[float]): timestamps of the frames
+            prev_regions (list[Region]): regions to crop from the frames, or None
+        """
         assert len(images) == len(tstamps) == len(prev_regions)
-        for i, (frame, tstamp, prev_region) in enumerate(
-            zip(images, tstamps, prev_regions)
-        ):
-            log.debug("caffe classifier tstamp: " + str(tstamp))
-            try:
+        log.debug("caffe classifier tstamps: " + str(tstamps))
+        if isinstance(images, np.ndarray):
+            frames = images
+            items = list(zip(tstamps, prev_regions))
+        else:
+            frames, items = self._crop_prev_regions(images, tstamps, prev_regions)
+        if len(frames) == 0:
+            return
+
+        batch, kept = preprocess_batch_skipping_errors(self.transformer, frames)
+        if batch is None:
+            return
+        items = [items[idx] for idx in kept]
+        try:
+            probs = self._forward(batch)
+            indexes, confidences, valid = self._top_n(probs)
+        except Exception as e:
+            log.error(traceback.print_exc())
+            log.error(e)
+            return
+
+        unknown = confidences < self.confidence_min
+        for row, (tstamp, prev_region) in enumerate(items):
+            props = []
+            for col in np.flatnonzero(valid[row]):
+                # TODO remove this unknown
+                label = "Unknown" if unknown[row, col] else self.labels[indexes[row, col]]
+                prop = Property(
+                    server=self.name,
+                    ver=self.version,
+                    value=label,
+                    property_type=self.prop_type,
+                    confidence=float(confidences[row, col]),
+                    confidence_min=float(self.confidence_min),
+                )
                 if prev_region is not None:
+                    prev_region.get("props").append(prop)
+                else:
+                    props.append(prop)
+            if prev_region is None:
+                self.response.append_region(t=tstamp, region=Region(props=props))
+
+    def _crop_prev_regions(self, images, tstamps, prev_regions):
+        """Crop prev_regions from their frames, skipping empty crops and malformed regions
+
+        Returns:
+            list[np.array]: frames or crops
+            list[tuple]: (tstamp, prev_region) of each returned frame
+        """
+        frames = []
+        items = []
+        for frame, tstamp, prev_region in zip(images, tstamps, prev_regions):
+            if prev_region is not None:
+                try:
                     frame = crop_image_from_bbox_contour(frame, prev_region.get("contour"))
+                except Exception:
+                    log.error(traceback.format_exc())
+                    log.error(f"Error cropping region at tstamp: {tstamp}, skipping")
+                    continue
+            if frame is None or frame.size == 0:
+                log.warning(f"Empty image at tstamp: {tstamp}, skipping")
+                continue
+            frames.append(frame)
+            items.append((tstamp, prev_region))
+        return frames, items
+
+    def _forward(self, batch):
+        """Run a single forward pass over a batch of frames
+
+        Args:
+            batch (np.array): NxCxHxW frames, preprocessed with the transformer
+
+        Returns:
+            np.array: probabilities, of shape (N, len(self.labels))
+        """
+        data = self.net.blobs["data"]
+        if data.data.shape[0] != len(batch):
+            data.reshape(len(batch), *data.data.shape[1:])
+        data.data[...] = batch
+        probs = self.net.forward()[self.layer_name]
+        target_shape = (len(batch), len(self.labels))
+        if probs.shape != target_shape:
+            log.debug("Changing shape " + str(probs.shape) + "->" + str(target_shape))
+            probs = np.reshape(probs, target_shape)
+        return probs
+
+    def _top_n(self, probs):
+        """Select the top_n labels of each row of probabilities
+
+        Leading labels in LOGOEXCLUDE are skipped, as long as at least one label remains
+
+        Args:
+            probs (np.array): probabilities, one row per frame
 
-                im = self.transformer.preprocess("data", frame)
-                self.net.blobs["data"].data[...] = im
-
-                # TODO : clean this up
-                probs = self.net.forward()[self.layer_name]
-                # log.debug("probs: " + str(probs))
-                # log.debug("probs.shape: " + str(probs.shape))
-                target_shape = (1, len(self.labels))
-                if (probs.shape == target_shape) is False:
-                    log.debug(
-                        "Changing shape " + str(probs.shape) + "->" + str(target_shape)
-                    )
-                    probs = np.reshape(probs, target_shape)
-
-                props = []
-                for p in probs:
-                    # log.debug('p: ' + str(p))
-                    p_indexes = np.argsort(p)
-                    p_indexes = np.flip(p_indexes, 0)
-                    while True:
-                        if len(p_indexes) == 1:
-                            break
-                        index = p_indexes[0]
-                        label = self.labels[index]
-                        log.debug("label: " + str(label))
-                        if label in LOGOEXCLUDE:
-                            p_indexes = np.delete(p_indexes, 0)
-                        else:
-                            break
-                    p_indexes = p_indexes[:self.top_n]
-
-                    # log.debug("p_indexes: " + str(p_indexes))
-
-                    for i, property_id in enumerate(p_indexes):
-                        if i == self.top_n:
-                            break
-                        index = p_indexes[i]
-                        label = self.labels[index]
-                        confidence = p[index]
-
-                        # TODO remove this unknown
-
-                        if confidence < self.confidence_min:
-                            label = "Unknown"
-                        prop = Property(
-                            server=self.name,
-                            ver=self.version,
-                            value=label,
-                            property_type=self.prop_type,
-                            confidence=float(confidence),
-                            confidence_min=float(self.confidence_min),
-                        )
-                        if prev_region is not None:
-                            prev_region.get("props").append(prop)
-                        else:
-                            props.append(prop)
-                if prev_region is None:
-                    self.response.append_region(
-                        t=tstamp, region=Region(props=props)
-                    )
-            except Exception as e:
-                log.error(traceback.print_exc())
-                log.error(e)
+        Returns:
+            np.array: label indexes, of shape (len(probs), top_n)
+            np.array: confidences of those labels
+            np.array: bool mask of the valid entries, rows may have less than top_n labels
+        """
+        n_labels = probs.shape[1]
+        order = np.flip(np.argsort(probs, axis=1), 1)
+        excluded = np.isin(order, self.excluded_indexes)
+        skip = np.minimum(np.cumprod(excluded, axis=1).sum(axis=1), n_labels - 1)
+        cols = skip[:, np.newaxis] + np.arange(self.top_n)[np.newaxis, :]
+        valid = cols < n_labels
+        rows = np.arange(len(probs))[:, np.newaxis]
+        indexes = order[rows, np.minimum(cols, n_labels - 1)]
+        return indexes, probs[rows, indexes], valid
@@ -39,20 +39,21 @@ else:
          set enviroment variable SSD_CAFFE_PYTHON."
     )
 
-from google.protobuf import text_format
-from caffe.proto import caffe_pb2 as cpb2
-
 from multivitamin.module import ImagesModule
+from multivitamin.module.imagesmodule import BATCH_SIZE
 from multivitamin.data.response.utils import (
     crop_image_from_bbox_contour,
-    compute_box_area
 )
 from multivitamin.data.response.dtypes import (
     create_bbox_contour_from_points,
     Region,
     Property,
 )
-from multivitamin.applications.utils import load_idmap, load_label_prototxt
+from multivitamin.applications.utils import (
+    load_idmap,
+    load_label_prototxt,
+    preprocess_batch_skipping_errors,
+)
 
 LAYER_NAME = "detection_out"
 
@@ -68,6 +69,8 @@ class SSDDetector(ImagesModule):
         prop_id_map=None,
         module_id_map=None,
         gpuid=0,
+        batch_size=BATCH_SIZE,
+        resize_at_decode=False,
     ):
         super().__init__(
             server_name,
@@ -75,13 +78,15 @@ class SSDDetector(ImagesModule):
             prop_type=prop_type,
             prop_id_map=prop_id_map,
             module_id_map=module_id_map,
+            batch_size=batch_size,
+            resize_at_decode=resize_at_decode,
         )
         self.confidence_min = confidence_min
         if not self.prop_type:
             self.prop_type = "object"
 
-        caffe.set_mode_gpu()
-        caffe.set_device(gpuid)
+        self.gpuid = gpuid
+        self.init_thread()
 
         idmap_file = os.path.join(net_data_dir, "labelmap.prototxt")
         self.labelmap = load_label_prototxt(idmap_file)
@@ -105,40 +110,92 @@ class SSDDetector(ImagesModule):
             meanfile = np.squeeze(np.array(caffe.io.blobproto_to_array(blob_meanfile)))
             self.transformer.set_mean("data", meanfile)
         self.transformer.set_transpose("data", (2, 0, 1))
+        self.input_size = tuple(self.net.blobs["data"].data.shape[2:])
 
-    def process_images(self, images, tstamps, prev_detections=None):
-        for frame, tstamp in zip(images, tstamps):
-            im = self.transformer.preprocess("data", frame)
-            self.net.blobs["data"].data[...] = im
-            predictions = self.net.forward()[LAYER_NAME]
+    def init_thread(self):
+        """Set the mode and device of Caffe, which are kept per thread, for the calling thread
+        """
+        if self.gpuid is None:
+            caffe.set_mode_cpu()
+        else:
+            caffe.set_mode_gpu()
+            caffe.set_device(self.gpuid)
 
-            for pred_idx in range(predictions.shape[2]):
+    def process_images(self, images, tstamps, prev_detections=None):
+        """Detect objects in a batch of frames with a single forward pass
+
+        Args:
+            images (list[np.array]): frames
+            tstamps (list[float]): timestamps of the frames
+            prev_detections: unused
+        """
+        batch, kept = preprocess_batch_skipping_errors(self.transformer, list(images))
+        if batch is None:
+            return
+        tstamps = [tstamps[idx] for idx in kept]
+        data = self.net.blobs["data"]
+        if data.data.shape[0] != len(batch):
+            data.reshape(len(batch), *data.data.shape[1:])
+        data.data[...] = batch
+        predictions = self.net.forward()[LAYER_NAME]
+
+        image_ids, labels, confidences, boxes, areas = self._decode(predictions)
+        for image_id, tstamp in enumerate(tstamps):
+            for row in np.flatnonzero(image_ids == image_id):
                 try:
-                    confidence = float(predictions[0, 0, pred_idx, 2])
-                    if confidence < self.confidence_min:
-                        continue
-                    index = int(predictions[0, 0, pred_idx, 1])
-                    label = self.labelmap[index]
-                    xmin = float(predictions[0, 0, pred_idx, 3])
-                    ymin = float(predictions[0, 0, pred_idx, 4])
-                    xmax = float(predictions[0, 0, pred_idx, 5])
-                    ymax = float(predictions[0, 0, pred_idx, 6])
-
-                    contour = create_bbox_contour_from_points(
-                        xmin, ymin, xmax, ymax, bound=True
-                    )
-                    area = compute_box_area(contour)
+                    xmin, ymin, xmax, ymax = boxes[row]
+                    contour = create_bbox_contour_from_points(xmin, ymin, xmax, ymax)
                     prop = Property(
-                            confidence=confidence,
+                            confidence=confidences[row],
                             confidence_min=self.confidence_min,
                             ver=self.version,
                             server=self.name,
-                            value=label,
+                            value=labels[row],
                             property_type=self.prop_type,
-                            fraction=area,
+                            fraction=areas[row],
                         )
                     self.response.append_region(
                         t=tstamp, region=Region(contour=contour, props=[prop])
                     )
                 except Exception:
                     log.error(traceback.format_exc())
+
+    def _decode(self, predictions):
+        """Filter and decode the rows of a detection_out blob
+
+        Each row is [image_id, label, confidence, xmin, ymin, xmax, ymax]. Rows below
+        confidence_min or with an unknown label are dropped, boxes are clipped to [0, 1].
+
+        Args:
+            predictions (np.array): detection_out blob, of shape (1, 1, N, 7)
+
+        Returns:
+            np.array: image index in the batch of each detection
+            list[str]: labels
+            list[float]: confidences
+            list[list[float]]: boxes as xmin, ymin, xmax, ymax
+            list[float]: box areas
+        """
+        detections = predictions.reshape(-1, 7)
+        detections = detections[
+            (detections[:, 0] >= 0) & (detections[:, 2] >= self.confidence_min)
+        ]
+        label_indexes = detections[:, 1].astype(int)
+        known = np.isin(label_indexes, list(self.labelmap.keys()))
+        if not np.all(known):
+            log.error(f"Unknown label indexes: {set(label_indexes[~known].tolist())}")
+            detections = detections[known]
+            label_indexes = label_indexes[known]
+
+        boxes = detections[:, 3:7].copy()
+        boxes[:, 0:2] = np.maximum(boxes[:, 0:2], 0.0)
+        boxes[:, 2:4] = np.minimum(boxes[:, 2:4], 1.0)
+        areas = np.abs(boxes[:, 2] - boxes[:, 0]) * np.abs(boxes[:, 3] - boxes[:, 1])
+        labels = [self.labelmap[index] for index in label_indexes.tolist()]
+        return (
+            detections[:, 0].astype(int),
+            labels,
+            detections[:, 2].tolist(),
+            boxes.tolist(),
+            areas.tolist(),
+        )
@@ -26,10 +26,9 @@ else:
         "Install tensorflowgpu 1.9.0"
     )
 
-from google.protobuf import text_format
-
 from multivitamin.utils.GPUUtilities import GPUUtility
 from multivitamin.module import ImagesModule
+from multivitamin.module.imagesmodule import BATCH_SIZE
 from multivitamin.data.response.utils import (
     crop_image_from_bbox_contour,
     compute_box_area
@@ -54,6 +53,10 @@ class TFDetector(ImagesModule):
         prop_type=None,
         prop_id_map=None,
         module_id_map=None,
+        batch_size=BATCH_SIZE,
+        input_size=None,
+        resize_at_decode=False,
+        gpuid=None,
         **gpukwargs
     ):
         super().__init__(
@@ -61,19 +64,30 @@ class TFDetector(ImagesModule):
             version, 
             prop_type=prop_type,
             prop_id_map=prop_id_map,
-            module_id_map=module_id_map
+            module_id_map=module_id_map,
+            batch_size=batch_size,
+            resize_at_decode=resize_at_decode
         )
         self.server_name = server_name
         self.version = version
+        # The graph takes frames of any size and resizes them itself, input_size is the size
+        # its resizer expects, if known
+        self.input_size = input_size
 
         if not self.prop_type:
             self.prop_type="object" 
-        gpu_util = GPUUtility(**gpukwargs)
-        available_devices = gpu_util.get_gpus()
-        log.info("Found GPU devices: {}".format(available_devices))
-        if available_devices:
-            os.environ["CUDA_DEVICE_ORDER"]="PCI_BUS_ID"
-            os.environ["CUDA_VISIBLE_DEVICES"]= ",".join([str(gpu) for gpu in available_devices])
+        if gpuid is None:
+            gpu_util = GPUUtility(**gpukwargs)
+            available_devices = gpu_util.get_gpus()
+            log.info("Found GPU devices: {}".format(available_devices))
+            if available_devices:
+                os.environ["CUDA_DEVICE_ORDER"]="PCI_BUS_ID"
+                os.environ["CUDA_VISIBLE_DEVICES"]= ",".join([str(gpu) for gpu in available_devices])
+            device = None
+        else:
+            # Pin the graph to one GPU, leaving every GPU visible to the other replicas
+            # of a DataParallelImagesModule
+            device = "/device:GPU:{}".format(gpuid)
         self.label_map = dict()
         labelmap_file = os.path.join(net_data_dir, 'idmap.txt')
         try:
@@ -90,7 +104,7 @@ class TFDetector(ImagesModule):
 
         model = os.path.join(net_data_dir,'frozen_inference_graph.pb')
         detection_graph = tf.Graph()
-        with detection_graph.as_default():
+        with detection_graph.as_default(), tf.device(device):
             od_graph_def = tf.GraphDef()
             with tf.gfile.GFile(model, 'rb') as fid:
                 serialized_graph = fid.read()
@@ -99,38 +113,52 @@ class TFDetector(ImagesModule):
         self._detection_graph = detection_graph
         cfg = tf.ConfigProto()
         cfg.gpu_options.allow_growth = True
+        cfg.allow_soft_placement = device is not None
         self._sess =  tf.Session(graph=detection_graph, config=cfg)
-        
+        self._image_tensor = detection_graph.get_tensor_by_name('image_tensor:0')
+        self._detection_boxes = detection_graph.get_tensor_by_name('detection_boxes:0')
+        self._detection_scores = detection_graph.get_tensor_by_name('detection_scores:0')
+        self._detection_classes = detection_graph.get_tensor_by_name('detection_classes:0')
+        self._num_detections = detection_graph.get_tensor_by_name('num_detections:0')
 
     def process_images(self, images, tstamps, detections_of_interest=None):
-        image_tensor = self._detection_graph.get_tensor_by_name('image_tensor:0')
-        detection_boxes = self._detection_graph.get_tensor_by_name('detection_boxes:0')
-        detection_scores = self._detection_graph.get_tensor_by_name('detection_scores:0')
-        detection_classes = self._detection_graph.get_tensor_by_name('detection_classes:0')
-        num_pred_detections = self._detection_graph.get_tensor_by_name('num_detections:0')
-
-        for frame, tstamp in zip(images, tstamps):
-            frame_np = np.array(frame)
-            frame_np = frame_np[...,::-1]
-            frame_np_expanded = np.expand_dims(frame_np, axis=0)
-            (detections, scores, classes, num) = self._sess.run([detection_boxes, detection_scores, detection_classes, num_pred_detections], feed_dict={image_tensor: frame_np_expanded})
-            num = int(num[0])
-            for det_idx in range(num):
+        """Detect objects in a batch of frames with a single session run per frame shape
+
+        Args:
+            images (list[np.array]): BGR frames
+            tstamps (list[float]): timestamps of the frames
+            detections_of_interest: unused
+        """
+        for indexes, batch in self._stack_frames(images):
+            self._detect(batch, [tstamps[idx] for idx in indexes])
+
+    def _detect(self, batch, tstamps):
+        """Detect objects in a batch of frames of the same shape with a single session run
+
+        Args:
+            batch (np.array): NxHxWx3 RGB frames
+            tstamps (list[float]): timestamps of the N frames
+        """
+        (detections, scores, classes, num) = self._sess.run(
+            [self._detection_boxes, self._detection_scores, self._detection_classes, self._num_detections],
+            feed_dict={self._image_tensor: batch},
+        )
+        keep = (scores >= CONFIDENCE_MIN) & (
+            np.arange(scores.shape[1])[np.newaxis, :] < num[:, np.newaxis]
+        )
+        # detection_boxes are ymin, xmin, ymax, xmax
+        boxes = detections[..., [1, 0, 3, 2]]
+        for image_idx, tstamp in enumerate(tstamps):
+            for det_idx in np.flatnonzero(keep[image_idx]):
                 try:
-                    confidence = float(scores[0,det_idx])
-                    if confidence < CONFIDENCE_MIN:
-                        continue
-                    xmin = float(detections[0,det_idx,1])
-                    ymin = float(detections[0,det_idx,0])
-                    xmax = float(detections[0,det_idx,3])
-                    ymax = float(detections[0,det_idx,2])
+                    xmin, ymin, xmax, ymax = boxes[image_idx, det_idx].tolist()
                     contour = [Point(xmin, ymin), Point(xmax, ymin), Point(xmax, ymax), Point(xmin, ymax)]
                     prop = Property(
                            property_type=self.prop_type,
                            server=self.server_name,
                            ver=self.version,
-                           value = str(self.label_map[str(int(classes[0,det_idx]))]),
-                           confidence=confidence,
+                           value = str(self.label_map[str(int(classes[image_idx, det_idx]))]),
+                           confidence=float(scores[image_idx, det_idx]),
                            confidence_min=CONFIDENCE_MIN
                            )
                     region = Region(contour, [prop])
@@ -138,3 +166,25 @@ class TFDetector(ImagesModule):
 
                 except Exception as e:
                     log.error(traceback.format_exc())
+
+    @staticmethod
+    def _stack_frames(images):
+        """Stack BGR frames into RGB batches, one per frame shape
+
+        Frames are not resized, so the normalized boxes of the detector apply to each frame
+        as is. Frames of a video share their shape, so they make a single batch.
+
+        Args:
+            images (list[np.array]): BGR frames
+
+        Returns:
+            list[tuple]: (indexes of the frames in images, NxHxWx3 RGB batch of those frames),
+                in order of first appearance of each shape
+        """
+        indexes_by_shape = {}
+        for idx, frame in enumerate(images):
+            indexes_by_shape.setdefault(np.shape(frame)[:2], []).append(idx)
+        return [
+            (indexes, np.stack([np.asarray(images[idx])[..., ::-1] for idx in indexes]))
+            for indexes in indexes_by_shape.values()
+        ]
@@ -62,7 +62,8 @@ class FrameDrawer(PropertiesModule):
         if isinstance(response, Response):
             self.response = response
         elif isinstance(response, dict):
-            self.response = Response(response)
+            # a dict written by Response.to_dict, e.g. by LocalAPI or S3API, not revalidated
+            self.response = Response(response, trusted=True)
         else:
             log.debug("No response")
 
@@ -139,8 +140,8 @@ class FrameDrawer(PropertiesModule):
         thickness = 2
 
         # we get the image_annotation tstamps
-        tstamps = self.response.get_timestamps()
-        tstamp_frame_anns = self.response.get_timestamps_from_frames_ann()
+        tstamps = set(self.response.get_timestamps())
+        tstamp_frame_anns = set(self.response.get_timestamps_from_frames_ann())
         log.debug('tstamps: ' + str(tstamps))
         log.debug('tstamps_dets: ' + str(tstamp_frame_anns))
         
@@ -1,4 +1,7 @@
 import os
+import traceback
+
+import glog as log
 
 
 def load_idmap(idmap_file):
@@ -35,3 +38,95 @@ def load_label_prototxt(prototxt_file):
             label = item.display_name
             labelmap[index] = label
     return labelmap
+
+
+def preprocess_batch(transformer, images, in_="data"):
+    """Batched equivalent of caffe.io.Transformer.preprocess
+
+    Images are resized one by one into a single float32 array, then transposition,
+    channel swap, scaling and mean subtraction are applied once to the whole batch.
+    An NxHxWxC array already at the input size is converted in one go.
+
+    Args:
+        transformer (caffe.io.Transformer): configured transformer
+        images (list[np.array] | np.array): HxWxC images, of any size, or an NxHxWxC array
+        in_ (str): name of the input blob
+
+    Returns:
+        np.array: NxCxHxW batch, ready to be copied into the input blob
+    """
+    import numpy as np
+    from caffe.io import resize_image
+
+    in_dims = tuple(transformer.inputs[in_][2:])
+    if isinstance(images, np.ndarray) and images.ndim == 4 and images.shape[1:3] == in_dims:
+        # Already a contiguous batch at the input size, e.g. region crops
+        batch = images.astype(np.float32)
+    else:
+        n_channels = images[0].shape[2] if images[0].ndim == 3 else 1
+        batch = np.empty((len(images),) + in_dims + (n_channels,), dtype=np.float32)
+        for i, image in enumerate(images):
+            image = image.astype(np.float32, copy=False)
+            if image.shape[:2] != in_dims:
+                image = resize_image(image, in_dims)
+            batch[i] = image.reshape(in_dims + (n_channels,))
+
+    transpose = transformer.transpose.get(in_)
+    channel_swap = transformer.channel_swap.get(in_)
+    raw_scale = transformer.raw_scale.get(in_)
+    mean = transformer.mean.get(in_)
+    input_scale = transformer.input_scale.get(in_)
+    if transpose is not None:
+        batch = batch.transpose((0,) + tuple(axis + 1 for axis in transpose))
+    if channel_swap is not None:
+        batch = batch[:, channel_swap, :, :]
+    if raw_scale is not None:
+        batch *= raw_scale
+    if mean is not None:
+        batch -= mean
+    if input_scale is not None:
+        batch *= input_scale
+    return batch
+
+
+def preprocess_batch_skipping_errors(transformer, images, in_="data"):
+    """preprocess_batch, skipping the images that fail to be preprocessed
+
+    The batch is preprocessed at once, and image by image only if that fails, so a malformed
+    image does not drop the whole batch. Images that do not preprocess to the shape of the
+    input blob, e.g. with another number of channels, are skipped too
+
+    Args:
+        transformer (caffe.io.Transformer): configured transformer
+        images (list[np.array] | np.array): HxWxC images, of any size, or an NxHxWxC array
+        in_ (str): name of the input blob
+
+    Returns:
+        np.array: NxCxHxW batch of the images preprocessed successfully, or None if none was
+        list[int]: indexes in images of the N preprocessed images
+    """
+    import numpy as np
+
+    try:
+        return preprocess_batch(transformer, images, in_), list(range(len(images)))
+    except Exception:
+        log.error(traceback.format_exc())
+        log.error("Error preprocessing batch, preprocessing images one by one")
+
+    input_shape = tuple(transformer.inputs[in_][1:])
+    preprocessed = []
+    indexes = []
+    for idx, image in enumerate(images):
+        try:
+            image = preprocess_batch(transformer, [image], in_)[0]
+            if image.shape != input_shape:
+                # e.g. a grayscale frame in a batch of color frames
+                raise ValueError(f"Preprocessed shape {image.shape} != {input_shape}")
+            preprocessed.append(image)
+            indexes.append(idx)
+        except Exception:
+            log.error(traceback.format_exc())
+            log.error(f"Error preprocessing image {idx} of batch, skipping")
+    if not preprocessed:
+        return None, indexes
+    return np.stack(preprocessed), indexes
@@ -0,0 +1,261 @@
+from dataclasses import asdict, fields, replace
+from operator import attrgetter
+
+import numpy as np
+
+from multivitamin.data.response.dtypes import Point, Property, Region
+
+INITIAL_CAPACITY = 1024
+INT64_MAX = 2 ** 63 - 1
+
+_TEMPLATE_FIELDS = tuple(
+    f.name for f in fields(Property) if f.name not in ("confidence", "relationships")
+)
+_get_template_fields = attrgetter(*_TEMPLATE_FIELDS)
+
+
+class RegionStore():
+    """Columnar store for frame annotation regions
+
+    Holds the common output of detectors, regions with a bounding box contour and a single
+    property, as NumPy columns instead of Region/Point/Property objects:
+
+        frame_idx (int64): index of the ImageAnn of the region in frames_annotation
+        bbox (float64, Nx4): xmin, ymin, xmax, ymax
+        confidence (float64): confidence of the property
+        prop_idx (int32): index of the property, without its confidence, in the interned props
+        region_id (int64): numeric region id
+
+    Regions that do not fit are rejected by append, so the caller can keep them as objects.
+    """
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self._size = 0
+        self._frame_idx = np.empty(capacity, dtype=np.int64)
+        self._bbox = np.empty((capacity, 4), dtype=np.float64)
+        self._confidence = np.empty(capacity, dtype=np.float64)
+        self._prop_idx = np.empty(capacity, dtype=np.int32)
+        self._region_id = np.empty(capacity, dtype=np.int64)
+        self._props = []
+        self._prop_dicts = []
+        self._prop_keys = {}
+        self._pending_frames = set()
+
+    def __len__(self):
+        return self._size
+
+    def has_pending(self, frame_idx):
+        """Check if regions of a frame are held by the store
+
+        Args:
+            frame_idx (int): index of the ImageAnn in frames_annotation
+
+        Returns:
+            bool: True if at least one region of the frame is in the store
+        """
+        return frame_idx in self._pending_frames
+
+    def append(self, frame_idx, region):
+        """Append a region, if it fits in the store
+
+        Args:
+            frame_idx (int): index of the ImageAnn of the region in frames_annotation
+            region (Region): region
+
+        Returns:
+            bool: False if the region was not stored
+        """
+        bbox = _bbox_from_contour(region.contour)
+        if bbox is None or region.father_id or region.features or len(region.props) != 1:
+            return False
+        region_id = _int_from_region_id(region.id)
+        prop = region.props[0]
+        if region_id is None or not isinstance(prop, Property):
+            return False
+        if not isinstance(prop.confidence, float):
+            return False
+        try:
+            prop_idx = self._intern(prop)
+        except TypeError:  # unhashable field value
+            return False
+
+        if self._size == len(self._frame_idx):
+            self._grow()
+        i = self._size
+        self._frame_idx[i] = frame_idx
+        self._bbox[i] = bbox
+        self._confidence[i] = prop.confidence
+        self._prop_idx[i] = prop_idx
+        self._region_id[i] = region_id
+        self._size += 1
+        self._pending_frames.add(frame_idx)
+        return True
+
+    def map_props(self, func):
+        """Apply func to the interned properties, in place
+
+        Every region sharing an interned property sees the change, like applying func to the
+        property of each region. Confidences are kept per region.
+
+        Args:
+            func (callable): func(prop), modifies a Property in place
+        """
+        for prop in self._props:
+            func(prop)
+        self._prop_dicts = [None] * len(self._props)
+        self._prop_keys = {}
+        for prop_idx, prop in enumerate(self._props):
+            self._prop_keys.setdefault(_template_key(prop), prop_idx)
+
+    def to_regions(self):
+        """Materialize the stored regions as objects
+
+        Yields:
+            tuple: frame_idx (int), Region, in order of insertion
+        """
+        for frame_idx, bbox, confidence, prop_idx, region_id in self._rows():
+            xmin, ymin, xmax, ymax = bbox
+            template = self._props[prop_idx]
+            yield frame_idx, Region(
+                contour=[
+                    Point(xmin, ymin), Point(xmax, ymin), Point(xmax, ymax), Point(xmin, ymax)
+                ],
+                props=[
+                    replace(
+                        template,
+                        confidence=confidence,
+                        relationships=list(template.relationships),
+                    )
+                ],
+                id=str(region_id),
+            )
+
+    def to_dicts(self):
+        """Materialize the stored regions as plain dicts, like asdict(Region)
+
+        Yields:
+            tuple: frame_idx (int), dict, in order of insertion
+        """
+        for frame_idx, bbox, confidence, prop_idx, region_id in self._rows():
+            yield frame_idx, self._row_dict(bbox, confidence, prop_idx, region_id)
+
+    def to_dicts_by_frame(self):
+        """Materialize the stored regions as plain dicts, grouped by frame
+
+        Yields:
+            tuple: frame_idx (int), list[dict], in increasing frame_idx, with the regions of a
+                frame in order of insertion
+        """
+        frame_idx = None
+        regions = []
+        for row in self._rows(order=np.argsort(self._frame_idx[:self._size], kind="stable")):
+            if row[0] != frame_idx and regions:
+                yield frame_idx, regions
+                regions = []
+            frame_idx = row[0]
+            regions.append(self._row_dict(*row[1:]))
+        if regions:
+            yield frame_idx, regions
+
+    def clear(self):
+        """Remove all regions, keep the interned properties"""
+        self._size = 0
+        self._pending_frames = set()
+
+    def _rows(self, order=None):
+        n = self._size
+        columns = (
+            self._frame_idx[:n],
+            self._bbox[:n],
+            self._confidence[:n],
+            self._prop_idx[:n],
+            self._region_id[:n],
+        )
+        if order is not None:
+            columns = (column[order] for column in columns)
+        return zip(*(column.tolist() for column in columns))
+
+    def _row_dict(self, bbox, confidence, prop_idx, region_id):
+        xmin, ymin, xmax, ymax = bbox
+        prop = dict(self._prop_dict(prop_idx))
+        prop["relationships"] = list(prop["relationships"])
+        prop["confidence"] = confidence
+        return {
+            "contour": [
+                {"x": xmin, "y": ymin},
+                {"x": xmax, "y": ymin},
+                {"x": xmax, "y": ymax},
+                {"x": xmin, "y": ymax},
+            ],
+            "props": [prop],
+            "father_id": "",
+            "features": "",
+            "id": str(region_id),
+        }
+
+    def _intern(self, prop):
+        key = _template_key(prop)
+        prop_idx = self._prop_keys.get(key)
+        if prop_idx is None:
+            prop_idx = len(self._props)
+            self._props.append(
+                replace(prop, confidence=0.0, relationships=list(prop.relationships))
+            )
+            self._prop_dicts.append(None)
+            self._prop_keys[key] = prop_idx
+        return prop_idx
+
+    def _prop_dict(self, prop_idx):
+        if self._prop_dicts[prop_idx] is None:
+            self._prop_dicts[prop_idx] = asdict(self._props[prop_idx])
+        return self._prop_dicts[prop_idx]
+
+    def _grow(self):
+        capacity = 2 * len(self._frame_idx)
+        self._frame_idx = _resized(self._frame_idx, capacity)
+        self._bbox = _resized(self._bbox, capacity)
+        self._confidence = _resized(self._confidence, capacity)
+        self._prop_idx = _resized(self._prop_idx, capacity)
+        self._region_id = _resized(self._region_id, capacity)
+
+
+def _resized(array, capacity):
+    resized = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+    resized[:len(array)] = array
+    return resized
+
+
+def _template_key(prop):
+    return _get_template_fields(prop), tuple(prop.relationships)
+
+
+def _bbox_from_contour(contour):
+    """Get xmin, ymin, xmax, ymax of a contour made by create_bbox_contour_from_points
+
+    Returns:
+        tuple: xmin, ymin, xmax, ymax, or None for any other contour
+    """
+    if len(contour) != 4:
+        return None
+    if not all(isinstance(p, Point) and isinstance(p.x, float) and isinstance(p.y, float)
+               for p in contour):
+        return None
+    p0, p1, p2, p3 = contour
+    xmin, ymin, xmax, ymax = p0.x, p0.y, p2.x, p2.y
+    if p1.x != xmax or p1.y != ymin or p3.x != xmin or p3.y != ymax:
+        return None
+    return xmin, ymin, xmax, ymax
+
+
+def _int_from_region_id(region_id):
+    """Get the int of a numeric region id, as made by create_region_id
+
+    Returns:
+        int: region id, or None if it does not round trip through an int64
+    """
+    if not isinstance(region_id, str) or not region_id.isdigit():
+        return None
+    value = int(region_id)
+    if value > INT64_MAX or str(value) != region_id:
+        return None
+    return value
@@ -1,7 +1,18 @@
 """ Configuration parameters
 """
+import os
+
 SCHEMA_FILE = "schema.avsc"
 POINT_EPS = 0.0001
 TIME_EPS = 0.016667  # 1/60
 SIGFIG = 4
 SCHEMA_ID = 68
+# Runtime type checking of the response dataclasses, disable in production with
+# MULTIVITAMIN_TYPECHECK=0
+TYPECHECK = os.environ.get("MULTIVITAMIN_TYPECHECK", "1") != "0"
+# Store bounding box regions of frame anns in columns until they are accessed or serialized
+COLUMNAR_FRAME_ANNS = os.environ.get("MULTIVITAMIN_COLUMNAR_FRAME_ANNS", "0") == "1"
+# Avro codec of AvroIO, "avro" or "fastavro"
+AVRO_CODEC = os.environ.get("MULTIVITAMIN_AVRO_CODEC", "avro")
+# Image annotations per block when streaming frames_annotation with AvroIO.write_stream
+AVRO_STREAM_BLOCK_SIZE = 1000
@@ -1,10 +1,11 @@
 import random
-from collections import MutableMapping
+from collections.abc import MutableMapping
 
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from typing import List
 from typeguard import typechecked
 
+from multivitamin.data.response import config
 from multivitamin.data.response.utils import round_float
 
 # Helper functions
@@ -55,55 +56,112 @@ def create_bbox_contour_from_points(
     return [Point(xmin, ymin), Point(xmax, ymin), Point(xmax, ymax), Point(xmin, ymax)]
 
 
+_LEAF_TYPES = frozenset((str, int, float, bool, type(None)))
+
+
+def to_builtins(obj):
+    """Convert annotation types to dicts and lists, like dataclasses.asdict
+
+    Walks the structure once. Unlike asdict, leaves (str, int, float) are immutable and
+    returned as is instead of deep copied
+
+    Args:
+        obj (Any): annotation type, list, dict or leaf
+
+    Returns:
+        Any: obj with annotation types converted to dicts
+    """
+    if type(obj) in _LEAF_TYPES:
+        return obj
+    obj_fields = getattr(obj, "__dataclass_fields__", None)
+    if obj_fields is not None:
+        return {name: to_builtins(getattr(obj, name)) for name in obj_fields}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_builtins(v) for v in obj)
+    if isinstance(obj, dict):
+        return {k: to_builtins(v) for k, v in obj.items()}
+    return obj
+
+
+def annotation_type(cls):
+    """Class decorator for the below dataclasses
+
+    Makes cls a dataclass, rebuilds it with __slots__ for its fields, so instances have no
+    per-instance __dict__, and wraps it with typeguard if config.TYPECHECK is set
+
+    Args:
+        cls (type): DictLike subclass with annotated fields
+
+    Returns:
+        type: slotted dataclass
+    """
+    cls = dataclass(cls)
+    cls_dict = dict(cls.__dict__)
+    field_names = tuple(f.name for f in fields(cls))
+    cls_dict["__slots__"] = field_names
+    for name in field_names:
+        # defaults are kept by the generated __init__, and would shadow the slots
+        cls_dict.pop(name, None)
+    cls_dict.pop("__dict__", None)
+    cls_dict.pop("__weakref__", None)
+    slotted_cls = type(cls)(cls.__name__, cls.__bases__, cls_dict)
+    slotted_cls.__qualname__ = cls.__qualname__
+    if config.TYPECHECK:
+        slotted_cls = typechecked(slotted_cls)
+    return slotted_cls
+
+
 # Data classes
 
 
 class DictLike(MutableMapping):
     """Base class used for the below dataclasses, so that each dataclass can 
     act like a dict with [] access
+
+    Keys are the fields of the dataclass, they can be read and set but not added or deleted
     """
 
-    def __init__(self, *args, **kwargs):
-        self.__dict__.update(*args, **kwargs)
+    __slots__ = ()
 
     def __setitem__(self, key, value):
-        self.__dict__[key] = value
+        if key not in self.__dataclass_fields__:
+            raise KeyError(key)
+        setattr(self, key, value)
 
     def __getitem__(self, key):
-        return self.__dict__[key]
+        if key not in self.__dataclass_fields__:
+            raise KeyError(key)
+        return getattr(self, key)
 
     def __delitem__(self, key):
-        del self.__dict__[key]
+        raise TypeError(f"Cannot delete field {key} of {type(self).__name__}")
 
     def __iter__(self):
-        return iter(self.__dict__)
+        return iter(self.__dataclass_fields__)
 
     def __len__(self):
-        return len(self.__dict__)
+        return len(self.__dataclass_fields__)
 
     def __str__(self):
-        return str(self.__dict__)
+        return str(dict(self))
 
     def __repr__(self):
-        return f"{super().__repr__()}, ({self.__dict__})"
+        return f"{super().__repr__()}, ({dict(self)})"
 
 
-@typechecked
-@dataclass
+@annotation_type
 class PropPair(DictLike):
     property_type: str = ""
     value: str = ""
 
 
-@typechecked
-@dataclass
+@annotation_type
 class Relationship(DictLike):
     relation: str = ""
     sources: List[str] = field(default_factory=list)
 
 
-@typechecked
-@dataclass
+@annotation_type
 class EligibleProp(DictLike):
     server: str = ""
     property_type: str = ""
@@ -112,8 +170,7 @@ class EligibleProp(DictLike):
     father_properties: List[PropPair] = field(default_factory=list)
 
 
-@typechecked
-@dataclass
+@annotation_type
 class AnnotationTask(DictLike):
     id: str = ""
     tstamps: List[float] = field(default_factory=list)
@@ -121,8 +178,7 @@ class AnnotationTask(DictLike):
     tags: List[EligibleProp] = field(default_factory=list)
 
 
-@typechecked
-@dataclass
+@annotation_type
 class Footprint(DictLike):
     """Footprint of a module 
 
@@ -154,8 +210,7 @@ class Footprint(DictLike):
     request_source: str = ""
 
 
-@typechecked
-@dataclass
+@annotation_type
 class Point(DictLike):
     """Point class
 
@@ -168,8 +223,7 @@ class Point(DictLike):
     y: float = 0.0
 
 
-@typechecked
-@dataclass
+@annotation_type
 class Property(DictLike):
     """Property class
 
@@ -206,8 +260,7 @@ class Property(DictLike):
     property_id: int = 0
 
 
-@typechecked
-@dataclass
+@annotation_type
 class Region(DictLike):
     contour: List[Point] = field(default_factory=make_whole_image_contour)
     props: List[Property] = field(default_factory=list)
@@ -216,8 +269,7 @@ class Region(DictLike):
     id: str = field(default_factory=create_region_id)
 
 
-@typechecked
-@dataclass
+@annotation_type
 class VideoAnn(DictLike):
     t1: float = 0.0
     t2: float = 0.0
@@ -230,8 +282,7 @@ class VideoAnn(DictLike):
         self.t2 = round_float(self.t2)
 
 
-@typechecked
-@dataclass
+@annotation_type
 class ImageAnn(DictLike):
     t: float = 0.0
     regions: List[Region] = field(default_factory=list)
@@ -240,8 +291,7 @@ class ImageAnn(DictLike):
         self.t = round_float(self.t)
 
 
-@typechecked
-@dataclass
+@annotation_type
 class MediaAnn(DictLike):
     codes: List[Footprint] = field(default_factory=list)
     url_original: str = ""
@@ -255,8 +305,7 @@ class MediaAnn(DictLike):
     annotation_tasks: List[AnnotationTask] = field(default_factory=list)
 
 
-@typechecked
-@dataclass
+@annotation_type
 class ResponseInternal(DictLike):
     point_aux: Point = None
     footprint_aux: Footprint = None
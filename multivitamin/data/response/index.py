@@ -0,0 +1,122 @@
+from bisect import bisect_left, bisect_right, insort
+
+
+class TstampIndex():
+    """Sorted unique tstamps, each mapped to a value
+
+    Tstamps added in increasing order, the common case, are appended in O(1), others are
+    inserted after a binary search. Range queries are O(log n + k)
+    """
+
+    def __init__(self):
+        self._tstamps = []
+        self._values = {}
+
+    def __len__(self):
+        return len(self._tstamps)
+
+    def __contains__(self, t):
+        return t in self._values
+
+    def get(self, t, default=None):
+        """Get the value of tstamp t
+
+        Args:
+            t (float): tstamp
+            default (Any): returned if t is not in the index
+
+        Returns:
+            Any: value of t
+        """
+        return self._values.get(t, default)
+
+    def add(self, t, value=None):
+        """Add tstamp t, or replace its value if it is already in the index
+
+        Args:
+            t (float): tstamp
+            value (Any): value of t
+        """
+        if t not in self._values:
+            if not self._tstamps or t > self._tstamps[-1]:
+                self._tstamps.append(t)
+            else:
+                insort(self._tstamps, t)
+        self._values[t] = value
+
+    def tstamps(self, t1=None, t2=None):
+        """Get the sorted tstamps in [t1, t2]
+
+        Args:
+            t1 (float): lower bound, None for no bound
+            t2 (float): upper bound, None for no bound
+
+        Returns:
+            List[float]: tstamps
+        """
+        lo = 0 if t1 is None else bisect_left(self._tstamps, t1)
+        hi = len(self._tstamps) if t2 is None else bisect_right(self._tstamps, t2)
+        return self._tstamps[lo:hi]
+
+    def values(self, t1=None, t2=None):
+        """Get the values of the tstamps in [t1, t2], sorted by tstamp
+
+        Args:
+            t1 (float): lower bound, None for no bound
+            t2 (float): upper bound, None for no bound
+
+        Returns:
+            list: values
+        """
+        return [self._values[t] for t in self.tstamps(t1, t2)]
+
+
+class IntervalIndex():
+    """Intervals [t1, t2] sorted by t1, each mapped to a value, for overlap queries
+
+    Along with the intervals, keeps the running max of t2, which does not decrease, so the
+    intervals ending before a query are skipped with a binary search. Overlap queries are
+    O(log n + k), with k the intervals starting in the query that end before it
+    """
+
+    def __init__(self):
+        self._t1s = []
+        self._t2s = []
+        self._max_t2s = []
+        self._values = []
+
+    def __len__(self):
+        return len(self._t1s)
+
+    def add(self, t1, t2, value=None):
+        """Add the interval [t1, t2]
+
+        Args:
+            t1 (float): start
+            t2 (float): end
+            value (Any): value of the interval
+        """
+        i = bisect_right(self._t1s, t1)
+        self._t1s.insert(i, t1)
+        self._t2s.insert(i, t2)
+        self._values.insert(i, value)
+        max_t2 = t2 if i == 0 else max(self._max_t2s[i - 1], t2)
+        self._max_t2s.insert(i, max_t2)
+        for j in range(i + 1, len(self._max_t2s)):
+            if self._max_t2s[j] >= max_t2:
+                break
+            self._max_t2s[j] = max_t2
+
+    def overlapping(self, t1, t2):
+        """Get the values of the intervals overlapping [t1, t2], sorted by start
+
+        Args:
+            t1 (float): start of the query
+            t2 (float): end of the query
+
+        Returns:
+            list: values
+        """
+        lo = bisect_left(self._max_t2s, t1)
+        hi = bisect_right(self._t1s, t2)
+        return [self._values[i] for i in range(lo, hi) if self._t2s[i] >= t1]
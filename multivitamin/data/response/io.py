@@ -3,14 +3,15 @@ import sys
 import glog as log
 import json
 import pkg_resources
-import tempfile
 import struct
 import base64
+import threading
 import traceback
+import importlib.util
+from functools import lru_cache
 
 import avro.schema
-from avro.datafile import DataFileReader, DataFileWriter
-from avro.io import DatumReader, DatumWriter, BinaryDecoder, BinaryEncoder
+from avro.io import DatumReader, DatumWriter, BinaryDecoder, BinaryEncoder, Validate
 from confluent_kafka.avro.cached_schema_registry_client import CachedSchemaRegistryClient
 from confluent_kafka.avro.serializer.message_serializer import (
     MessageSerializer,
@@ -21,23 +22,67 @@ from confluent_kafka.avro.serializer import SerializerError
 
 from multivitamin.data.response import config
 
+if importlib.util.find_spec("fastavro"):
+    import fastavro
+else:
+    fastavro = None
+
+CODECS = ("avro", "fastavro")
+
+_avro_ios = {}
+_avro_ios_lock = threading.Lock()
+
+
+def get_avro_io(schema_registry_url=None, codec=None):
+    """Get the process-wide AvroIO of a schema registry url and codec
+
+    AvroIO objects only hold the parsed schema and reusable writers/readers, so they can be
+    shared between responses and threads instead of parsing the schema on each call
+
+    Args:
+        schema_registry_url (str): schema registry url, or None for the local schema
+        codec (str): "avro" or "fastavro", defaults to config.AVRO_CODEC
+
+    Returns:
+        AvroIO: cached AvroIO
+    """
+    key = (schema_registry_url, codec or config.AVRO_CODEC)
+    avro_io = _avro_ios.get(key)
+    if avro_io is None:
+        with _avro_ios_lock:
+            avro_io = _avro_ios.get(key)
+            if avro_io is None:
+                avro_io = AvroIO(schema_registry_url, codec=key[1])
+                _avro_ios[key] = avro_io
+    return avro_io
+
 
 class AvroIO:
-    def __init__(self, schema_registry_url=None):
+    def __init__(self, schema_registry_url=None, codec=None):
         """Public interface for Avro IO functionality
+
+        Use get_avro_io to reuse AvroIO objects
         
         Args:
-            use_schema_registry (bool): flag to use schema registry via client ID and registry URL
-            use_base64 (bool): encoding binary to base64
+            schema_registry_url (str): schema registry url, or None for the local schema
+            codec (str): "avro" or "fastavro", defaults to config.AVRO_CODEC
         """
         self.impl = None
         self.use_base64 = False
+        codec = codec or config.AVRO_CODEC
+        if codec not in CODECS:
+            raise ValueError(f"codec must be one of {CODECS}, got {codec}")
+        if codec == "fastavro" and fastavro is None:
+            log.warning("fastavro is not installed, using avro codec")
+            codec = "avro"
+        self._codec_name = codec
+        self._frame_ann_codec = None
         if schema_registry_url:
             log.info(f"schema_registry_url: {schema_registry_url}")
-            self.impl = _AvroIORegistry(schema_registry_url)
+            self.impl = _AvroIORegistry(schema_registry_url, codec)
         else:
             log.warning("registry_url is None, using local schema and serializing w/o magic byte")
-            self.impl = _AvroIOLocal()
+            self.impl = _AvroIOLocal(codec)
 
     def get_schema(self):
         """Return schema 
@@ -126,9 +171,43 @@ class AvroIO:
             bytes = base64.b64encode(bytes)
         return bytes
 
+    def write_stream(self, outf, doc, frames_annotation=None, block_size=None):
+        """Write an avro doc to a binary file-like object, encoding frames_annotation in blocks
+
+        Writes the same format as encode, but frames_annotation is written as an avro array
+        of blocks of up to block_size image annotations, so only one block of image
+        annotations is held at a time. The output is decoded with decode, and is the same as
+        encode if there is a single block
+
+        Args:
+            outf (file-like): binary output, e.g. a file opened with "wb"
+            doc (dict): avro doc as a dict. If frames_annotation is given, the frames_annotation
+                of doc are ignored
+            frames_annotation (iterable[dict or ImageAnn]): image annotations, consumed lazily.
+                ImageAnn objects are encoded without copying them to dicts
+            block_size (int): image annotations per block, defaults to
+                config.AVRO_STREAM_BLOCK_SIZE
+
+        Raises:
+            avro.io.AvroTypeException: if doc is not an example of the schema. Blocks written
+                before the error are left in outf
+        """
+        if frames_annotation is None:
+            frames_annotation = doc["media_annotation"]["frames_annotation"]
+        block_size = max(int(block_size or config.AVRO_STREAM_BLOCK_SIZE), 1)
+        if self._frame_ann_codec is None:
+            self._frame_ann_codec = _make_codec(
+                _get_frames_annotation_schema(self.impl.schema).items, self._codec_name
+            )
+        _write_stream(
+            self.impl.schema, self._frame_ann_codec, outf, doc, frames_annotation, block_size
+        )
+
     def is_valid_avro_doc(self, doc):
         """Boolean test to validate json against a schema
 
+        Validates in memory with the codec, without serializing the doc
+
         Args:
             doc (dict): avro doc as a dict
 
@@ -136,12 +215,9 @@ class AvroIO:
             boolean: True if json is an example of schema
         """
         try:
-            writer = DataFileWriter(tempfile.TemporaryFile(), DatumWriter(), self.impl.schema)
-            writer.append(doc)
-            writer.close()
-        except:
+            return self.impl.validate(doc)
+        except Exception:
             return False
-        return True
 
     @staticmethod
     def is_valid_avro_doc_static(doc, schema):
@@ -159,53 +235,151 @@ class AvroIO:
         else:
             avro_schema = schema
         try:
-            writer = DataFileWriter(tempfile.TemporaryFile(), DatumWriter(), avro_schema)
-            writer.append(doc)
-            writer.close()
-        except:
+            return Validate(avro_schema, doc)
+        except Exception:
             return False
-        return True
+
+
+@lru_cache(maxsize=None)
+def _load_local_schema():
+    """Parse the local schema file once per process"""
+    local_schema_file = pkg_resources.resource_filename(
+        "multivitamin.data.response", config.SCHEMA_FILE
+    )
+    log.debug("Using local schema file {}".format(local_schema_file))
+    if not os.path.exists(local_schema_file):
+        raise FileNotFoundError("Schema file not found")
+    with open(local_schema_file) as f:
+        return avro.schema.Parse(f.read())
+
+
+class _AvroCodec:
+    def __init__(self, schema):
+        """Private codec of schemaless avro binary using avro, with a reusable writer/reader"""
+        self.schema = schema
+        self.writer = DatumWriter(schema)
+        self.reader = DatumReader(schema)
+
+    def write(self, record, outf):
+        if isinstance(record, dict):
+            self.writer.write(record, BinaryEncoder(outf))
+        else:
+            # annotation types are written as is, without validation against the schema
+            self.writer.write_data(self.schema, record, BinaryEncoder(outf))
+
+    def read(self, inf):
+        return self.reader.read(BinaryDecoder(inf))
+
+    def validate(self, record):
+        return Validate(self.schema, record)
+
+
+class _FastAvroCodec:
+    def __init__(self, schema):
+        """Private codec of schemaless avro binary using fastavro, with a precompiled schema"""
+        schema = schema.to_json()
+        if hasattr(fastavro, "parse_schema"):
+            schema = fastavro.parse_schema(schema)
+        self.schema = schema
+
+    def write(self, record, outf):
+        fastavro.schemaless_writer(outf, self.schema, record)
+
+    def read(self, inf):
+        return fastavro.schemaless_reader(inf, self.schema)
+
+    def validate(self, record):
+        return fastavro.validation.validate(record, self.schema, raise_errors=False)
+
+
+def _make_codec(schema, codec):
+    if codec == "fastavro":
+        return _FastAvroCodec(schema)
+    return _AvroCodec(schema)
+
+
+def _encode_with_header(codec, schema_id, record):
+    with ContextStringIO() as outf:
+        outf.write(struct.pack("b", MAGIC_BYTE))
+        outf.write(struct.pack(">I", schema_id))
+        codec.write(record, outf)
+        return outf.getvalue()
+
+
+def _get_frames_annotation_schema(schema):
+    media_annotation_schema = schema.field_map["media_annotation"].type
+    return media_annotation_schema.field_map["frames_annotation"].type
+
+
+def _write_stream(schema, frame_ann_codec, outf, doc, frames_annotation, block_size):
+    """Write the header and doc to outf, and frames_annotation in blocks of block_size"""
+    writer = DatumWriter()
+    encoder = BinaryEncoder(outf)
+    outf.write(struct.pack("b", MAGIC_BYTE))
+    outf.write(struct.pack(">I", config.SCHEMA_ID))
+    for field in schema.fields:
+        if field.name != "media_annotation":
+            _write_field(writer, encoder, field, doc)
+            continue
+        media_annotation = doc["media_annotation"]
+        for media_field in field.type.fields:
+            if media_field.name != "frames_annotation":
+                _write_field(writer, encoder, media_field, media_annotation)
+                continue
+            for frame_anns in _chunks(frames_annotation, block_size):
+                encoder.write_long(len(frame_anns))
+                for frame_ann in frame_anns:
+                    frame_ann_codec.write(frame_ann, outf)
+            encoder.write_long(0)
+
+
+def _write_field(writer, encoder, field, record):
+    value = record.get(field.name)
+    if not Validate(field.type, value):
+        raise avro.io.AvroTypeException(field.type, value)
+    writer.write_data(field.type, value, encoder)
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _read_header(payload):
+    magic, schema_id = struct.unpack(">bI", payload.read(5))
+    if magic != MAGIC_BYTE:
+        raise SerializerError("message does not start with magic byte")
+    return schema_id
 
 
 class _AvroIOLocal:
-    def __init__(self):
+    def __init__(self, codec="avro"):
         """Private implementation class for Avro IO of local files"""
-        local_schema_file = pkg_resources.resource_filename(
-            "multivitamin.data.response", config.SCHEMA_FILE
-        )
-        log.debug("Using local schema file {}".format(local_schema_file))
-        if not os.path.exists(local_schema_file):
-            raise FileNotFoundError("Schema file not found")
-        self.schema = avro.schema.Parse(open(local_schema_file).read())
+        self.schema = _load_local_schema()
+        self.codec = _make_codec(self.schema, codec)
 
     def decode(self, bytes):
         if len(bytes) <= 5:
             raise SerializerError("Message is too small to decode")
         with ContextStringIO(bytes) as payload:
-            magic, schema_id = struct.unpack(">bI", payload.read(5))
-            if magic != MAGIC_BYTE:
-                raise SerializerError("message does not start with magic byte")
-            curr_pos = payload.tell()
-            avro_reader = avro.io.DatumReader(self.schema)
-
-            def decoder(p):
-                bin_decoder = avro.io.BinaryDecoder(p)
-                return avro_reader.read(bin_decoder)
-
-            return decoder(payload)
+            _read_header(payload)
+            return self.codec.read(payload)
 
     def encode(self, record):
-        with ContextStringIO() as outf:
-            outf.write(struct.pack("b", MAGIC_BYTE))
-            outf.write(struct.pack(">I", config.SCHEMA_ID))
-            encoder = avro.io.BinaryEncoder(outf)
-            writer = avro.io.DatumWriter(self.schema)
-            writer.write(record, encoder)
-            return outf.getvalue()
+        return _encode_with_header(self.codec, config.SCHEMA_ID, record)
+
+    def validate(self, record):
+        return self.codec.validate(record)
 
 
 class _AvroIORegistry:
-    def __init__(self, schema_registry_url):
+    def __init__(self, schema_registry_url, codec="avro"):
         """Private implementation class for Avro IO using the registry"""
         log.info(f"Using registry with schema_url/id {schema_registry_url}/{config.SCHEMA_ID}")
         try:
@@ -214,9 +388,31 @@ class _AvroIORegistry:
             self.serializer = MessageSerializer(self.client)
         except:
             raise ValueError("Client id or schema id not found")
+        self.codec_name = codec
+        self.codecs = {}
+        if codec == "fastavro":
+            self.codecs[config.SCHEMA_ID] = _make_codec(self.schema, codec)
 
     def decode(self, bytes):
-        return self.serializer.decode_message(bytes)
+        if self.codec_name != "fastavro":
+            return self.serializer.decode_message(bytes)
+        if len(bytes) <= 5:
+            raise SerializerError("Message is too small to decode")
+        with ContextStringIO(bytes) as payload:
+            return self._get_codec(_read_header(payload)).read(payload)
 
     def encode(self, record):
-        return self.serializer.encode_record_with_schema_id(config.SCHEMA_ID, record)
+        if self.codec_name != "fastavro":
+            return self.serializer.encode_record_with_schema_id(config.SCHEMA_ID, record)
+        return _encode_with_header(self._get_codec(config.SCHEMA_ID), config.SCHEMA_ID, record)
+
+    def validate(self, record):
+        return self._get_codec(config.SCHEMA_ID).validate(record)
+
+    def _get_codec(self, schema_id):
+        """Get the codec of the writer schema of a message"""
+        codec = self.codecs.get(schema_id)
+        if codec is None:
+            codec = _make_codec(self.client.get_by_id(schema_id), self.codec_name)
+            self.codecs[schema_id] = codec
+        return codec
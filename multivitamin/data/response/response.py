@@ -1,14 +1,19 @@
 import json
 import traceback
+from base64 import b64encode
+from io import BytesIO
 
 import glog as log
-from dataclasses import asdict
 
 from multivitamin.data import Request
-from multivitamin.data.response.io import AvroIO
+from multivitamin.data.response import config
+from multivitamin.data.response.io import get_avro_io
+from multivitamin.data.response.columnar import RegionStore
+from multivitamin.data.response.index import TstampIndex, IntervalIndex
 from multivitamin.data.response.dtypes import (
     ResponseInternal,
     Region,
+    to_builtins,
     VideoAnn,
     ImageAnn,
     Footprint,
@@ -18,7 +23,9 @@ from multivitamin.media.file_retriever import FileRetriever
 
 
 class Response():
-    def __init__(self, response_input=None, schema_registry_url=None):
+    def __init__(
+        self, response_input=None, schema_registry_url=None, columnar=None, trusted=False
+    ):
         """ Class for a Response object
         
         2 cases for construction:
@@ -29,20 +36,37 @@ class Response():
         Args:
             input (Any): previous Response or dict
             schema_registry_url (str): whether to use schema registry when serializing to bytes
+            columnar (bool): store bounding box regions with a single property appended with
+                append_region(s) in a columnar RegionStore, until frame_anns are accessed or the
+                response is serialized. Regions are copied on append, so later changes to an
+                appended Region are lost. Defaults to config.COLUMNAR_FRAME_ANNS
+            trusted (bool): skip the avro schema validation of a dict input, for dicts produced
+                by Response.to_dict or decoded from avro
         """
         self._request = None
         self._response_internal = None
         self._schema_registry_url = schema_registry_url
-        self._tstamp2frameannsidx = {}
+        self._frame_anns_index = None
+        self._indexed_frame_anns = None
+        self._num_indexed_frame_anns = 0
+        self._tracks_index = None
+        self._indexed_tracks = None
+        self._num_indexed_tracks = 0
+        self._footprint_tstamps = {}
+        self._indexed_footprints = []
+        if columnar is None:
+            columnar = config.COLUMNAR_FRAME_ANNS
+        self._region_store = RegionStore() if columnar else None
 
         if isinstance(response_input, Request):
             self._request = response_input
             self._init_from_request()
         elif isinstance(response_input, dict):
-            io = AvroIO(schema_registry_url)
-            if not io.is_valid_avro_doc(response_input):
-                raise ValueError("Input dict is incompatible with avro schema")
-            log.debug("Input dict is compatible with avro schema")
+            if not trusted:
+                io = get_avro_io(schema_registry_url)
+                if not io.is_valid_avro_doc(response_input):
+                    raise ValueError("Input dict is incompatible with avro schema")
+                log.debug("Input dict is compatible with avro schema")
 
             # unpack dictionary values into kwargs using ** operator
             try:
@@ -54,7 +78,12 @@ class Response():
             log.debug("Initializing empty response")
             self._response_internal = ResponseInternal()
 
-        self._init_tstamp2frameannsidx()
+        self._build_frame_anns_index()
+
+    def __str__(self):
+        """Response as indented JSON. Log it with log.debug("%s", response), so it is only
+        serialized if the message is emitted"""
+        return json.dumps(self.to_dict(), indent=2)
 
     def to_dict(self):
         """Getter for response in the form of a dict
@@ -66,7 +95,7 @@ class Response():
         if self._request is not None:
             if self._request.bin_encoding is True:
                 log.warning("self._request.bin_encoding is True but returning dictionary")
-        return asdict(self._response_internal)
+        return self._asdict()
 
     def to_bytes(self, base64=False):
         """Getter for response in the form of bytes or base64 str
@@ -83,13 +112,36 @@ class Response():
         log.debug(f"base64 encoding: {base64}")
         log.debug("Returning response as binary")
         try:
-            io = AvroIO(self._schema_registry_url)
-            return io.encode(asdict(self._response_internal), base64)
+            io = get_avro_io(self._schema_registry_url)
+            outf = BytesIO()
+            # a single block gives the same bytes as io.encode(self.to_dict())
+            num_frames = len(self._response_internal["media_annotation"]["frames_annotation"])
+            io.write_stream(
+                outf, self._asdict_envelope(), self._iter_frame_anns(), max(num_frames, 1)
+            )
+            bytes = outf.getvalue()
+            if base64:
+                bytes = b64encode(bytes)
+            return bytes
         except Exception:
             log.error("Error serializing response")
             # what to do here?
             raise Exception("Error serializing response")
 
+    def write_avro(self, outf, block_size=None):
+        """Write the response as avro binary to a file-like object, streaming frames_annotation
+
+        Writes the same format as to_bytes(base64=False), but frame anns are encoded in
+        blocks, so the response is never held in memory as a whole dict or bytes
+
+        Args:
+            outf (file-like): binary output, e.g. a file opened with "wb"
+            block_size (int): frame anns per block, defaults to config.AVRO_STREAM_BLOCK_SIZE
+        """
+        log.debug("Streaming response as binary")
+        io = get_avro_io(self._schema_registry_url)
+        io.write_stream(outf, self._asdict_envelope(), self._iter_frame_anns(), block_size)
+
     @property
     def data(self):
         """Convenience getter to return either dict or bytes depending on request
@@ -131,6 +183,7 @@ class Response():
         Returns:
             List[ImageAnn]: frames ann
         """
+        self._flush_region_store()
         return self._response_internal["media_annotation"]["frames_annotation"]
 
     def has_frame_anns(self):
@@ -139,7 +192,7 @@ class Response():
         Returns:
             bool: flag for existence of frame anns
         """
-        return len(self.frame_anns) > 0
+        return len(self._response_internal["media_annotation"]["frames_annotation"]) > 0
 
     def get_regions_from_tstamp(self, t):
         """Get regions for a timestamp
@@ -151,10 +204,51 @@ class Response():
             List[Region]: regions
         """
         assert isinstance(t, float)
-        if t not in self._tstamp2frameannsidx:
+        frame_anns_idx = self._get_frame_anns_index().get(t)
+        if frame_anns_idx is None:
             return None
-        frame_anns_idx = self._tstamp2frameannsidx[t]
-        return self._response_internal["media_annotation"]["frames_annotation"][frame_anns_idx]["regions"]
+        return self.frame_anns[frame_anns_idx]["regions"]
+
+    def get_frame_anns_between(self, t1, t2):
+        """Get the frame anns with a tstamp in [t1, t2]
+
+        Args:
+            t1 (float): start tstamp
+            t2 (float): end tstamp
+
+        Returns:
+            List[ImageAnn]: frame anns, sorted by tstamp
+        """
+        frame_anns = self.frame_anns
+        return [frame_anns[idx] for idx in self._get_frame_anns_index().values(t1, t2)]
+
+    def get_regions_between(self, t1, t2):
+        """Get the regions of the frame anns with a tstamp in [t1, t2]
+
+        Args:
+            t1 (float): start tstamp
+            t2 (float): end tstamp
+
+        Returns:
+            List[Region]: regions, sorted by tstamp
+        """
+        return [
+            region
+            for image_ann in self.get_frame_anns_between(t1, t2)
+            for region in image_ann["regions"]
+        ]
+
+    def get_tracks_between(self, t1, t2):
+        """Get the tracks overlapping [t1, t2]
+
+        Args:
+            t1 (float): start tstamp
+            t2 (float): end tstamp
+
+        Returns:
+            List[VideoAnn]: tracks, sorted by t1
+        """
+        return self._get_tracks_index().overlapping(t1, t2)
 
     @property
     def request(self):
@@ -205,7 +299,7 @@ class Response():
         self._response_internal["media_annotation"]["h"] = h
 
     def get_timestamps_from_frames_ann(self):
-        return sorted(self._tstamp2frameannsidx.keys())
+        return self._get_frame_anns_index().tstamps()
 
     def get_timestamps(self, server=None):
         """Get timestamps from footprints. Option for querying on module name
@@ -216,13 +310,25 @@ class Response():
         Returns:
             List[float]: unique timestamps
         """
-        tstamps = []
-        for c in self._response_internal["media_annotation"]["codes"]:
-            if server:
-                if c["server"] != server:
-                    continue
-            tstamps.extend([round_float(t) for t in c["tstamps"]])
-        return sorted(set(tstamps))
+        codes = self._response_internal["media_annotation"]["codes"]
+        indexed = [(c, len(c["tstamps"])) for c in codes]
+        if len(indexed) != len(self._indexed_footprints) or any(
+            c is not indexed_c or n != indexed_n
+            for (c, n), (indexed_c, indexed_n) in zip(indexed, self._indexed_footprints)
+        ):
+            self._footprint_tstamps = {}
+            self._indexed_footprints = indexed
+        index = self._footprint_tstamps.get(server)
+        if index is None:
+            index = TstampIndex()
+            for c in codes:
+                if server:
+                    if c["server"] != server:
+                        continue
+                for t in c["tstamps"]:
+                    index.add(round_float(t))
+            self._footprint_tstamps[server] = index
+        return index.tstamps()
 
     # Modifiers
 
@@ -236,17 +342,8 @@ class Response():
             region (Region): region
         """
         assert isinstance(t, float)
-        assert isinstance(region, type(Region()))
-        log.debug(self._tstamp2frameannsidx)
-        if t in self._tstamp2frameannsidx:
-            log.debug(f"t: {t} in frame_anns, appending Region")
-            frame_anns_idx = self._tstamp2frameannsidx[t]
-            self._response_internal["media_annotation"]["frames_annotation"][frame_anns_idx]["regions"].append(region)
-        else:
-            log.debug(f"t: {t} NOT in frame_anns, appending ImageAnn")
-            ia = ImageAnn(t=t, regions=[region])
-            self._response_internal["media_annotation"]["frames_annotation"].append(ia)
-            self._tstamp2frameannsidx[t] = len(self.frame_anns) - 1
+        assert isinstance(region, Region)
+        self._append_region(t, region)
 
     def append_regions(self, t, regions):
         """Append a list of regions given a timestamp
@@ -260,17 +357,45 @@ class Response():
         assert isinstance(t, float)
         assert isinstance(regions, list)
         for region in regions:
-            assert isinstance(region, type(Region()))
+            assert isinstance(region, Region)
 
-        if t in self._tstamp2frameannsidx:
-            log.debug(f"t: {t} in frame_anns, extending Regions")
-            frame_anns_idx = self._tstamp2frameannsidx[t]
-            self._response_internal["media_annotation"]["frames_annotation"][frame_anns_idx].extend(regions)
+        for region in regions:
+            self._append_region(t, region)
+
+    def _append_region(self, t, region):
+        """Append a region to the ImageAnn of tstamp t, or to the region store"""
+        frame_anns_index = self._get_frame_anns_index()
+        frames_annotation = self._response_internal["media_annotation"]["frames_annotation"]
+        frame_anns_idx = frame_anns_index.get(t)
+        if frame_anns_idx is not None:
+            log.debug(f"t: {t} in frame_anns, appending Region")
         else:
             log.debug(f"t: {t} NOT in frame_anns, appending ImageAnn")
-            ia = ImageAnn(t=t, regions=regions)
-            self._response_internal["media_annotation"]["frames_annotation"].append(ia)
-            self._tstamp2frameannsidx[t] = len(self.frame_anns) - 1
+            frames_annotation.append(ImageAnn(t=t, regions=[]))
+            frame_anns_idx = len(frames_annotation) - 1
+            frame_anns_index.add(t, frame_anns_idx)
+            self._num_indexed_frame_anns += 1
+
+        if self._region_store is not None:
+            if self._region_store.append(frame_anns_idx, region):
+                return
+            # keep the order of the regions of the frame
+            if self._region_store.has_pending(frame_anns_idx):
+                self._flush_region_store()
+        frames_annotation[frame_anns_idx]["regions"].append(region)
+
+    def map_frame_anns_props(self, func):
+        """Apply a function to every property of the frame anns, in place
+
+        Args:
+            func (callable): func(prop), modifies a Property in place
+        """
+        for image_ann in self._response_internal["media_annotation"]["frames_annotation"]:
+            for region in image_ann["regions"]:
+                for prop in region["props"]:
+                    func(prop)
+        if self._region_store is not None:
+            self._region_store.map_props(func)
 
     def append_footprint(self, footprint):
         """Append a footprint
@@ -278,7 +403,7 @@ class Response():
         Args:
             footprint (Footprint): footprint
         """
-        assert isinstance(footprint, type(Footprint()))
+        assert isinstance(footprint, Footprint)
         self._response_internal["media_annotation"]["codes"].append(footprint)
 
     def append_track(self, video_ann):
@@ -287,8 +412,11 @@ class Response():
         Args:
             video_ann (VideoAnn): track
         """
-        assert isinstance(video_ann, type(VideoAnn()))
+        assert isinstance(video_ann, VideoAnn)
+        tracks_index = self._get_tracks_index()
         self._response_internal["media_annotation"]["tracks_summary"].append(video_ann)
+        tracks_index.add(video_ann["t1"], video_ann["t2"], video_ann)
+        self._num_indexed_tracks += 1
 
     def append_media_summary(self, video_ann):
         """Append a media_summary to media_summary section
@@ -296,14 +424,15 @@ class Response():
         Args:
             video_ann (VideoAnn): media_summary
         """
-        assert isinstance(video_ann, type(VideoAnn()))
+        assert isinstance(video_ann, VideoAnn)
         self._response_internal["media_annotation"]["media_summary"].append(video_ann)
 
     def sort_image_anns_by_timestamp(self):
-        tmp = self._response_internal["media_annotation"]["frames_annotation"]
+        tmp = self.frame_anns
         self._response_internal["media_annotation"]["frames_annotation"] = sorted(
             tmp, key=lambda k: k["t"]
         )
+        self._build_frame_anns_index()
 
     def sort_tracks_summary_by_timestamp(self):
         tmp = self._response_internal["media_annotation"]["tracks_summary"]
@@ -342,7 +471,7 @@ class Response():
             prev_response_dict = None
             if self._request.bin_encoding is True:
                 log.debug("bin_encoding is True")
-                io = AvroIO()
+                io = get_avro_io()
                 if isinstance(self._request.prev_response, str):
                     log.debug("prev_response is base64 encoded binary")
                     prev_response_dict = io.decode(
@@ -375,11 +504,88 @@ class Response():
             self._response_internal = ResponseInternal()
         self.url = self._request.url
 
-    def _init_tstamp2frameannsidx(self):
-        """If there is a previous response, we want to store the tstamp 2 frame_anns idx dict
+    def _asdict(self):
+        """Convert to a dict, materializing the regions of the region store"""
+        d = to_builtins(self._response_internal)
+        if self._region_store:
+            frames_annotation = d["media_annotation"]["frames_annotation"]
+            for frame_anns_idx, region in self._region_store.to_dicts():
+                frames_annotation[frame_anns_idx]["regions"].append(region)
+        return d
+
+    def _asdict_envelope(self):
+        """Convert to a dict, without the frame anns
+
+        The response is not modified, so it can be serialized by several threads at once,
+        e.g. pushed to several output comms
+        """
+        internal = self._response_internal
+        envelope = {
+            **internal,
+            "media_annotation": {**internal["media_annotation"], "frames_annotation": []},
+        }
+        return to_builtins(envelope)
+
+    def _iter_frame_anns(self):
+        """Iterate over frame anns for serialization
+
+        Frame anns are yielded as is, without a copy, unless they have regions in the region
+        store, then they are converted to dicts with the regions of the store
         """
-        log.debug("Creating tstamp2frameannsidx")
-        log.debug(f"prev_response frame_anns: {self.frame_anns}")
-        for idx, image_ann in enumerate(self.frame_anns):
-            self._tstamp2frameannsidx[round_float(image_ann["t"])] = idx
-        log.debug(f"tstamp2frameannsidx: {self._tstamp2frameannsidx}")
+        store_frames = iter(())
+        if self._region_store:
+            store_frames = self._region_store.to_dicts_by_frame()
+        store_frame_idx, store_regions = next(store_frames, (None, None))
+        frames_annotation = self._response_internal["media_annotation"]["frames_annotation"]
+        for frame_anns_idx, image_ann in enumerate(frames_annotation):
+            if frame_anns_idx != store_frame_idx:
+                yield image_ann
+                continue
+            d = to_builtins(image_ann)
+            d["regions"].extend(store_regions)
+            store_frame_idx, store_regions = next(store_frames, (None, None))
+            yield d
+
+    def _flush_region_store(self):
+        """Move the regions of the region store into frame anns"""
+        if not self._region_store:
+            return
+        log.debug(f"Flushing {len(self._region_store)} regions from the region store")
+        frames_annotation = self._response_internal["media_annotation"]["frames_annotation"]
+        for frame_anns_idx, region in self._region_store.to_regions():
+            frames_annotation[frame_anns_idx]["regions"].append(region)
+        self._region_store.clear()
+
+    def _build_frame_anns_index(self):
+        """Index frame anns by tstamp, e.g. for a previous response or after sorting"""
+        log.debug("Creating frame anns index")
+        frames_annotation = self.frame_anns
+        log.debug("prev_response frame_anns: %s", frames_annotation)
+        self._frame_anns_index = TstampIndex()
+        for idx, image_ann in enumerate(frames_annotation):
+            self._frame_anns_index.add(round_float(image_ann["t"]), idx)
+        self._indexed_frame_anns = frames_annotation
+        self._num_indexed_frame_anns = len(frames_annotation)
+
+    def _get_frame_anns_index(self):
+        """Get the tstamp index of frame anns, rebuilt if frame anns were replaced or
+        appended to without append_region(s)"""
+        frames_annotation = self._response_internal["media_annotation"]["frames_annotation"]
+        if (
+            frames_annotation is not self._indexed_frame_anns
+            or len(frames_annotation) != self._num_indexed_frame_anns
+        ):
+            self._build_frame_anns_index()
+        return self._frame_anns_index
+
+    def _get_tracks_index(self):
+        """Get the interval index of tracks, rebuilt if tracks were replaced or appended to
+        without append_track"""
+        tracks = self._response_internal["media_annotation"]["tracks_summary"]
+        if tracks is not self._indexed_tracks or len(tracks) != self._num_indexed_tracks:
+            self._tracks_index = IntervalIndex()
+            for video_ann in tracks:
+                self._tracks_index.add(video_ann["t1"], video_ann["t2"], video_ann)
+            self._indexed_tracks = tracks
+            self._num_indexed_tracks = len(tracks)
+        return self._tracks_index
@@ -11,3 +11,4 @@ from .opencv_media_retriever import OpenCVMediaRetriever
 from .pims_media_retriever import PIMSMediaRetriever
 from .file_retriever import FileRetriever
 from .opencv_media_retriever import OpenCVMediaRetriever as MediaRetriever
+from .prefetching_frames_iterator import PrefetchingFramesIterator
@@ -0,0 +1,169 @@
+import os
+import hashlib
+import tempfile
+import threading
+import urllib.parse
+import glog as log
+
+from . import config
+
+TMP_PREFIX = ".tmp-"
+
+_media_cache = None
+_media_cache_lock = threading.Lock()
+
+
+def get_media_cache():
+    """Get the process-wide MediaCache configured by config.MEDIA_CACHE_DIR and
+    config.MEDIA_CACHE_MAX_BYTES
+
+    Returns:
+        MediaCache: media cache, or None if disabled
+    """
+    global _media_cache
+    if config.MEDIA_CACHE_MAX_BYTES <= 0:
+        return None
+    if _media_cache is None:
+        with _media_cache_lock:
+            if _media_cache is None:
+                _media_cache = MediaCache(config.MEDIA_CACHE_DIR, config.MEDIA_CACHE_MAX_BYTES)
+    return _media_cache
+
+
+class MediaCache():
+    """On-disk LRU cache of remote files
+
+    Entries are files named by a key derived from the url and version (ETag or hash) of the
+    remote file. Files are written to a temp file and moved into place with os.replace, so
+    other processes sharing the folder never see partial files. Reading an entry refreshes
+    its mtime, and the least recently used entries are evicted once the folder is bigger
+    than max_bytes.
+
+    Hits and misses are counted per process.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        """Init MediaCache.
+
+        Args:
+            cache_dir (str): folder of the cache, created if missing
+            max_bytes (int): size of the cache. The last entry written is kept even if it is
+                bigger than max_bytes, until the next put
+
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(url, version=None):
+        """Get the key of a remote file.
+
+        Args:
+            url (str): url of the file
+            version (str | optional): ETag or hash of the file
+
+        Returns:
+            str: key, keeping the extension of the url for decoders
+
+        """
+        digest = hashlib.sha256(f"{url}\0{version or ''}".encode()).hexdigest()
+        ext = os.path.splitext(urllib.parse.urlparse(url).path)[1]
+        if not ext[1:].isalnum() or len(ext) > 8:
+            ext = ""
+        return digest + ext.lower()
+
+    def get(self, key):
+        """Get the path of an entry, and mark it as recently used.
+
+        Args:
+            key (str): key of the entry
+
+        Returns:
+            str: path of the entry, or None on a miss
+
+        """
+        path = os.path.join(self.cache_dir, key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._stats_lock:
+                self.misses += 1
+            log.debug(f"Media cache miss: {key}")
+            return None
+        with self._stats_lock:
+            self.hits += 1
+        log.debug(f"Media cache hit: {key}")
+        return path
+
+    def put(self, key, content):
+        """Write an entry, then evict the least recently used entries.
+
+        Args:
+            key (str): key of the entry
+            content (iterable[bytes] | callable): content of the entry, or a function writing
+                it to the binary file object it is given
+
+        Returns:
+            str: path of the entry
+
+        """
+        path = os.path.join(self.cache_dir, key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=TMP_PREFIX)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if callable(content):
+                    content(f)
+                else:
+                    for chunk in content:
+                        f.write(chunk)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self.evict(keep=key)
+        return path
+
+    def evict(self, keep=None):
+        """Remove the least recently used entries until the cache fits in max_bytes.
+
+        Args:
+            keep (str | optional): key of an entry never to evict
+
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.startswith(TMP_PREFIX) or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:  # evicted by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.name))
+            total += stat.st_size
+
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+                log.debug(f"Media cache evicted: {name}")
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self):
+        """Get the hit and miss counters of this process.
+
+        Returns:
+            dict: hits, misses
+
+        """
+        with self._stats_lock:
+            return {"hits": self.hits, "misses": self.misses}
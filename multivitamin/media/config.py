@@ -0,0 +1,25 @@
+""" Configuration parameters
+"""
+import os
+import tempfile
+
+# On-disk cache of remote media, shared by retrievers and worker processes on a host
+MEDIA_CACHE_DIR = os.environ.get(
+    "MULTIVITAMIN_MEDIA_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "multivitamin_media_cache"),
+)
+# Size of the media cache, least recently used files are evicted. 0 disables the cache
+MEDIA_CACHE_MAX_BYTES = int(os.environ.get("MULTIVITAMIN_MEDIA_CACHE_MAX_BYTES", 2 * 2 ** 30))
+# Download remote videos into the media cache before decoding them, instead of streaming them.
+# Off by default, as whole videos are downloaded to local disk
+MEDIA_CACHE_VIDEOS = os.environ.get("MULTIVITAMIN_MEDIA_CACHE_VIDEOS", "0") == "1"
+DOWNLOAD_CHUNK_SIZE = 2 ** 20
+# Remote files of at least 2 parts are downloaded with concurrent range requests
+DOWNLOAD_PART_SIZE = 8 * 2 ** 20
+DOWNLOAD_WORKERS = 8
+# Retries of failed requests, waiting DOWNLOAD_BACKOFF_SEC before the first and doubling it
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_BACKOFF_SEC = 0.5
+DOWNLOAD_TIMEOUT_SEC = 60
+# Bytes HTTPFile reads ahead on each request, so small sequential reads share a request
+HTTPFILE_READ_AHEAD = 2 ** 18
@@ -0,0 +1,150 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import glog as log
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import config
+
+RETRY_STATUS_CODES = frozenset((429, 500, 502, 503, 504))
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Get the process-wide requests.Session
+
+    Its keep-alive connection pool is sized for config.DOWNLOAD_WORKERS concurrent requests
+    per host, so range requests reuse connections instead of opening one per request
+
+    Returns:
+        requests.Session: session
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=config.DOWNLOAD_WORKERS,
+                    pool_maxsize=config.DOWNLOAD_WORKERS,
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def request(url, method="GET", headers=None, stream=False, retries=None, backoff=None):
+    """Send a request with the pooled session, retrying with exponential backoff
+
+    Connection errors, timeouts and responses with a status code in RETRY_STATUS_CODES are
+    retried
+
+    Args:
+        url (str): url
+        method (str): HTTP method
+        headers (dict): request headers
+        stream (bool): do not read the body before returning
+        retries (int): max number of retries, defaults to config.DOWNLOAD_RETRIES
+        backoff (float): seconds before the first retry, doubled on each retry, defaults to
+            config.DOWNLOAD_BACKOFF_SEC
+
+    Returns:
+        requests.Response: response of the last attempt
+
+    Raises:
+        requests.ConnectionError, requests.Timeout: if the last attempt failed to connect
+    """
+    retries = config.DOWNLOAD_RETRIES if retries is None else max(int(retries), 0)
+    delay = config.DOWNLOAD_BACKOFF_SEC if backoff is None else backoff
+    for attempt in range(retries + 1):
+        last_attempt = attempt == retries
+        try:
+            response = get_session().request(
+                method, url, headers=headers, stream=stream, timeout=config.DOWNLOAD_TIMEOUT_SEC
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if last_attempt:
+                raise
+            error = e
+        else:
+            if last_attempt or response.status_code not in RETRY_STATUS_CODES:
+                return response
+            error = f"status code {response.status_code}"
+            response.close()
+        log.warning(f"{method} {url} failed with {error}, retrying in {delay} seconds")
+        time.sleep(delay)
+        delay *= 2
+
+
+def download(url, outf, headers=None, part_size=None, workers=None):
+    """Download a remote file into a binary file-like object
+
+    If the server accepts range requests and the file has at least 2 parts, the parts are
+    downloaded by concurrent range requests and written at their offset as they arrive, so
+    outf must be seekable. Otherwise the file is streamed.
+
+    Args:
+        url (str): url
+        outf (file-like): binary output, written from its current position
+        headers (dict): headers of a HEAD request of url, if any, to skip probing url
+        part_size (int): bytes per range request, defaults to config.DOWNLOAD_PART_SIZE
+        workers (int): concurrent range requests, defaults to config.DOWNLOAD_WORKERS
+
+    Returns:
+        int: number of bytes written
+
+    Raises:
+        requests.HTTPError: if the server responded with an error
+    """
+    part_size = max(int(part_size or config.DOWNLOAD_PART_SIZE), 1)
+    workers = max(int(workers or config.DOWNLOAD_WORKERS), 1)
+    response = None
+    if headers is None:
+        response = request(url, stream=True)
+        response.raise_for_status()
+        headers = response.headers
+
+    content_length = int(headers.get("Content-Length", -1))
+    accepts_ranges = headers.get("Accept-Ranges", "none").lower() == "bytes"
+    if not accepts_ranges or content_length < 2 * part_size or workers == 1:
+        if response is None:
+            response = request(url, stream=True)
+            response.raise_for_status()
+        with response:
+            num_bytes = 0
+            for chunk in response.iter_content(config.DOWNLOAD_CHUNK_SIZE):
+                outf.write(chunk)
+                num_bytes += len(chunk)
+        return num_bytes
+
+    if response is not None:
+        response.close()
+    log.debug(f"Downloading {url} with {workers} concurrent range requests")
+    offset = outf.tell()
+    lock = threading.Lock()
+
+    def download_part(start):
+        end = min(start + part_size, content_length) - 1
+        with request(url, headers={"Range": f"bytes={start}-{end}"}, stream=True) as part:
+            part.raise_for_status()
+            if part.status_code != 206:
+                raise IOError(f"Range request {start}-{end} of {url} is not supported")
+            pos = start
+            for chunk in part.iter_content(config.DOWNLOAD_CHUNK_SIZE):
+                with lock:
+                    outf.seek(offset + pos)
+                    outf.write(chunk)
+                pos += len(chunk)
+        if pos != end + 1:
+            raise IOError(f"Incomplete response to range request {start}-{end} of {url}")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in executor.map(download_part, range(0, content_length, part_size)):
+            pass
+    outf.seek(offset + content_length)
+    return content_length
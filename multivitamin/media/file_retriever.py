@@ -1,11 +1,12 @@
 import os
-import requests
 import magic
 from io import BytesIO
 import urllib.parse
 import glog as log
 from imohash import hashfileobject
 from .http_fileobj import HTTPFile
+from .downloader import download, request
+from .cache import get_media_cache
 
 
 class FileRetriever:
@@ -22,6 +23,7 @@ class FileRetriever:
         self._is_local = None
         self._content_type = None
         self._hash = None
+        self._headers = None
         if url is not None:
             self.url = url
 
@@ -33,6 +35,8 @@ class FileRetriever:
     @url.setter
     def url(self, value):
         self._content_type = None
+        self._hash = None
+        self._headers = None
         url_scheme = urllib.parse.urlparse(value).scheme
 
         self._url = value
@@ -60,13 +64,34 @@ class FileRetriever:
         return False
 
     def _does_remote_file_exist(self):
+        if self._headers is not None:
+            return True
         try:
-            requests.head(self.url)
+            response = request(self.url, method="HEAD")
         except Exception as e:
             log.warning("Failed to retrieve url: {}".format(e))
             return False
+        if not response.ok:
+            log.warning(f"Failed to retrieve url: {self.url}, status code {response.status_code}")
+            return False
+        self._headers = response.headers
         return True
 
+    @property
+    def headers(self):
+        """Get the headers of the HEAD request of a remote file.
+
+        The file is probed once per url, and existence, content type, length, ETag and
+        range support are all read from that probe.
+
+        Returns:
+            dict: headers, or None if the file is local or the probe failed
+
+        """
+        if self.is_remote and self.exists:
+            return self._headers
+        return None
+
     @property
     def filepath(self):
         """Get the local filepath.
@@ -86,8 +111,7 @@ class FileRetriever:
             self._content_type = mime.from_file(self.filepath)
 
         if self._content_type is None and self.is_remote and self.exists:
-            resp = requests.head(self.url)
-            self._content_type = resp.headers["Content-Type"]
+            self._content_type = self._headers.get("Content-Type")
 
         return self._content_type
 
@@ -101,6 +125,24 @@ class FileRetriever:
         """Check if file is remote."""
         return not self.is_local if isinstance(self.is_local, bool) else False
 
+    @property
+    def content_length(self):
+        """Get the size of the file in bytes, or None if unknown."""
+        if self.is_local:
+            return os.path.getsize(self.filepath)
+        headers = self.headers
+        if headers is None or "Content-Length" not in headers:
+            return None
+        return int(headers["Content-Length"])
+
+    @property
+    def accepts_ranges(self):
+        """Check if the file can be read by byte ranges."""
+        if self.is_local:
+            return True
+        headers = self.headers
+        return headers is not None and headers.get("Accept-Ranges", "none").lower() == "bytes"
+
     @property
     def filename(self):
         """Get the filename of the url."""
@@ -110,11 +152,40 @@ class FileRetriever:
     def hash(self):
         """Get quick hash of file bytes."""
         if self._hash is None:
-            filelike = HTTPFile(self.url)
+            # imohash reads a few small samples, reading ahead would only add traffic
+            filelike = HTTPFile(self.url, read_ahead=0, headers=self.headers)
             self._hash = hashfileobject(filelike, hexdigest=True)
 
         return self._hash
 
+    @property
+    def version(self):
+        """Get the ETag of a remote file, or its quick hash if the server sends no ETag."""
+        headers = self.headers
+        if headers is not None and headers.get("ETag"):
+            return headers["ETag"]
+        return self.hash
+
+    def cached_filepath(self):
+        """Get a local filepath of the file, downloading remote files into the media cache.
+
+        Returns:
+            str: filepath, or None if the file is remote and the media cache is disabled
+
+        """
+        if self.is_local:
+            return self.filepath
+
+        cache = get_media_cache()
+        if cache is None:
+            return None
+        key = cache.key(self.url, self.version)
+        path = cache.get(key)
+        if path is None:
+            log.info(f"Downloading {self.url} into the media cache")
+            path = cache.put(key, lambda f: download(self.url, f, headers=self.headers))
+        return path
+
     def download(self, filepath=None, return_filelike=False):
         """Download file to filepath.
 
@@ -129,9 +200,19 @@ class FileRetriever:
                             (only if return_filelike is True)
         """
 
+        filelike_obj = None
         if self.is_remote:
-            response = requests.get(self.url)
-            filelike_obj = BytesIO(response.content)
+            cached_filepath = self.cached_filepath()
+            if cached_filepath is not None:
+                try:
+                    with open(cached_filepath, "rb") as f:
+                        filelike_obj = BytesIO(f.read())
+                except OSError as e:  # e.g. evicted by another process before it was read
+                    log.warning(f"Failed to read {self.url} from the media cache: {e}")
+            if filelike_obj is None:
+                filelike_obj = BytesIO()
+                download(self.url, filelike_obj, headers=self.headers)
+                filelike_obj.seek(0)
         else:
             with open(self.filepath, "rb") as f:
                 filelike_obj = BytesIO(f.read())
@@ -4,16 +4,17 @@ https://github.com/valgur/pyhttpio
 """
 
 import cgi
-import time
-import urllib.request
 from io import IOBase
-from sys import stderr
+
+from . import config
+from .downloader import request
 
 
 class HTTPFile(IOBase):
     """Turns URLs into Filelike objects."""
 
-    def __init__(self, url, name=None, repeat_time=-1, debug=False):
+    def __init__(self, url, name=None, repeat_time=-1, debug=False, read_ahead=None,
+                 retries=None, headers=None):
         """Allow a file accessible via HTTP to be used like a local file by
         utilities that use `seek()` to read arbitrary parts of the file, such
         as `ZipFile`. Seeking is done via the 'range: bytes=xx-yy' HTTP header.
@@ -26,31 +27,47 @@ class HTTPFile(IOBase):
             The filename of the file.
             Will be filled from the Content-Disposition header if not provided.
         repeat_time : int, optional
-            In case of HTTP errors wait `repeat_time` seconds before trying
-            again.
-            Negative value or `None` disables retrying and simply passes on
-            the exception (the default).
+            Seconds to wait before the first retry, doubled on each retry.
+            Negative value or `None` uses config.DOWNLOAD_BACKOFF_SEC (the
+            default).
+        read_ahead : int, optional
+            Minimum number of bytes fetched by each request, so small
+            sequential reads are served from a buffer. Defaults to
+            config.HTTPFILE_READ_AHEAD, 0 disables reading ahead.
+        retries : int, optional
+            Number of retries of failed requests. Defaults to
+            config.DOWNLOAD_RETRIES.
+        headers : dict, optional
+            Headers of a HEAD request of the URL, if already known, so the
+            file is not probed again.
         """
         super().__init__()
         self.url = url
         self.name = name
         self.repeat_time = repeat_time
         self.debug = debug
+        self.read_ahead = config.HTTPFILE_READ_AHEAD if read_ahead is None else read_ahead
+        self.retries = retries
+        self._backoff = None if repeat_time is None or repeat_time < 0 else repeat_time
         self._pos = 0
         self._seekable = True
-        with self._urlopen() as f:
-            if self.debug:
-                print(f.getheaders())
-            self.content_length = int(f.getheader("Content-Length", -1))
-            if self.content_length < 0:
-                self._seekable = False
-            if f.getheader("Accept-Ranges", "none").lower() != "bytes":
-                self._seekable = False
-            if name is None:
-                header = f.getheader("Content-Disposition")
-                if header:
-                    value, params = cgi.parse_header(header)
-                    self.name = params.get("filename")
+        self._buffer = b""
+        self._buffer_start = 0
+        if headers is None:
+            with self._request(stream=True) as f:
+                headers = f.headers
+        if self.debug:
+            print(headers)
+        self.content_length = int(headers.get("Content-Length", -1))
+        if self.content_length < 0:
+            self._seekable = False
+        if headers.get("Accept-Ranges", "none").lower() != "bytes":
+            self._seekable = False
+        if name is None:
+            header = headers.get("Content-Disposition")
+            if header:
+                value, params = cgi.parse_header(header)
+                self.name = params.get("filename")
 
     def seek(self, offset, whence=0):
         if not self.seekable():
@@ -77,13 +94,17 @@ class HTTPFile(IOBase):
         if self._pos >= self.content_length:
             return b""
         if amt < 0:
-            end = self.content_length - 1
+            end = self.content_length
         else:
-            end = min(self._pos + amt - 1, self.content_length - 1)
-        byte_range = (self._pos, end)
-        self._pos = end + 1
-        with self._urlopen(byte_range) as f:
-            return f.read()
+            end = min(self._pos + amt, self.content_length)
+        buffer_end = self._buffer_start + len(self._buffer)
+        if self._pos < self._buffer_start or end > buffer_end:
+            fetch_end = min(max(end, self._pos + self.read_ahead), self.content_length)
+            self._buffer = self._request((self._pos, fetch_end - 1)).content
+            self._buffer_start = self._pos
+        data = self._buffer[self._pos - self._buffer_start:end - self._buffer_start]
+        self._pos = end
+        return data
 
     def readall(self):
         return self.read(-1)
@@ -108,17 +129,12 @@ class HTTPFile(IOBase):
         else:
             return attr
 
-    def _urlopen(self, byte_range=None):
+    def _request(self, byte_range=None, stream=False):
         header = {}
         if byte_range:
             header = {"range": "bytes={}-{}".format(*byte_range)}
-        while True:
-            try:
-                r = urllib.request.Request(self.url, headers=header)
-                return urllib.request.urlopen(r)
-            except urllib.error.HTTPError as e:
-                if self.repeat_time is None or self.repeat_time < 0:
-                    raise
-                print("Server responded with " + str(e), file=stderr)
-                print("Sleeping for {} seconds before trying again".format(self.repeat_time), file=stderr)
-                time.sleep(self.repeat_time)
+        response = request(
+            self.url, headers=header, stream=stream, retries=self.retries, backoff=self._backoff
+        )
+        response.raise_for_status()
+        return response
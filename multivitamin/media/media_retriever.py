@@ -1,13 +1,131 @@
+import os
 import sys
+import mmap
+import cv2
 import numpy as np
 from PIL import Image
 import glog as log
 import math
 from abc import ABC, abstractmethod
 from .file_retriever import FileRetriever
+from . import config
 
 FRAME_EPS = 0.001
 DECIMAL_SIGFIG = 3
+# BGR like video frames, without applying EXIF orientation, as PIL.Image.open does not
+IMREAD_FLAGS = cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION
+# Decoded at 1/8, 1/4 or 1/2 scale, by the JPEG decoder itself
+REDUCED_IMREAD_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8 | cv2.IMREAD_IGNORE_ORIENTATION),
+    (4, cv2.IMREAD_REDUCED_COLOR_4 | cv2.IMREAD_IGNORE_ORIENTATION),
+    (2, cv2.IMREAD_REDUCED_COLOR_2 | cv2.IMREAD_IGNORE_ORIENTATION),
+)
+INTERPOLATION = cv2.INTER_AREA
+
+
+def imdecode(buffer, flags=IMREAD_FLAGS):
+    """Decode an encoded image to a BGR array
+
+    Args:
+        buffer (bytes-like): encoded image, e.g. bytes, memoryview or mmap
+        flags (int): cv2.imdecode flags
+
+    Returns:
+        np.ndarray: HxWx3 BGR image, or None if OpenCV cannot decode it
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    try:
+        if data.size == 0:
+            return None
+        return cv2.imdecode(data, flags)
+    finally:
+        del data  # release the buffer, so an mmap can be closed
+
+
+def imread_mmap(filepath, flags=IMREAD_FLAGS):
+    """Decode an image file to a BGR array, memory mapping the file instead of reading it
+
+    Args:
+        filepath (str): path of the image
+        flags (int): cv2.imdecode flags
+
+    Returns:
+        np.ndarray: HxWx3 BGR image, or None if OpenCV cannot decode it
+    """
+    with open(filepath, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return imdecode(mm, flags)
+
+
+def scaled_size(w, h, target_size):
+    """Get the size of a frame downscaled to cover target_size, keeping its aspect ratio
+
+    Frames already smaller than target_size in one dimension are never upscaled.
+
+    Args:
+        w (int): width of the frame
+        h (int): height of the frame
+        target_size (tuple[int]): (height, width) to cover
+
+    Returns:
+        tuple[int]: (width, height) of the downscaled frame
+    """
+    th, tw = target_size
+    scale = max(th / h, tw / w)
+    if scale >= 1:
+        return w, h
+    return max(int(round(w * scale)), tw), max(int(round(h * scale)), th)
+
+
+def resize_frame(frame, target_size, interpolation=INTERPOLATION):
+    """Downscale a frame to cover target_size, keeping its aspect ratio
+
+    The frame is halved while it is at least twice the downscaled size, bilinear
+    interpolation at exactly half size averaging 2x2 pixels, and only the remaining factor
+    of less than 2 uses interpolation. Resizing a 4K frame in one go with INTER_AREA is
+    several times slower.
+
+    Args:
+        frame (np.ndarray): HxWxC frame
+        target_size (tuple[int]): (height, width) to cover, None to keep the frame as is
+        interpolation (int): cv2 interpolation flag
+
+    Returns:
+        np.ndarray: frame, resized if it is bigger than target_size
+    """
+    if target_size is None or frame is None:
+        return frame
+    h, w = frame.shape[:2]
+    size = scaled_size(w, h, target_size)
+    if size == (w, h):
+        return frame
+    while w >= 2 * size[0] and h >= 2 * size[1]:
+        w, h = w // 2, h // 2
+        frame = cv2.resize(frame, (w, h), interpolation=cv2.INTER_LINEAR)
+    if (w, h) == size:
+        return frame
+    return cv2.resize(frame, size, interpolation=interpolation)
+
+
+def reduced_imread_flags(w, h, target_size):
+    """Get the imdecode flags decoding an image at the smallest 1/2, 1/4 or 1/8 scale that
+    still covers target_size
+
+    Args:
+        w (int): width of the image
+        h (int): height of the image
+        target_size (tuple[int]): (height, width) to cover
+
+    Returns:
+        int: cv2.imdecode flags
+    """
+    th, tw = target_size
+    for factor, flags in REDUCED_IMREAD_FLAGS:
+        if w // factor >= tw and h // factor >= th:
+            return flags
+    return IMREAD_FLAGS
 
 
 class AbstractMediaRetriever(FileRetriever, ABC):
@@ -22,16 +140,22 @@ class AbstractMediaRetriever(FileRetriever, ABC):
         """
         self._cap = None
         self._image = None
+        self._encoded_image = None
         self._shape = None
 
         super(AbstractMediaRetriever, self).__init__(url=url)
 
     @FileRetriever.url.setter
     def url(self, value):
-        """Set the image/video url."""
+        """Set the image/video url.
+
+        Only the metadata probe of the file is done here, its shape is probed on first use
+        by get_w_h.
+        """
         FileRetriever.url.fset(self, value)
         self._cap = None
         self._image = None
+        self._encoded_image = None
         self._shape = None
         if not self.is_image and not self.is_video:
             raise ValueError(
@@ -40,12 +164,6 @@ class AbstractMediaRetriever(FileRetriever, ABC):
                 )
             )
 
-        w, h = self.get_w_h()
-        if w in [0, None] or h in [0, None]:
-            raise ValueError(
-                "Unable to load visial media properly: {}".format(self.url)
-            )
-
     @property
     @abstractmethod
     def is_video(self):
@@ -70,6 +188,19 @@ class AbstractMediaRetriever(FileRetriever, ABC):
     def _create_video_capture(self):
         pass
 
+    def _get_capture_url(self):
+        """Get the url to open the video capture with, the media cache file of remote videos
+        if config.MEDIA_CACHE_VIDEOS is set"""
+        if self.is_remote and config.MEDIA_CACHE_VIDEOS:
+            try:
+                cached_filepath = self.cached_filepath()
+            except Exception as e:
+                log.warning(f"Failed to cache {self.url}, streaming it: {e}")
+                cached_filepath = None
+            if cached_filepath is not None:
+                return cached_filepath
+        return self.url
+
     @property
     def fps(self):
         """Get the fps of the image/video."""
@@ -119,7 +250,7 @@ class AbstractMediaRetriever(FileRetriever, ABC):
         """Get height by width by channels for frames."""
         if self._shape is None:
             if self.is_image:
-                self._shape = self.image.shape
+                self._shape = self._get_image_shape()
 
             if self.is_video:
                 self._shape = self._get_video_frame_shape()
@@ -137,22 +268,122 @@ class AbstractMediaRetriever(FileRetriever, ABC):
     def image(self):
         """Get the image.
 
+        Local and media cached images are decoded by OpenCV from a memory map of the file,
+        straight to BGR. PIL is the fallback for formats OpenCV does not decode.
+
         Return `None` if it's a video.
 
         """
         if not self.is_image:
             return None
 
-        if self._image is not None:
-            return self._image
+        if self._image is None:
+            self._image = self._decode_image()
+            self._encoded_image = None
+        return self._image
+
+    def get_image(self, target_size=None, interpolation=INTERPOLATION):
+        """Get the image, downscaled to cover target_size.
+
+        Unless the full size image was already decoded, JPEGs are decoded at 1/2, 1/4 or
+        1/8 scale by the decoder, and the downscaled image is not cached.
+
+        Args:
+            target_size (tuple[int] | optional): (height, width) to cover, keeping the aspect
+                ratio. Images are never upscaled
+            interpolation (int | optional): cv2 interpolation flag
+
+        Returns:
+            np.ndarray: BGR image, or `None` if it's a video
+
+        """
+        if not self.is_image:
+            return None
+
+        if target_size is None or self._image is not None:
+            return resize_frame(self.image, target_size, interpolation)
+
+        w, h = self.get_w_h()
+        image = self._decode_image(reduced_imread_flags(w, h, target_size))
+        return resize_frame(image, target_size, interpolation)
+
+    def _get_encoded_image(self):
+        """Get the encoded image.
 
-        filelike_obj = self.download(return_filelike=True)
+        Returns:
+            str: path of the local or media cached file, or None
+            BytesIO: downloaded image, if there is no such file
+
+        """
+        if self.is_local:
+            return self.filepath, None
+
+        if self._encoded_image is None:
+            try:
+                filepath = self.cached_filepath()
+            except OSError as e:
+                log.warning(f"Failed to cache {self.url}, downloading it: {e}")
+                filepath = None
+            if filepath is not None:
+                return filepath, None
+            # Kept until the image is decoded, so it is downloaded once
+            self._encoded_image = self.download(return_filelike=True)
+        return None, self._encoded_image
+
+    def _get_image_shape(self):
+        """Get the shape of the image from its header, without decoding it."""
+        if self._image is None:
+            filepath, filelike_obj = self._get_encoded_image()
+            try:
+                with Image.open(filepath or filelike_obj) as image:
+                    w, h = image.size
+                return (h, w, 3)
+            except Exception as e:
+                log.debug(f"Failed to read the size of {self.url} from its header: {e}")
+        return self.image.shape
+
+    def _decode_image(self, flags=IMREAD_FLAGS):
+        """Decode the image to BGR with OpenCV, or PIL as a fallback.
+
+        Args:
+            flags (int | optional): cv2.imdecode flags
+
+        Returns:
+            np.ndarray: HxWx3 BGR image
+
+        """
+        filepath, filelike_obj = self._get_encoded_image()
+        image = None
+        if filepath is not None:
+            try:
+                image = imread_mmap(filepath, flags)
+            except OSError as e:  # e.g. evicted by another process before it was read
+                log.warning(f"Failed to read {filepath}: {e}")
+        else:
+            image = imdecode(filelike_obj.getbuffer(), flags)
+        if image is None:
+            log.debug(f"OpenCV cannot decode {self.url}, decoding it with PIL")
+            image = self._decode_image_pil(filelike_obj)
+        return image
+
+    def _decode_image_pil(self, filelike_obj=None):
+        """Decode the image with PIL, for formats OpenCV does not support.
+
+        Args:
+            filelike_obj (file-like | optional): downloaded image, downloaded again if None
+
+        Returns:
+            np.ndarray: HxWx3 BGR image
+
+        """
+        if filelike_obj is None:
+            filelike_obj = self.download(return_filelike=True)
+        filelike_obj.seek(0)
         image = np.array(Image.open(filelike_obj).convert('RGB'))
         if image.shape[2] > 3:
             log.warning("Image has >3 channels. Cropping to 3.")
             image = image[:, :, :3]
-        self._image = image[:, :, ::-1].copy()
-        return self._image
+        return image[:, :, ::-1].copy()
 
     def tstamp_to_frame_index(self, tstamp):
         """Convert a timestamp to a frame index.
@@ -193,7 +424,13 @@ class AbstractMediaRetriever(FileRetriever, ABC):
         pass
 
     def get_frames_iterator(
-        self, sample_rate=100.0, start_tstamp=0.0, end_tstamp=sys.maxsize
+        self,
+        sample_rate=100.0,
+        start_tstamp=0.0,
+        end_tstamp=sys.maxsize,
+        target_size=None,
+        interpolation=INTERPOLATION,
+        **kwargs
     ):
         """Get a frames iterator.
 
@@ -208,6 +445,10 @@ class AbstractMediaRetriever(FileRetriever, ABC):
             sample_rate (float): sample rate for extracting frames from video
             start_tstamp (float): starting timestamp for iteration
             end_tstamp (float): ending timestamp for iteration
+            target_size (tuple[int]): (height, width) frames are downscaled to cover as they
+                are decoded, keeping their aspect ratio, None for full size frames
+            interpolation (int): cv2 interpolation flag used to downscale frames
+            kwargs: options specific to the frames iterator class of the retriever
 
         Returns:
             iterator
@@ -220,7 +461,7 @@ class AbstractMediaRetriever(FileRetriever, ABC):
             raise ValueError('URL not set. Please use med_ret.set_url("...")')
 
         if self.is_image:
-            return [(self.image, 0.00)]
+            return [(self.get_image(target_size, interpolation), 0.00)]
 
         elif self.is_video:
             fi = self._get_frames_iterator_class()
@@ -228,7 +469,10 @@ class AbstractMediaRetriever(FileRetriever, ABC):
                       self.fps,
                       sample_rate,
                       start_tstamp,
-                      end_tstamp)
+                      end_tstamp,
+                      target_size=target_size,
+                      interpolation=interpolation,
+                      **kwargs)
 
     def get_length(self):
         """Get the temporal length of the image/video."""
@@ -243,8 +487,18 @@ class AbstractMediaRetriever(FileRetriever, ABC):
         return self.fps
 
     def get_w_h(self):
-        """Get the width and height the visual media."""
-        return self.shape[0:2][::-1]
+        """Get the width and height the visual media.
+
+        Raises:
+            ValueError: if the media cannot be decoded
+
+        """
+        w, h = self.shape[0:2][::-1]
+        if w in [0, None] or h in [0, None]:
+            raise ValueError(
+                "Unable to load visial media properly: {}".format(self.url)
+            )
+        return w, h
 
 
 class AbstractFramesIterator(ABC):
@@ -264,7 +518,9 @@ class AbstractFramesIterator(ABC):
                  video_fps,
                  sample_rate=100.0,
                  start_tstamp=0.0,
-                 end_tstamp=sys.maxsize):
+                 end_tstamp=sys.maxsize,
+                 target_size=None,
+                 interpolation=INTERPOLATION):
         """Frames iterator constructor.
 
         Args:
@@ -273,9 +529,14 @@ class AbstractFramesIterator(ABC):
             sample_rate (float): rate to sample video
             start_tstamp (float): start time for iterating
             end_tstamp (float): end time condition for iterating
+            target_size (tuple[int]): (height, width) frames are downscaled to cover, None
+                for full size frames
+            interpolation (int): cv2 interpolation flag used to downscale frames
 
         """
         self.cap = video_cap
+        self.target_size = target_size
+        self.interpolation = interpolation
         self.period = max(1.0 / sample_rate, 1.0 / video_fps)
         log.debug("Period: {}".format(self.period))
         self.start_tstamp = start_tstamp
@@ -312,7 +573,7 @@ class AbstractFramesIterator(ABC):
         while ret and self.cur_tstamp <= self.end_tstamp:
             ret, frame, tstamp = self._get_next_frame()
             if ret:
-                return frame, tstamp
+                return resize_frame(frame, self.target_size, self.interpolation), tstamp
 
         log.info("No more frames to read")
         raise StopIteration()
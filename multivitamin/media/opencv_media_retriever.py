@@ -1,8 +1,14 @@
 import cv2
+import glog as log
+import math
 import sys
 
 from .media_retriever import AbstractMediaRetriever, AbstractFramesIterator
-from .media_retriever import FRAME_EPS
+from .media_retriever import FRAME_EPS, INTERPOLATION
+
+STRATEGIES = ("auto", "grab", "seek")
+STRATEGY = "auto"
+GOP_SIZE = 250
 
 
 class OpenCVMediaRetriever(AbstractMediaRetriever):
@@ -34,7 +40,7 @@ class OpenCVMediaRetriever(AbstractMediaRetriever):
     def _create_video_capture(self):
         """Get the used video capture."""
         if self.is_video:
-            self._cap = cv2.VideoCapture(self.url, cv2.CAP_FFMPEG)
+            self._cap = cv2.VideoCapture(self._get_capture_url(), cv2.CAP_FFMPEG)
 
         return self._cap
 
@@ -47,11 +53,21 @@ class OpenCVMediaRetriever(AbstractMediaRetriever):
         return self.video_capture.get(cv2.CAP_PROP_FRAME_COUNT)
 
     def _get_video_frame_shape(self):
-        """Get height by width by channels for frames."""
-        if not self.video_capture.isOpened():
-            self.video_capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        """Get height by width by channels for frames.
+
+        Read from the stream header, so no frame is decoded and the cursor does not move,
+        unless the container does not report the frame size.
+        """
+        w = int(self.video_capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        h = int(self.video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if w > 0 and h > 0:
+            return (h, w, 3)
 
+        pos = self.video_capture.get(cv2.CAP_PROP_POS_FRAMES)
         f = self.get_frame()
+        self.video_capture.set(cv2.CAP_PROP_POS_FRAMES, pos)
+        if f is False:
+            return None
         return f.shape
 
     def _get_frame_from_video(self, tstamp):
@@ -75,6 +91,19 @@ class OpenCVFramesIterator(AbstractFramesIterator):
     for frame, tstamp in frames_iter:
         do_something(frame)
 
+    Sampling strategies:
+        "grab": skip unused frames with cap.grab(), which demuxes but does not convert them
+        "seek": jump to the next sampled tstamp with cap.set(CAP_PROP_POS_MSEC). Each seek
+            decodes from the previous keyframe, so it only pays off when the gap between
+            sampled frames is larger than the GOP
+        "auto": "seek" if the frames skipped between samples span at least gop_size frames,
+            "grab" otherwise
+
+    If tstamps is given, only the frames at those tstamps are decoded, in increasing order,
+    and sample_rate is ignored. The iterator seeks to a tstamp when it is behind the cursor or
+    at least gop_size frames ahead of it, and grabs forward otherwise. Requested tstamps are
+    yielded as is, so they can be used as keys of a previous response.
+
     """
 
     def __init__(self,
@@ -82,7 +111,12 @@ class OpenCVFramesIterator(AbstractFramesIterator):
                  video_fps,
                  sample_rate=100.0,
                  start_tstamp=0.0,
-                 end_tstamp=sys.maxsize):
+                 end_tstamp=sys.maxsize,
+                 strategy=STRATEGY,
+                 gop_size=GOP_SIZE,
+                 tstamps=None,
+                 target_size=None,
+                 interpolation=INTERPOLATION):
         """Frames iterator constructor.
 
         Args:
@@ -90,20 +124,89 @@ class OpenCVFramesIterator(AbstractFramesIterator):
             sample_rate (float): rate to sample video
             start_tstamp (float): start time for iterating
             end_tstamp (float): end time condition for iterating
+            strategy (str): one of "auto", "grab" or "seek"
+            gop_size (int): keyframe interval, in frames, assumed when choosing to seek
+            tstamps (list[float]): only decode the frames at these tstamps
+            target_size (tuple[int]): (height, width) frames are downscaled to cover, None
+                for full size frames
+            interpolation (int): cv2 interpolation flag used to downscale frames
 
         """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"strategy must be one of {STRATEGIES}, got {strategy}")
         super(OpenCVFramesIterator, self).__init__(video_cap,
                                                    video_fps=video_fps,
                                                    sample_rate=sample_rate,
                                                    start_tstamp=start_tstamp,
-                                                   end_tstamp=end_tstamp)
+                                                   end_tstamp=end_tstamp,
+                                                   target_size=target_size,
+                                                   interpolation=interpolation)
+        # Stay 2 frames short of the next sample, so the tstamp check below picks it
+        self.frames_to_skip = max(int(math.ceil((self.period - FRAME_EPS) * video_fps)) - 2, 0)
+        if strategy == "auto":
+            strategy = "seek" if self.frames_to_skip >= gop_size else "grab"
+        self.strategy = strategy
+        self.gop_size = gop_size
+        self.fps = video_fps
+        self.tstamps = None
+        if tstamps is not None:
+            self.tstamps = sorted(t for t in set(tstamps) if start_tstamp <= t <= end_tstamp)
+        self._next_tstamp_idx = 0
+        log.debug(f"Sampling strategy: {self.strategy}, frames to skip: {self.frames_to_skip}")
+
+    def __iter__(self):
+        """Iterate over frames."""
+        self._next_tstamp_idx = 0
+        return super(OpenCVFramesIterator, self).__iter__()
 
     def _move_cursor_to_tstamp(self, tstamp):
         """Iterate over frames."""
         self.cap.set(cv2.CAP_PROP_POS_MSEC, tstamp * 1000)
 
+    def _skip_to_next_sample(self):
+        """Move the cursor close to the next sampled frame without decoding it
+
+        Returns:
+            bool: False if the end of the video was reached
+        """
+        if self.first_frame or self.frames_to_skip == 0:
+            return True
+        next_tstamp = self.cur_tstamp + self.period
+        if next_tstamp > self.end_tstamp:
+            return False
+        if self.strategy == "seek":
+            self._move_cursor_to_tstamp(next_tstamp)
+            return True
+        for _ in range(self.frames_to_skip):
+            if not self.cap.grab():
+                return False
+        return True
+
+    def _get_next_targeted_frame(self):
+        """Get the frame at the next requested tstamp"""
+        if self._next_tstamp_idx >= len(self.tstamps):
+            return False, None, None
+        target = self.tstamps[self._next_tstamp_idx]
+        self._next_tstamp_idx += 1
+
+        pos = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        if target < pos - FRAME_EPS or (target - pos) * self.fps >= self.gop_size:
+            self._move_cursor_to_tstamp(target)
+            pos = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        self.first_frame = False
+
+        while self.cap.grab():
+            if pos + FRAME_EPS >= target:
+                ret, frame = self.cap.retrieve()
+                self.cur_tstamp = target
+                return ret, frame, target
+            pos = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        return False, None, None
+
     def _get_next_frame(self):
-        ret = True
+        if self.tstamps is not None:
+            return self._get_next_targeted_frame()
+        ret = self._skip_to_next_sample()
         while ret and self.cur_tstamp <= self.end_tstamp:
             tstamp = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
             ret = self.cap.grab()
@@ -2,10 +2,19 @@ import sys
 import pims
 import numpy as np
 from .media_retriever import AbstractMediaRetriever, AbstractFramesIterator
+from .media_retriever import DECIMAL_SIGFIG, INTERPOLATION
 
 
 class PIMSMediaRetriever(AbstractMediaRetriever):
-    """A fileretriever for visual media."""
+    """A random-access fileretriever for visual media.
+
+    Frames of a video can be indexed directly, which is cheap for sparse and
+    out-of-order access:
+
+    frames = med_ret[[10, 3, 250]]  # np.ndarray of BGR frames, in the given order
+    frames, tstamps = med_ret.get_frames([0.4, 12.0, 3.2])
+
+    """
 
     def __init__(self, url=None):
         """Init MediaRetriever.
@@ -14,7 +23,14 @@ class PIMSMediaRetriever(AbstractMediaRetriever):
             url (str | optional): The local or remote url to a file
 
         """
-        super(AbstractMediaRetriever, self).__init__(url=url)
+        self._frame_tstamps = None
+        super(PIMSMediaRetriever, self).__init__(url=url)
+
+    @AbstractMediaRetriever.url.setter
+    def url(self, value):
+        """Set the image/video url."""
+        self._frame_tstamps = None
+        AbstractMediaRetriever.url.fset(self, value)
 
     @property
     def is_video(self):
@@ -33,7 +49,7 @@ class PIMSMediaRetriever(AbstractMediaRetriever):
     def _create_video_capture(self):
         """Get the used video capture."""
         if self._cap is None:
-            self._cap = pims.Video(self.url)
+            self._cap = pims.Video(self._get_capture_url())
 
         return self._cap
 
@@ -49,19 +65,102 @@ class PIMSMediaRetriever(AbstractMediaRetriever):
         shape = self.video_capture.frame_shape
         return shape
 
+    @property
+    def frame_tstamps(self):
+        """Get the tstamp of every frame, indexed by frame index."""
+        if self._frame_tstamps is None:
+            self._frame_tstamps = np.arange(self.total_frames) / float(self.fps)
+        return self._frame_tstamps
+
+    def tstamp_to_frame_index(self, tstamp):
+        """Convert a timestamp to a frame index.
+
+        Args:
+            tstamp (float | list[float]): Timestamps in seconds.
+
+        Returns:
+            int | np.ndarray: The nearest frame(s) to the tstamp(s), clipped to the video.
+
+        """
+        frame_idx = np.clip(np.rint(np.asarray(tstamp) * self.fps), 0, self.total_frames - 1)
+        frame_idx = frame_idx.astype(np.int64)
+        if frame_idx.ndim == 0:
+            return int(frame_idx)
+        return frame_idx
+
+    def frame_index_to_tstamp(self, frame_idx):
+        """Convert a frame index to a timestamp.
+
+        Args:
+            frame_idx (int | list[int]): Frame indexes.
+
+        Returns:
+            float | np.ndarray: The tstamp(s) of the frame(s) in seconds.
+
+        """
+        tstamp = self.frame_tstamps[frame_idx]
+        if np.ndim(tstamp) == 0:
+            return float(tstamp)
+        return tstamp
+
+    def __getitem__(self, key):
+        """Get BGR frames by frame index.
+
+        Args:
+            key (int | slice | list[int] | np.ndarray): Frame index or indexes.
+
+        Returns:
+            np.ndarray: A frame if key is an int, else a stack of frames in the order of key.
+
+        Raises:
+            IndexError: If an index is out of the video.
+
+        """
+        if not self.is_video:
+            raise TypeError("Only videos can be indexed by frame")
+
+        if isinstance(key, (int, np.integer)):
+            return np.asarray(self.video_capture[int(key)])[:, :, ::-1].copy()
+
+        if isinstance(key, slice):
+            key = range(*key.indices(self.total_frames))
+        indexes = np.asarray(key, dtype=np.int64).ravel()
+        if indexes.size == 0:
+            return np.empty((0,) + tuple(self.shape), dtype=np.uint8)
+
+        # Read each distinct frame once, in increasing order, so the decoder only moves forward
+        unique_indexes, inverse = np.unique(indexes, return_inverse=True)
+        frames = np.stack([np.asarray(self.video_capture[int(i)]) for i in unique_indexes])
+        frames = frames[:, :, :, ::-1]  # RGB to BGR, once for the whole batch
+        return np.ascontiguousarray(frames[inverse])
+
+    def get_frames(self, tstamps):
+        """Get the frames nearest to tstamps, in one batch.
+
+        Args:
+            tstamps (list[float]): Timestamps in seconds, in any order.
+
+        Returns:
+            np.ndarray: Stack of BGR frames, in the order of tstamps.
+            list[float]: The actual tstamps of the returned frames.
+
+        """
+        frame_idx = self.tstamp_to_frame_index(np.asarray(tstamps, dtype=np.float64).ravel())
+        frames = self[frame_idx]
+        tstamps = np.floor(self.frame_index_to_tstamp(frame_idx) * 100000.0) / 100000.0
+        return frames, np.round(tstamps, DECIMAL_SIGFIG).tolist()
+
     def _get_frame_from_video(self, tstamp=0.0):
         """Return frame if image, or get frame with timestamp in seconds (w/ demicals).
 
         Note: iterating using get_frames_iterator is significantly faster
 
         """
-        frame_idx = self.tstamp_to_frame_index(tstamp)
         ret = True
         frame = None
         try:
-            frame = self.video_capture[frame_idx]
-            frame = np.array(frame)[:, :, ::-1]  # RGB to BGR
-        except ValueError:
+            frame = self[self.tstamp_to_frame_index(tstamp)]
+        except (IndexError, ValueError):
             ret = False
 
         return ret, frame
@@ -71,46 +170,83 @@ class PIMSMediaRetriever(AbstractMediaRetriever):
 
 
 class PIMSFramesIterator(AbstractFramesIterator):
-    """Frames iterator object for videos."""
+    """Frames iterator object for videos.
+
+    If tstamps is given, only the frames nearest to those tstamps are read, in increasing
+    order, and sample_rate is ignored. Requested tstamps are yielded as is, so they can be
+    used as keys of a previous response.
+
+    """
 
     def __init__(self,
                  video_cap,
                  video_fps,
                  sample_rate=100.0,
                  start_tstamp=0.0,
-                 end_tstamp=sys.maxsize):
+                 end_tstamp=sys.maxsize,
+                 tstamps=None,
+                 target_size=None,
+                 interpolation=INTERPOLATION):
         """Frames iterator constructor.
 
         Args:
-            video_cap (cv2.VideoCapture): video capture obj
+            video_cap (pims.Video): video capture obj
             sample_rate (float): rate to sample video
             start_tstamp (float): start time for iterating
             end_tstamp (float): end time condition for iterating
+            tstamps (list[float]): only read the frames at these tstamps
+            target_size (tuple[int]): (height, width) frames are downscaled to cover, None
+                for full size frames
+            interpolation (int): cv2 interpolation flag used to downscale frames
 
         """
+        self.fps = video_fps
+        self.num_frames = len(video_cap)
+        self.tstamps = None
+        if tstamps is not None:
+            self.tstamps = sorted(t for t in set(tstamps) if start_tstamp <= t <= end_tstamp)
+        self._next_tstamp_idx = 0
         super(PIMSFramesIterator, self).__init__(video_cap,
                                                  video_fps=video_fps,
                                                  sample_rate=sample_rate,
                                                  start_tstamp=start_tstamp,
-                                                 end_tstamp=end_tstamp)
+                                                 end_tstamp=end_tstamp,
+                                                 target_size=target_size,
+                                                 interpolation=interpolation)
 
-    def _move_cursor_to_tstamp(self):
+    def __iter__(self):
         """Iterate over frames."""
-        pass
+        self._next_tstamp_idx = 0
+        return super(PIMSFramesIterator, self).__iter__()
+
+    def _move_cursor_to_tstamp(self, tstamp):
+        """Move the cursor to the frame nearest to tstamp."""
+        self.cur_tstamp = tstamp
+
+    def _get_next_targeted_frame(self):
+        """Get the frame nearest to the next requested tstamp."""
+        if self._next_tstamp_idx >= len(self.tstamps):
+            return False, None, None
+        target = self.tstamps[self._next_tstamp_idx]
+        self._next_tstamp_idx += 1
+        frame_idx = min(int(round(target * self.fps)), self.num_frames - 1)
+        try:
+            frame = np.asarray(self.cap[frame_idx])[:, :, ::-1]
+        except (IndexError, ValueError):
+            return False, None, None
+        self.cur_tstamp = target
+        return True, frame, target
 
     def _get_next_frame(self):
         """Get next frame."""
-        ret = True
-        frame = None
-        tstamp = None
+        if self.tstamps is not None:
+            return self._get_next_targeted_frame()
+        frame_idx = int(round(self.cur_tstamp * self.fps))
+        if frame_idx >= self.num_frames:
+            return False, None, None
         try:
-            frame_idx = round(self.cur_tstamp * self.cap.frame_rate)
-            frame = self.cap[frame_idx]
-            frame = np.array(frame)[:, :, ::-1]
-            self.cur_tstamp += self.period
-            tstamp = frame_idx / self.cap.frame_rate
-            return frame, self._round_tstamp(tstamp)
-        except ValueError:
-            ret = False
-
-        return ret, frame, tstamp
+            frame = np.asarray(self.cap[frame_idx])[:, :, ::-1]
+        except (IndexError, ValueError):
+            return False, None, None
+        self.cur_tstamp += self.period
+        return True, frame, self._round_tstamp(frame_idx / self.fps)
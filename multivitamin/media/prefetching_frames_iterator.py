@@ -0,0 +1,100 @@
+import threading
+from queue import Queue, Empty, Full
+
+import glog as log
+
+PREFETCH_BUFFER_SIZE = 32
+_POLL_SEC = 0.1
+
+
+class _End:
+    pass
+
+
+class _Error:
+    def __init__(self, exception):
+        self.exception = exception
+
+
+class PrefetchingFramesIterator:
+    """Frames iterator that decodes ahead of its consumer on a background thread.
+
+    Wraps any iterable of (frame, tstamp), e.g. a FramesIterator, so decoding overlaps with
+    whatever the consumer does with the frames. Decoded frames wait in a bounded buffer, so
+    at most buffer_size frames are held in memory.
+
+    Usage:
+    frames_iter = PrefetchingFramesIterator(med_ret.get_frames_iterator())
+    for frame, tstamp in frames_iter:
+        do_something(frame)
+    frames_iter.close()
+
+    """
+
+    def __init__(self, frames_iterator, buffer_size=PREFETCH_BUFFER_SIZE):
+        """Start decoding in the background.
+
+        Args:
+            frames_iterator (iterable): iterable of (frame, tstamp)
+            buffer_size (int): max number of decoded frames waiting to be consumed
+
+        """
+        self._buffer = Queue(maxsize=max(int(buffer_size), 1))
+        self._stop = threading.Event()
+        self._done = False
+        self._thread = threading.Thread(
+            target=self._decode, args=(frames_iterator,), daemon=True
+        )
+        self._thread.start()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        """Get next decoded frame."""
+        if self._done:
+            raise StopIteration()
+        item = self._buffer.get()
+        if isinstance(item, _End):
+            self._done = True
+            raise StopIteration()
+        if isinstance(item, _Error):
+            self._done = True
+            raise item.exception
+        return item
+
+    def close(self):
+        """Stop decoding and release buffered frames."""
+        self._stop.set()
+        self._done = True
+        while self._thread.is_alive():
+            try:
+                self._buffer.get(timeout=_POLL_SEC)
+            except Empty:
+                pass
+        self._thread.join()
+
+    def _decode(self, frames_iterator):
+        try:
+            for item in frames_iterator:
+                if not self._put(item):
+                    return
+        except Exception as e:
+            log.error(f"Error decoding frames: {e}")
+            self._put(_Error(e))
+            return
+        self._put(_End())
+
+    def _put(self, item):
+        """Put an item in the buffer, waiting for space unless close() is called
+
+        Returns:
+            bool: False if close() was called
+        """
+        while not self._stop.is_set():
+            try:
+                self._buffer.put(item, timeout=_POLL_SEC)
+                return True
+            except Full:
+                continue
+        return False
@@ -2,3 +2,4 @@ from .module import Module
 from .codes import Codes
 from .imagesmodule import ImagesModule
 from .propertiesmodule import PropertiesModule
+from .data_parallel import DataParallelImagesModule
@@ -0,0 +1,293 @@
+import sys
+import copy
+import queue
+import threading
+
+import glog as log
+
+from multivitamin.module.imagesmodule import ImagesModule
+from multivitamin.utils.GPUUtilities import GPUUtility
+
+NUM_CPU_REPLICAS = 1
+GPU_LIMIT = sys.maxsize
+
+_STOP = object()
+
+
+def select_devices(num_cpu_replicas=NUM_CPU_REPLICAS, **gpukwargs):
+    """Select the devices of the replicas of a DataParallelImagesModule
+
+    Args:
+        num_cpu_replicas (int): number of CPU replicas if no GPU qualifies
+        gpukwargs: GPUUtility selection policy, e.g. priority, minFreeMemoryMb, ignoreIDs.
+            limit defaults to every qualifying GPU
+
+    Returns:
+        list: GPU ids, or num_cpu_replicas times None if no GPU qualifies
+    """
+    gpukwargs.setdefault("limit", GPU_LIMIT)
+    gpus = list(GPUUtility(**gpukwargs).get_gpus())
+    if gpus:
+        return gpus
+    log.warning(f"No GPU available, creating {num_cpu_replicas} CPU replica(s)")
+    return [None] * num_cpu_replicas
+
+
+class _ResponseShard:
+    """Response seen by a replica while it processes a batch
+
+    Appends are recorded, and replayed on the response by the main thread in batch order,
+    so the response is only written by one thread. Everything else is read from the response.
+
+    Prev regions are written too, by replicas appending props to them, e.g. CaffeClassifier.
+    The replica gets copies of the prev regions of its batch, with their own props lists,
+    and the props it appends are replayed on the prev regions of the response.
+    """
+
+    APPEND_METHODS = frozenset(
+        ("append_region", "append_regions", "append_track", "append_media_summary")
+    )
+
+    def __init__(self, response):
+        self._response = response
+        self.appends = []
+        self._prev_regions = []
+
+    def __getattr__(self, name):
+        if name in self.APPEND_METHODS:
+            return lambda *args, **kwargs: self.appends.append((name, args, kwargs))
+        return getattr(self._response, name)
+
+    def isolate_prev_regions(self, prev_regions):
+        """Copy prev regions, so the replica appends props to the copies
+
+        Args:
+            prev_regions (list[Region]): prev regions of the batch, or None
+
+        Returns:
+            list[Region]: copies of prev_regions, a region repeated in the batch is copied once
+        """
+        if prev_regions is None:
+            return None
+        copies = {}
+        for prev_region in prev_regions:
+            if prev_region is not None and id(prev_region) not in copies:
+                region_copy = copy.copy(prev_region)
+                region_copy["props"] = list(prev_region["props"])
+                copies[id(prev_region)] = region_copy
+                self._prev_regions.append((prev_region, region_copy, len(region_copy["props"])))
+        return [
+            None if prev_region is None else copies[id(prev_region)]
+            for prev_region in prev_regions
+        ]
+
+    def replay(self):
+        for name, args, kwargs in self.appends:
+            getattr(self._response, name)(*args, **kwargs)
+        for prev_region, region_copy, num_props in self._prev_regions:
+            prev_region["props"].extend(region_copy["props"][num_props:])
+
+
+class DataParallelImagesModule(ImagesModule):
+    def __init__(
+        self,
+        module_factory,
+        devices=None,
+        num_cpu_replicas=NUM_CPU_REPLICAS,
+        **gpukwargs
+    ):
+        """ImagesModule processing batches of frames with one replica of a module per device
+
+        Frames are decoded and batched once, like in any ImagesModule, and each batch is
+        processed by the next free replica. The regions appended by the replicas are merged
+        into the response in batch order, so the response is the same as with a single
+        replica.
+
+        Each replica is created and run by its own thread, as frameworks like Caffe keep the
+        mode and device per thread. Frameworks releasing the GIL, like Caffe and TensorFlow
+        on GPU, run the replicas concurrently.
+
+        Name, version, batch_size, prev props of interest and the other ImagesModule options
+        are those of the replicas, set by module_factory.
+
+        Args:
+            module_factory (callable): module_factory(device) -> ImagesModule, where device is
+                a GPU id to pin the replica to (e.g. gpuid of CaffeClassifier), or None for a
+                CPU replica
+            devices (list, optional): Defaults to None. One replica is created per device,
+                e.g. [0, 1] or [None, None] for 2 CPU replicas. If None, devices are selected
+                by GPUUtility(**gpukwargs), see select_devices
+            num_cpu_replicas (int, optional): Defaults to 1. Number of CPU replicas if devices
+                is None and no GPU qualifies
+            gpukwargs: GPUUtility selection policy, e.g. priority, minFreeMemoryMb, limit
+        """
+        if devices is None:
+            devices = select_devices(num_cpu_replicas, **gpukwargs)
+        if not devices:
+            raise ValueError("No device to create replicas on")
+        self.devices = list(devices)
+        # At most one batch waiting per replica, so decoding does not run ahead of them
+        self._jobs = queue.Queue(maxsize=len(self.devices))
+        self._results = {}
+        self._results_cond = threading.Condition()
+        self._num_submitted = 0
+        self._num_merged = 0
+
+        ready = queue.Queue()
+        self._workers = [
+            threading.Thread(
+                target=self._work,
+                args=(idx, module_factory, device, ready),
+                name=f"replica-{idx}-device-{device}",
+                daemon=True,
+            )
+            for idx, device in enumerate(self.devices)
+        ]
+        for worker in self._workers:
+            worker.start()
+        self.replicas = [None] * len(self.devices)
+        errors = []
+        for _ in self.devices:
+            idx, replica, error = ready.get()
+            self.replicas[idx] = replica
+            if error is not None:
+                errors.append(error)
+        if errors:
+            self.close()
+            raise errors[0]
+
+        replica = self.replicas[0]
+        super().__init__(
+            replica.name,
+            replica.version,
+            prop_type=replica.prop_type,
+            prop_id_map=replica.prop_id_map,
+            module_id_map=replica.module_id_map,
+            batch_size=replica.batch_size,
+            prefetch_size=replica.prefetch_size,
+            targeted_fetch=replica.targeted_fetch,
+            crop_size=replica.crop_size,
+            resize_at_decode=replica.resize_at_decode,
+        )
+        self.input_size = replica.input_size
+        if replica.prev_pois is not None:
+            super().set_prev_props_of_interest(replica.prev_pois)
+        log.info(f"Created {len(self.replicas)} replicas of {replica} on {self.devices}")
+
+    def _work(self, idx, module_factory, device, ready):
+        """Create a replica, then process batches until close"""
+        try:
+            replica = module_factory(device)
+        except Exception as e:
+            ready.put((idx, None, e))
+            return
+        ready.put((idx, replica, None))
+
+        while True:
+            job = self._jobs.get()
+            if job is _STOP:
+                return
+            seq, shard, media, images, tstamps, prev_regions = job
+            replica.response = shard
+            replica.request = shard.request
+            replica.media = media
+            error = None
+            try:
+                replica.process_images(images, tstamps, prev_regions)
+            except Exception as e:
+                error = e
+            with self._results_cond:
+                self._results[seq] = (shard, error)
+                self._results_cond.notify_all()
+
+    def set_prev_props_of_interest(self, pois):
+        super().set_prev_props_of_interest(pois)
+        for replica in self.replicas:
+            replica.set_prev_props_of_interest(pois)
+
+    def process(self, response):
+        try:
+            return super().process(response)
+        finally:
+            if self._num_merged < self._num_submitted:
+                # process failed, wait for the batches left without merging them
+                self._drain(merge=False)
+
+    def process_images(self, images, tstamps, prev_regions=None):
+        """Queue a batch to the replicas, then merge the batches processed so far, in order
+
+        Raises:
+            Exception: raised by a replica on a previous batch, e.g. ValueError for
+                problematic frames
+        """
+        shard = _ResponseShard(self.response)
+        prev_regions = shard.isolate_prev_regions(prev_regions)
+        self._jobs.put((self._num_submitted, shard, self.media, images, tstamps, prev_regions))
+        self._num_submitted += 1
+        self._merge(wait=False)
+
+    def update_and_return_response(self):
+        """Merge the batches still processed by the replicas, then update the response"""
+        self._drain(merge=True)
+        return super().update_and_return_response()
+
+    def _merge(self, wait):
+        """Merge processed batches into the response, in batch order
+
+        Args:
+            wait (bool): wait for the next batch if it is still processed
+
+        Raises:
+            Exception: raised by the replica on a merged batch, after merging its regions
+        """
+        while self._num_merged < self._num_submitted:
+            with self._results_cond:
+                if wait:
+                    while self._num_merged not in self._results:
+                        self._results_cond.wait()
+                elif self._num_merged not in self._results:
+                    return
+                shard, error = self._results.pop(self._num_merged)
+            self._num_merged += 1
+            shard.replay()
+            if error is not None:
+                raise error
+
+    def _drain(self, merge):
+        """Wait for every queued batch
+
+        Problematic frames (ValueError) of merged batches count towards
+        MAX_PROBLEMATIC_FRAMES, like those raised while batches are queued, so the code is
+        ERROR_PROCESSING as for a single ImagesModule. Other errors are raised once every
+        batch is done.
+
+        Args:
+            merge (bool): merge the batches, or drop them
+        """
+        first_error = None
+        while self._num_merged < self._num_submitted:
+            try:
+                if merge:
+                    self._merge(wait=True)
+                else:
+                    with self._results_cond:
+                        while self._num_merged not in self._results:
+                            self._results_cond.wait()
+                        self._results.pop(self._num_merged)
+                    self._num_merged += 1
+            except ValueError as e:
+                self._count_problematic_frames(e)
+            except Exception as e:
+                log.error(f"Replica failed: {e}")
+                if first_error is None:
+                    first_error = e
+        if first_error is not None:
+            raise first_error
+
+    def close(self):
+        """Stop the threads of the replicas"""
+        for worker in self._workers:
+            if worker.is_alive():
+                self._jobs.put(_STOP)
+        for worker in self._workers:
+            worker.join()
@@ -3,16 +3,19 @@ import json
 from abc import abstractmethod
 import traceback
 from collections.abc import Iterable
-import pandas as pd
 import glog as log
 
 from multivitamin.module import Module, Codes
-from multivitamin.module.utils import pandas_query_matches_props, batch_generator
-from multivitamin.media import MediaRetriever
+from multivitamin.module.utils import batch_generator, crop_batch_generator
+from multivitamin.media import MediaRetriever, PrefetchingFramesIterator
 
 
 MAX_PROBLEMATIC_FRAMES = 10
 BATCH_SIZE = 1
+PREFETCH_SIZE = 0
+TARGETED_FETCH = False
+CROP_SIZE = None
+RESIZE_AT_DECODE = False
 
 
 class ImagesModule(Module):
@@ -24,7 +27,37 @@ class ImagesModule(Module):
         prop_id_map=None,
         module_id_map=None,
         batch_size=BATCH_SIZE,
+        prefetch_size=PREFETCH_SIZE,
+        targeted_fetch=TARGETED_FETCH,
+        crop_size=CROP_SIZE,
+        resize_at_decode=RESIZE_AT_DECODE,
     ):
+        """Module that processes batches of frames of an image or video
+
+        Args:
+            server_name (str): server_name
+            version (str): version
+            prop_type (str, optional): Defaults to None. property_type
+            prop_id_map (str, optional): Defaults to None. Map: property_type -> id
+            module_id_map (str, optional): Defaults to None. Map: server_name -> id
+            batch_size (int, optional): Defaults to 1. Number of frames per process_images call
+            prefetch_size (int, optional): Defaults to 0. Number of batches of video frames
+                decoded ahead on a background thread, 0 decodes synchronously
+            targeted_fetch (bool, optional): Defaults to False. When previous properties of
+                interest are set, only decode the video frames at the tstamps of the previous
+                response with matching regions, instead of every sampled frame
+            crop_size (tuple, optional): Defaults to None. When previous properties of interest
+                are set, crop the matching regions and resize them to (height, width) as they are
+                batched, so process_images receives an np.array of crops instead of frames
+            resize_at_decode (bool, optional): Defaults to False. Downscale frames to cover
+                input_size as they are decoded, keeping their aspect ratio, instead of passing
+                full size frames to process_images. Frames are kept at full size when previous
+                properties of interest are set, so regions are cropped at full resolution
+
+        Attributes:
+            input_size (tuple): (height, width) of the input of the model, declared by child
+                modules, or None if the model has no preferred input size
+        """
         super().__init__(
             server_name=server_name,
             version=version,
@@ -33,6 +66,13 @@ class ImagesModule(Module):
             module_id_map=module_id_map,
         )
         self.batch_size = batch_size
+        self.prefetch_size = prefetch_size
+        self.targeted_fetch = targeted_fetch
+        self.crop_size = crop_size
+        self.resize_at_decode = resize_at_decode
+        self.input_size = None
+        self.num_problematic_frames = 0
+        self._regions_of_interest = None
         log.debug(f"Creating ImagesModule with batch_size: {batch_size}")
 
     def process(self, response):
@@ -48,8 +88,14 @@ class ImagesModule(Module):
         try:
             log.info(f"Loading media from url: {self.response.request.url}")
             self.media = MediaRetriever(self.response.request.url)
+            self._update_w_h_in_response()
+            self._regions_of_interest = None
+            iterator_kwargs = {"target_size": self._get_decode_size()}
+            if self.targeted_fetch and self.prev_pois and self.media.is_video:
+                self._regions_of_interest = self._find_regions_of_interest()
+                iterator_kwargs["tstamps"] = list(self._regions_of_interest)
             self.frames_iterator = self.media.get_frames_iterator(
-                self.response.request.sample_rate
+                self.response.request.sample_rate, **iterator_kwargs
             )
         except Exception as e:
             log.error(e)
@@ -57,28 +103,36 @@ class ImagesModule(Module):
             self.code = Codes.ERROR_LOADING_MEDIA
             return self.update_and_return_response()
 
-        self._update_w_h_in_response()
-
         if self.prev_pois and not self.response.has_frame_anns():
             log.warning("NO_PREV_REGIONS_OF_INTEREST, returning...")
             self.code = Codes.NO_PREV_REGIONS_OF_INTEREST
             return self.update_and_return_response()
 
-        num_problematic_frames = 0
-        for image_batch, tstamp_batch, prev_region_batch in batch_generator(
-            self.preprocess_input(), self.batch_size
-        ):
-            if image_batch is None or tstamp_batch is None:
-                continue
-            try:
-                self.process_images(image_batch, tstamp_batch, prev_region_batch)
-            except ValueError as e:
-                num_problematic_frames += 1
-                log.warning("Problem processing frames")
-                if num_problematic_frames >= MAX_PROBLEMATIC_FRAMES:
-                    log.error(e)
-                    self.code = Codes.ERROR_PROCESSING
-                    return self.update_and_return_response()
+        if self.prefetch_size > 0 and self.media.is_video:
+            self.frames_iterator = PrefetchingFramesIterator(
+                self.frames_iterator, self.prefetch_size * self.batch_size
+            )
+
+        if self.prev_pois and self.crop_size is not None:
+            batches = crop_batch_generator(
+                self.preprocess_input(), self.batch_size, self.crop_size
+            )
+        else:
+            batches = batch_generator(self.preprocess_input(), self.batch_size)
+
+        self.num_problematic_frames = 0
+        try:
+            for image_batch, tstamp_batch, prev_region_batch in batches:
+                if image_batch is None or tstamp_batch is None:
+                    continue
+                try:
+                    self.process_images(image_batch, tstamp_batch, prev_region_batch)
+                except ValueError as e:
+                    if self._count_problematic_frames(e):
+                        return self.update_and_return_response()
+        finally:
+            if isinstance(self.frames_iterator, PrefetchingFramesIterator):
+                self.frames_iterator.close()
         log.debug("Finished processing.")
 
         if self.prev_pois and self.prev_regions_of_interest_count == 0:
@@ -86,6 +140,24 @@ class ImagesModule(Module):
             self.code = Codes.NO_PREV_REGIONS_OF_INTEREST
         return self.update_and_return_response()
 
+    def _count_problematic_frames(self, error):
+        """Count a batch of problematic frames, i.e. a ValueError raised by process_images
+
+        Args:
+            error (ValueError): error raised by process_images
+
+        Returns:
+            bool: True once MAX_PROBLEMATIC_FRAMES batches were problematic, the code is then
+                set to ERROR_PROCESSING
+        """
+        self.num_problematic_frames += 1
+        log.warning("Problem processing frames")
+        if self.num_problematic_frames >= MAX_PROBLEMATIC_FRAMES:
+            log.error(error)
+            self.code = Codes.ERROR_PROCESSING
+            return True
+        return False
+
     def preprocess_input(self):
         """Parses request for data
 
@@ -110,6 +182,11 @@ class ImagesModule(Module):
 
             if not self.prev_pois:
                 yield frame, tstamp, None
+            elif self._regions_of_interest is not None:
+                regions_that_match_props = self._regions_of_interest.get(tstamp, [])
+                self.prev_regions_of_interest_count += len(regions_that_match_props)
+                for region in regions_that_match_props:
+                    yield frame, tstamp, region
             else:
                 log.debug("Processing with previous response")
                 log.debug(f"Querying on self.prev_pois: {self.prev_pois}")
@@ -132,12 +209,41 @@ class ImagesModule(Module):
         """Abstract method to be implemented by child module"""
         pass
 
+    def _get_decode_size(self):
+        """Get the size frames are downscaled to cover as they are decoded
+
+        Returns:
+            tuple: (height, width), or None for full size frames
+        """
+        if not self.resize_at_decode or self.input_size is None or self.prev_pois:
+            return None
+        return tuple(self.input_size)
+
     def _update_w_h_in_response(self):
         (width, height) = self.media.get_w_h()
         log.debug(f"Setting in response w: {width} h: {height}")
         self.response.width = width
         self.response.height = height
 
+    def _find_regions_of_interest(self):
+        """Find the regions of the previous response that match the previous properties
+        of interest
+
+        Returns:
+            dict: tstamp -> list of matching regions, for tstamps with at least one match
+        """
+        regions_of_interest = {}
+        for tstamp in self.response.get_timestamps_from_frames_ann():
+            regions = self.response.get_regions_from_tstamp(tstamp)
+            matches = [region for region in regions if self._region_contains_props(region)]
+            if matches:
+                regions_of_interest[tstamp] = matches
+        log.info(
+            f"Found regions of interest at {len(regions_of_interest)} tstamps "
+            "of the previous response"
+        )
+        return regions_of_interest
+
     def _region_contains_props(self, region):
         """ Boolean to check if a region's props matches the defined
             previous properties of interest
@@ -150,4 +256,4 @@ class ImagesModule(Module):
         props = region.get("props")
         if props is None:
             return False
-        return pandas_query_matches_props(self.prev_pois_bool_exp, pd.DataFrame(props))
+        return self.prev_pois_matcher(props)
@@ -7,7 +7,7 @@ from multivitamin.data import Response
 from multivitamin.data.response.dtypes import Footprint
 from multivitamin.data.response.utils import get_current_time
 from multivitamin.module.codes import Codes
-from multivitamin.module.utils import convert_props_to_pandas_query
+from multivitamin.module.utils import convert_props_to_pandas_query, compile_props_matcher
 
 
 class Module(ABC):
@@ -26,6 +26,7 @@ class Module(ABC):
         self.prop_id_map = prop_id_map
         self.module_id_map = module_id_map
         self.prev_pois = None
+        self.prev_pois_matcher = None
         self.code = Codes.SUCCESS
         self.prev_regions_of_interest_count = 0
         self.tstamps_processed = []
@@ -53,11 +54,20 @@ class Module(ABC):
 
         self.prev_pois = pois
         self.prev_pois_bool_exp = convert_props_to_pandas_query(pois)
+        self.prev_pois_matcher = compile_props_matcher(pois)
         log.info(
             f"Setting previous properties of interest: {json.dumps(pois, indent=2)}"
         )
         log.info(f"bool exp: {self.prev_pois_bool_exp}")
 
+    def init_thread(self):
+        """Prepare the calling thread to run process, e.g. set the device of a framework
+        keeping it per thread, like Caffe
+
+        Called by Server on a thread other than the one the module was created on
+        """
+        pass
+
     def get_prev_props_of_interest(self):
         """Getter for properties of interest
 
@@ -109,11 +119,11 @@ class Module(ABC):
         """Internal method for updating property id and module id 
            in frame_anns and tracks
         """
-        for image_ann in self.response.frame_anns:
-            for region in image_ann["regions"]:
-                for prop in region["props"]:
-                    self._update_property_id(prop)
-                    self._update_module_id(prop)
+        def update_prop(prop):
+            self._update_property_id(prop)
+            self._update_module_id(prop)
+
+        self.response.map_frame_anns_props(update_prop)
 
         for video_ann in self.response.tracks:
             for prop in video_ann["props"]:
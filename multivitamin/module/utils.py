@@ -1,8 +1,13 @@
 import os
 import json
+import traceback
 import itertools as it
 
+import cv2
 import glog as log
+import numpy as np
+
+from multivitamin.data.response.utils import crop_image_from_bbox_contour
 
 
 def load_idmap(idmap_filepath):
@@ -122,6 +127,45 @@ def convert_props_to_pandas_query(query_props):
     return bool_exp
 
 
+def compile_props_matcher(query_props):
+    """Compile a list of query dicts into a predicate on a list of properties
+
+    Equivalent to evaluating convert_props_to_pandas_query(query_props) with
+    pandas_query_matches_props, without building a DataFrame: a list of properties matches if
+    one property has every key/value of one query dict. Values are compared as strings, like
+    in the pandas query, so {"value": 5} matches "5" but not 5. A key missing from a property
+    does not match (the pandas query raises if it is missing from every property).
+
+    Query dicts are indexed by their tuple of keys, so matching a property is one set lookup
+    per distinct tuple of keys.
+
+    Args:
+        query_props (list[dict]): list of dictionaries containing key/values of interest
+
+    Returns:
+        callable: matcher(props) -> bool, where props is a list of property dicts
+    """
+    assert isinstance(query_props, list)
+    index = {}
+    for q in query_props:
+        assert isinstance(q, dict)
+        keys = tuple(q.keys())
+        index.setdefault(keys, set()).add(tuple(str(v) for v in q.values()))
+    index = tuple(index.items())
+
+    def matcher(props):
+        for prop in props:
+            for keys, values in index:
+                try:
+                    if tuple(prop.get(k) for k in keys) in values:
+                        return True
+                except TypeError:  # unhashable property value
+                    continue
+        return False
+
+    return matcher
+
+
 def batch_generator(iterator, batch_size):
 # def batch_generator(iterable, batch_size):
     """Take an iterator, convert it to a batching generator
@@ -145,3 +189,48 @@ def batch_generator(iterator, batch_size):
             batch = []
     if len(batch) > 0:
         yield zip(*batch)
+
+
+def crop_batch_generator(iterator, batch_size, crop_size):
+    """Take an iterator of (frame, tstamp, region), convert it to a generator of batches of
+    region crops
+
+    Each region is cropped from its frame and resized to crop_size into a contiguous array,
+    so frames are not held until their batch is processed. Empty crops and regions that
+    cannot be cropped are skipped.
+
+    Args:
+        iterator: Any iterable of (frame, tstamp, region) tuples
+        batch_size (int): max number of crops per batch
+        crop_size (tuple[int]): (height, width) of the crops
+
+    Returns:
+        tuple: np.array of N crops of shape (N, height, width, C), list of N tstamps and
+               list of N regions. The last batch may be smaller than the others
+    """
+    h, w = crop_size
+    crops = None
+    tstamps = []
+    regions = []
+    for frame, tstamp, region in iterator:
+        try:
+            crop = crop_image_from_bbox_contour(frame, region.get("contour") if region else None)
+        except Exception:
+            log.error(traceback.format_exc())
+            log.error(f"Error cropping region at tstamp: {tstamp}, skipping")
+            continue
+        if crop is None or crop.size == 0:
+            log.warning(f"Empty crop at tstamp: {tstamp}, skipping")
+            continue
+        if crops is None:
+            crops = np.empty((batch_size, h, w) + crop.shape[2:], dtype=crop.dtype)
+        crops[len(tstamps)] = cv2.resize(crop, (w, h), interpolation=cv2.INTER_LINEAR)
+        tstamps.append(tstamp)
+        regions.append(region)
+        if len(tstamps) >= batch_size:
+            yield crops, tstamps, regions
+            crops = None
+            tstamps = []
+            regions = []
+    if len(tstamps) > 0:
+        yield crops[:len(tstamps)], tstamps, regions
@@ -1,17 +1,20 @@
 import os
-import json
 import traceback
 import threading
+from queue import Queue
 
 import glog as log
 from flask import Flask, jsonify
 
-from multivitamin.apis import CommAPI
+from multivitamin.apis import CommAPI, PushDispatcher, config as apis_config
 from multivitamin.module import Module
 from multivitamin.data import Response, Request
 
 
 HEALTHPORT = os.environ.get("PORT", 5000)
+MAX_INFLIGHT = 1
+PUSH_WORKERS = 0
+PULL_SIZE = apis_config.SQS_MAX_BATCH
 
 
 class Server(Flask):
@@ -21,6 +24,9 @@ class Server(Flask):
         input_comm,
         output_comms=None,
         schema_registry_url=None,
+        max_inflight=MAX_INFLIGHT,
+        push_workers=PUSH_WORKERS,
+        pull_size=PULL_SIZE,
     ):
         """Serves as the public interface for CV services through multivitamin
 
@@ -33,6 +39,14 @@ class Server(Flask):
             output_comms (list[CommAPI]): List of concrete child implementations of CommAPI, 
                                           called for pushing responses to somewhere
             schema_registry_url (str): use schema in registry url instead of local schema
+            max_inflight (int): max number of requests in flight. If > 1, requests are
+                                pipelined: pulling, each module and pushing run on their own
+                                thread, connected by queues bounded to max_inflight
+            push_workers (int): if > 0, responses are pushed to all output_comms concurrently
+                                by a PushDispatcher with this many threads, with retries and
+                                timeouts, instead of serially in the processing loop
+            pull_size (int): max number of requests pulled from input_comm at once, e.g. an
+                             SQS batch receive. Pulled requests wait in flight until processed
         """
         if isinstance(modules, Module):
             modules = [modules]
@@ -55,6 +69,10 @@ class Server(Flask):
         self.modules_info = [{"name": x.name, "version": x.version} for x in modules]
         self.modules = modules
         self.schema_registry_url = schema_registry_url
+        self.max_inflight = max(int(max_inflight), 1)
+        self.push_workers = max(int(push_workers), 0)
+        self.pull_size = max(int(pull_size), 1)
+        self.push_dispatcher = None
 
         log.info("Input comm type: {}".format(type(input_comm)))
         for out in output_comms:
@@ -90,53 +108,219 @@ class Server(Flask):
         """Start server. While loop that pulls requests from the input_comm, calls
         _process_request(request), and posts responses to output_comms
         """
+        if self.push_workers > 0:
+            self.push_dispatcher = PushDispatcher(
+                self.output_comms, n_workers=self.push_workers, on_complete=self._on_pushed
+            )
+
+        if self.max_inflight > 1:
+            return self._start_pipelined()
+
         while True:
             try:
                 log.info("Pulling requests")
-                requests = self.input_comm.pull()
-                for request in requests:
+                requests = self.input_comm.pull(self.pull_size)
+                for idx, request in enumerate(requests):
                     try:
                         if request.kill_flag is True:
                             log.info(
                                 "Incoming request with kill_flag == True, killing server"
                             )
+                            self.input_comm.nack(requests[idx:])
+                            self._close()
                             return
                         response = self._process_request(request)
-                        log.info("Pushing reponse to output_comms")
-                        for output_comm in self.output_comms:
-                            try:
-                                ret = output_comm.push(response)
-                            except Exception as e:
-                                log.error(e)
-                                log.error(traceback.format_exc())
-                                log.error(f"Error pushing to output_comm: {output_comm}")
+                        self._push_response(response)
                     except Exception:
                         log.error(traceback.format_exc())
                         log.error(f"Error processing request: {request}")
+                        self.input_comm.nack([request])
             except Exception as e:
                 log.error(e)
                 log.error(traceback.format_exc())
                 log.error("Error processing requests")
 
-    def _process_request(self, request):
-        """Send request_message through all the modules
+    def _start_pipelined(self):
+        """Start server in pipelined mode.
+
+        The pulling loop runs in this thread and feeds a chain of stages, one thread per module
+        plus one for pushing. Stages are connected by queues bounded to max_inflight, so a slow
+        stage applies backpressure upstream instead of buffering requests without limit.
+        A kill_flag request drains the pipeline before returning.
+        """
+        log.info(f"Starting pipelined server with max_inflight: {self.max_inflight}")
+        queues = [Queue(maxsize=self.max_inflight) for _ in range(len(self.modules) + 1)]
+        stages = []
+        for idx, module in enumerate(self.modules):
+            stages.append(
+                threading.Thread(
+                    target=self._module_stage,
+                    args=(module, queues[idx], queues[idx + 1]),
+                    daemon=True,
+                )
+            )
+        stages.append(
+            threading.Thread(target=self._push_stage, args=(queues[-1],), daemon=True)
+        )
+        for stage in stages:
+            stage.start()
+
+        self._pull_stage(queues[0])
+        for stage in stages:
+            stage.join()
+        self._close()
+        log.info("Pipeline drained, killing server")
+
+    def _pull_stage(self, out_queue):
+        """Pull requests and convert them to responses for the first module stage
+
+        Args:
+            out_queue (Queue): queue feeding the first module stage
+        """
+        while True:
+            try:
+                log.info("Pulling requests")
+                requests = self.input_comm.pull(self.pull_size)
+                for idx, request in enumerate(requests):
+                    if request.kill_flag is True:
+                        log.info("Incoming request with kill_flag == True, draining pipeline")
+                        self.input_comm.nack(requests[idx:])
+                        out_queue.put(None)
+                        return
+                    try:
+                        out_queue.put(self._create_response(request))
+                    except Exception:
+                        log.error(traceback.format_exc())
+                        log.error(f"Error processing request: {request}")
+                        self.input_comm.nack([request])
+            except Exception as e:
+                log.error(e)
+                log.error(traceback.format_exc())
+                log.error("Error processing requests")
+
+    def _module_stage(self, module, in_queue, out_queue):
+        """Run one module over every response coming through in_queue
+
+        A None item is the end-of-stream marker and is forwarded downstream.
+
+        Args:
+            module (Module): module owned by this stage
+            in_queue (Queue): responses to process
+            out_queue (Queue): processed responses
+        """
+        # e.g. Caffe keeps the device per thread, and the module was created on another one
+        module.init_thread()
+        while True:
+            response = in_queue.get()
+            if response is None:
+                out_queue.put(None)
+                return
+            try:
+                out_queue.put(self._process_module(module, response))
+            except Exception:
+                log.error(traceback.format_exc())
+                log.error(f"Error processing request: {response.request}")
+                self.input_comm.nack([response.request])
+
+    def _push_stage(self, in_queue):
+        """Push every response coming through in_queue to the output_comms
+
+        Args:
+            in_queue (Queue): processed responses
+        """
+        while True:
+            response = in_queue.get()
+            if response is None:
+                return
+            self._push_response(response)
+
+    def _push_response(self, response):
+        """Push a response to every output_comm, or hand it to the push_dispatcher
+
+        Args:
+            response (Response): outgoing response
+        """
+        if self.push_dispatcher is not None:
+            log.info("Queueing reponse for output_comms")
+            self.push_dispatcher.push(response)
+            return
+
+        log.info("Pushing reponse to output_comms")
+        success = True
+        for output_comm in self.output_comms:
+            try:
+                output_comm.push(response)
+            except Exception as e:
+                log.error(e)
+                log.error(traceback.format_exc())
+                log.error(f"Error pushing to output_comm: {output_comm}")
+                success = False
+        self._on_pushed(response, success)
+
+    def _on_pushed(self, response, success):
+        """Acknowledge the request of a response once it was pushed to every output_comm
+
+        Args:
+            response (Response): pushed response
+            success (bool): whether pushing to every output_comm succeeded
+        """
+        if response.request is None:
+            return
+        if success:
+            self.input_comm.ack([response.request])
+        else:
+            self.input_comm.nack([response.request])
+
+    def _close(self):
+        """Wait for queued responses to be pushed, then close the input_comm, e.g. to delete
+        acked SQS messages, before the server returns"""
+        if self.push_dispatcher is not None:
+            log.info("Waiting for queued responses to be pushed")
+            self.push_dispatcher.close()
+            self.push_dispatcher = None
+        log.info("Closing input_comm")
+        self.input_comm.close()
+
+    def _create_response(self, request):
+        """Create the response a request is processed into
 
         Args:
             request (Request): incoming request
 
         Returns:
-            Response: outgoing response message
+            Response: response to be passed through the modules
         """
         if not isinstance(request, Request):
             raise ValueError(f"request is of type {type(request)}, not Request")
         log.debug(f"Processing: {request}")
         log.info(f"Processing url: {request.get('url')}")
+        return Response(request, self.schema_registry_url)
 
-        response = Response(request, self.schema_registry_url)
+    def _process_module(self, module, response):
+        """Send a response through a single module
 
-        for module in self.modules:
-            log.info(f"Processing request for module: {module}")
-            response = module.process(response)
-            log.debug(f"response.to_dict(): {json.dumps(response.to_dict(), indent=2)}")
+        Args:
+            module (Module): module
+            response (Response): response
+
+        Returns:
+            Response: response updated by the module
+        """
+        log.info(f"Processing request for module: {module}")
+        response = module.process(response)
+        log.debug("response.to_dict(): %s", response)
+        return response
+
+    def _process_request(self, request):
+        """Send request_message through all the modules
+
+        Args:
+            request (Request): incoming request
 
+        Returns:
+            Response: outgoing response message
+        """
+        response = self._create_response(request)
+        for module in self.modules:
+            response = self._process_module(module, response)
         return response
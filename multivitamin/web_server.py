@@ -1,5 +1,4 @@
 import os
-import json
 import traceback
 
 import glog as log
@@ -53,9 +52,7 @@ class WebServer(Flask):
                 for module in self.modules:
                     log.info(f"Processing request for module: {module}")
                     response = module.process(response)
-                    log.debug(
-                        f"response.to_dict(): {json.dumps(response.to_dict(), indent=2)}"
-                    )
+                    log.debug("response.to_dict(): %s", response)
 
                 if req.bin_encoding:
                     return response.to_bytes()
@@ -0,0 +1,80 @@
+"""Throughput of encoding a large response to avro binary, and peak memory of writing it"""
+import os
+import tempfile
+import tracemalloc
+from multivitamin.data import Response
+from multivitamin.data.response.io import AvroIO, get_avro_io
+from multivitamin.data.response.dtypes import (
+    Region,
+    Property,
+    create_bbox_contour_from_points,
+)
+
+from tabulate import tabulate
+from datetime import datetime
+
+print("AVRO IO SPEED TEST!!!")
+
+NUM_FRAMES = 3000
+REGIONS_PER_FRAME = 5
+NUM_TESTS = 5
+
+
+def build_response():
+    response = Response()
+    for i in range(NUM_FRAMES):
+        response.append_regions(
+            i / 5.0,
+            [
+                Region(
+                    contour=create_bbox_contour_from_points(0.1, 0.1, 0.5, 0.5),
+                    props=[Property(server="SpeedTest", value="car", confidence=0.9)],
+                )
+                for _ in range(REGIONS_PER_FRAME)
+            ],
+        )
+    return response
+
+
+def _benchmark(encode, doc, num_tests=NUM_TESTS):
+    """Return MB/s and ms per encode"""
+    num_bytes = 0
+    start = datetime.now()
+    for _ in range(num_tests):
+        num_bytes += len(encode(doc))
+    elapsed = (datetime.now() - start).total_seconds()
+    return num_bytes / elapsed / 2 ** 20, 1000 * elapsed / num_tests
+
+
+def _peak_memory(write, response):
+    """Return peak MB allocated while writing response to a temp file"""
+    fd, fn = tempfile.mkstemp(suffix=".avro")
+    os.close(fd)
+    tracemalloc.start()
+    with open(fn, "wb") as wf:
+        write(response, wf)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    os.remove(fn)
+    return peak / 2 ** 20
+
+
+response = build_response()
+doc = response.to_dict()
+tests = [
+    ("new AvroIO per call (avro)", lambda d: AvroIO().encode(d)),
+    ("cached AvroIO (avro)", lambda d: get_avro_io(codec="avro").encode(d)),
+    ("cached AvroIO (fastavro)", lambda d: get_avro_io(codec="fastavro").encode(d)),
+]
+results = [[name] + list(_benchmark(encode, doc)) for name, encode in tests]
+
+print("\n" * 4)
+print(f"RESULTS ON {NUM_FRAMES} FRAMES, {REGIONS_PER_FRAME} REGIONS PER FRAME")
+print(tabulate(results, headers=["Encoder", "MB/s", "ms per encode"]))
+
+writers = [
+    ("to_bytes", lambda r, wf: wf.write(r.to_bytes())),
+    ("write_avro", lambda r, wf: r.write_avro(wf)),
+]
+results = [[name, _peak_memory(write, response)] for name, write in writers]
+print(tabulate(results, headers=["Writer", "peak MB"]))
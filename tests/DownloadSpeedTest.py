@@ -0,0 +1,78 @@
+"""Throughput of downloading a large file from a local HTTP server
+
+SIZE_GB sets the size of the served file, BYTES_PER_SEC the throughput of each connection of
+the server, to emulate remote storage whose connections are slower than the host
+"""
+import os
+import sys
+import tempfile
+import multiprocessing
+from datetime import datetime
+
+import requests
+from tabulate import tabulate
+
+from multivitamin.media import downloader
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from utils import RangeRequestHandler, serve_directory  # noqa: E402
+
+print("DOWNLOAD SPEED TEST!!!")
+
+SIZE_GB = float(os.environ.get("SIZE_GB", 2))
+BYTES_PER_SEC = float(os.environ.get("BYTES_PER_SEC", 100 * 2 ** 20))
+
+
+class ThrottledHandler(RangeRequestHandler):
+    bytes_per_sec = BYTES_PER_SEC or None
+
+
+def serve(media_dir, urls, stop):
+    """Serve media_dir in a separate process, so the server does not share the GIL"""
+    with serve_directory(media_dir, ThrottledHandler) as base_url:
+        urls.put(base_url)
+        stop.wait()
+
+
+def single_get(url, outf):
+    with requests.get(url, stream=True) as response:
+        for chunk in response.iter_content(2 ** 20):
+            outf.write(chunk)
+
+
+def _benchmark(download, url, size):
+    """Return MB/s"""
+    with tempfile.TemporaryFile() as outf:
+        start = datetime.now()
+        download(url, outf)
+        elapsed = (datetime.now() - start).total_seconds()
+        assert outf.tell() == size
+    return size / elapsed / 2 ** 20
+
+
+media_dir = tempfile.mkdtemp()
+filepath = os.path.join(media_dir, "video.mp4")
+size = int(SIZE_GB * 2 ** 30)
+with open(filepath, "wb") as f:
+    f.truncate(size)
+
+tests = [
+    ("requests.get, 1 connection", single_get),
+    ("download, 1 worker", lambda url, outf: downloader.download(url, outf, workers=1)),
+    ("download, 4 workers", lambda url, outf: downloader.download(url, outf, workers=4)),
+    ("download, 8 workers", lambda url, outf: downloader.download(url, outf, workers=8)),
+]
+urls = multiprocessing.Queue()
+stop = multiprocessing.Event()
+server = multiprocessing.Process(target=serve, args=(media_dir, urls, stop))
+server.start()
+url = urls.get() + "/video.mp4"
+results = [[name, _benchmark(download, url, size)] for name, download in tests]
+stop.set()
+server.join()
+os.remove(filepath)
+os.rmdir(media_dir)
+
+print("\n" * 4)
+print(f"RESULTS ON {SIZE_GB} GB, {BYTES_PER_SEC / 2 ** 20} MB/s PER CONNECTION")
+print(tabulate(results, headers=["Downloader", "MB/s"]))
@@ -0,0 +1,44 @@
+from multivitamin.media import MediaRetriever
+
+from tabulate import tabulate
+from datetime import datetime
+from tqdm import tqdm
+
+print("FRAMES ITERATOR SPEED TEST!!!")
+
+VIDEO_URL = (
+    "https://s3.amazonaws.com/video-ann-testing/"
+    "NHL_GAME_VIDEO_NJDMTL_M2_NATIONAL_20180401_1520698069177.t.mp4"
+)
+
+SAMPLE_RATES = [100, 30, 5, 1, 0.2]
+STRATEGIES = ["grab", "seek", "auto"]
+NUM_SAMPLES = 100
+
+
+def _benchmark_frames_iterator(mr, sample_rate, strategy, num_samples=NUM_SAMPLES):
+    """Return the number of sampled frames per second of wall time"""
+    count = 0
+    start = datetime.now()
+    for idx, _ in enumerate(
+        mr.get_frames_iterator(sample_rate=sample_rate, strategy=strategy)
+    ):
+        count += 1
+        if idx >= num_samples:
+            break
+    elapsed = (datetime.now() - start).total_seconds()
+    return count / elapsed
+
+
+mr = MediaRetriever(VIDEO_URL)
+results = []
+for sample_rate in tqdm(SAMPLE_RATES, desc="sample rates"):
+    row = [sample_rate]
+    for strategy in STRATEGIES:
+        row.append(_benchmark_frames_iterator(mr, sample_rate, strategy))
+    results.append(row)
+
+print("\n" * 4)
+print("RESULTS ON: " + VIDEO_URL)
+print("(sampled frames/sec)")
+print(tabulate(results, headers=["Sample Rate"] + STRATEGIES, floatfmt=".1f"))
@@ -0,0 +1,79 @@
+"""Time and peak memory of decoding a local JPEG with MediaRetriever.image
+
+Each decoder runs in a fresh process, so its peak RSS is not shared with the others
+"""
+import os
+import resource
+import tempfile
+import multiprocessing
+from datetime import datetime
+
+import cv2
+import numpy as np
+from PIL import Image
+from tabulate import tabulate
+
+from multivitamin.media import OpenCVMediaRetriever
+
+print("IMAGE DECODE SPEED TEST!!!")
+
+WIDTH = int(os.environ.get("WIDTH", 4000))
+HEIGHT = int(os.environ.get("HEIGHT", 3000))
+NUM_TESTS = int(os.environ.get("NUM_TESTS", 20))
+TARGET_SIZE = (300, 300)
+
+
+def pil_decode(filepath):
+    """The previous MediaRetriever.image: read into a BytesIO, PIL to RGB, flip and copy"""
+    filelike_obj = OpenCVMediaRetriever(filepath).download(return_filelike=True)
+    image = np.array(Image.open(filelike_obj).convert("RGB"))
+    return image[:, :, ::-1].copy()
+
+
+def mmap_decode(filepath):
+    return OpenCVMediaRetriever(filepath).image
+
+
+def reduced_decode(filepath):
+    return OpenCVMediaRetriever(filepath).get_image(TARGET_SIZE)
+
+
+def _benchmark(decode, filepath, results):
+    """Put seconds per image and peak RSS growth in MB"""
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = datetime.now()
+    for _ in range(NUM_TESTS):
+        image = decode(filepath)
+        assert image.shape[2] == 3
+        del image
+    elapsed = (datetime.now() - start).total_seconds()
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((elapsed / NUM_TESTS, (peak_rss - base_rss) / 2 ** 10))
+
+
+def benchmark(decode, filepath):
+    results = multiprocessing.Queue()
+    p = multiprocessing.Process(target=_benchmark, args=(decode, filepath, results))
+    p.start()
+    result = results.get()
+    p.join()
+    return result
+
+
+if __name__ == "__main__":
+    filepath = os.path.join(tempfile.mkdtemp(), "image.jpg")
+    image = np.random.randint(0, 256, (HEIGHT // 8, WIDTH // 8, 3), dtype=np.uint8)
+    cv2.imwrite(filepath, cv2.resize(image, (WIDTH, HEIGHT)), [cv2.IMWRITE_JPEG_QUALITY, 90])
+
+    tests = [
+        ("PIL, BytesIO", pil_decode),
+        ("cv2.imdecode, mmap", mmap_decode),
+        (f"cv2.imdecode, mmap, target_size={TARGET_SIZE}", reduced_decode),
+    ]
+    results = [[name, *benchmark(decode, filepath)] for name, decode in tests]
+    os.remove(filepath)
+    os.rmdir(os.path.dirname(filepath))
+
+    print("\n" * 4)
+    print(f"RESULTS ON {WIDTH}x{HEIGHT} JPEG, {NUM_TESTS} DECODES")
+    print(tabulate(results, headers=["Decoder", "Seconds per image", "Peak RSS growth MB"]))
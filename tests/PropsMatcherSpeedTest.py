@@ -0,0 +1,61 @@
+from multivitamin.module.utils import (
+    compile_props_matcher,
+    convert_props_to_pandas_query,
+    pandas_query_matches_props,
+)
+
+import pandas as pd
+import random
+from tabulate import tabulate
+from datetime import datetime
+
+print("PROPS MATCHER SPEED TEST!!!")
+
+NUM_REGIONS = 2000
+PROPS_PER_REGION = 3
+VALUES = ["face", "car", "nike", "adidas", "gumgum", "person", "ball", "jersey"]
+PROPERTY_TYPES = ["object", "logo", "placement"]
+
+POIS = [
+    {"property_type": "object", "value": "face"},
+    {"value": "car"},
+    {"property_type": "logo", "company": "gumgum"},
+]
+
+
+def _random_region():
+    return {
+        "props": [
+            {
+                "property_type": random.choice(PROPERTY_TYPES),
+                "value": random.choice(VALUES),
+                "company": random.choice(VALUES),
+                "confidence": random.random(),
+            }
+            for _ in range(PROPS_PER_REGION)
+        ]
+    }
+
+
+def _benchmark(match, regions):
+    start = datetime.now()
+    matches = sum(1 for region in regions if match(region["props"]))
+    elapsed = (datetime.now() - start).total_seconds()
+    return matches, elapsed, 1e6 * elapsed / len(regions)
+
+
+regions = [_random_region() for _ in range(NUM_REGIONS)]
+bool_exp = convert_props_to_pandas_query(POIS)
+matcher = compile_props_matcher(POIS)
+
+results = [
+    ["pandas query"]
+    + list(_benchmark(
+        lambda props: pandas_query_matches_props(bool_exp, pd.DataFrame(props)), regions
+    )),
+    ["compiled matcher"] + list(_benchmark(matcher, regions)),
+]
+
+print("\n" * 4)
+print(f"RESULTS ON {NUM_REGIONS} REGIONS, POIS: {POIS}")
+print(tabulate(results, headers=["Matcher", "Matches", "Total (s)", "Per region (us)"]))
@@ -0,0 +1,91 @@
+"""Construction time and memory of the annotation types for a 1 hour video response
+
+Runs itself with runtime type checking, without (MULTIVITAMIN_TYPECHECK=0) and with
+the columnar region store (MULTIVITAMIN_COLUMNAR_FRAME_ANNS=1)
+"""
+import os
+import sys
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+from tabulate import tabulate
+
+VIDEO_LENGTH_SEC = 3600
+SAMPLE_RATE = 5
+REGIONS_PER_FRAME = 5
+
+
+def build_response():
+    from multivitamin.data import Response
+    from multivitamin.data.response.dtypes import (
+        Region,
+        Property,
+        create_bbox_contour_from_points,
+    )
+
+    response = Response()
+    for i in range(VIDEO_LENGTH_SEC * SAMPLE_RATE):
+        t = i / SAMPLE_RATE
+        regions = [
+            Region(
+                contour=create_bbox_contour_from_points(0.1, 0.1, 0.5, 0.5),
+                props=[Property(server="SpeedTest", value="car", confidence=0.9)],
+            )
+            for _ in range(REGIONS_PER_FRAME)
+        ]
+        response.append_regions(t, regions)
+    return response
+
+
+def run():
+    tracemalloc.start()
+    start = datetime.now()
+    response = build_response()
+    elapsed = (datetime.now() - start).total_seconds()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = datetime.now()
+    d = response.to_dict()
+    to_dict_elapsed = (datetime.now() - start).total_seconds()
+    num_points = sum(
+        len(region["contour"])
+        for image_ann in d["media_annotation"]["frames_annotation"]
+        for region in image_ann["regions"]
+    )
+    print(f"{num_points}\t{elapsed}\t{current / 2 ** 20}\t{peak / 2 ** 20}\t{to_dict_elapsed}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "run":
+        run()
+        sys.exit(0)
+
+    print("RESPONSE SPEED TEST!!!")
+    results = []
+    for typecheck, columnar in [("1", "0"), ("0", "0"), ("0", "1")]:
+        env = dict(
+            os.environ,
+            MULTIVITAMIN_TYPECHECK=typecheck,
+            MULTIVITAMIN_COLUMNAR_FRAME_ANNS=columnar,
+        )
+        out = subprocess.check_output([sys.executable, __file__, "run"], env=env)
+        row = out.decode().strip().splitlines()[-1].split("\t")
+        results.append([typecheck, columnar, int(row[0])] + [float(x) for x in row[1:]])
+
+    print("\n" * 4)
+    print(
+        f"RESULTS ON A {VIDEO_LENGTH_SEC} SEC VIDEO, {SAMPLE_RATE} FPS, "
+        f"{REGIONS_PER_FRAME} REGIONS PER FRAME"
+    )
+    headers = [
+        "TYPECHECK",
+        "COLUMNAR",
+        "Points",
+        "Time (s)",
+        "Memory (MB)",
+        "Peak memory (MB)",
+        "to_dict (s)",
+    ]
+    print(tabulate(results, headers=headers))
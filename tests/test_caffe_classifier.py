@@ -10,6 +10,7 @@ import cv2
 from multivitamin.applications.classifiers import CaffeClassifier
 from multivitamin.data.request import Request
 from multivitamin.data.response import Response
+from multivitamin.data.response.dtypes import Region, create_bbox_contour_from_points
 from utils import generate_fileobj_from_s3_folder
 
 # from multivitamin.module_api.utils import load_idmap
@@ -72,6 +73,17 @@ def test_process():
         log.info(json.dumps(response.dict, indent=2))
 
 
+def test_malformed_prev_region_is_skipped():
+    image = np.zeros((100, 100, 3), dtype=np.uint8)
+    good = Region(contour=create_bbox_contour_from_points(0.1, 0.1, 0.5, 0.5), props=[])
+    # not a 4 point bbox contour, cannot be cropped
+    malformed = Region(contour=good["contour"][:3], props=[])
+    cc.response = Response()
+    cc.process_images([image, image], [0.0, 0.0], [malformed, good])
+    assert len(malformed["props"]) == 0
+    assert len(good["props"]) == cc.top_n
+
+
 # def download_expected_response(path):
 #     s3 = boto3.client("s3")
 #     filelike = BytesIO()
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from multivitamin.data import Response
+from utils import stub_caffe, import_with_stubs
+
+LABELS = ["Garbage", "Nike", "Messy", "Adidas", "MessyDark"]
+INPUT_SHAPE = (1, 3, 8, 8)
+
+
+class StubBlob:
+    def __init__(self, shape):
+        self.data = np.zeros(shape, dtype=np.float32)
+
+    def reshape(self, *shape):
+        self.data = np.zeros(shape, dtype=np.float32)
+
+
+class StubNet:
+    """Returns the row of probs indexed by the mean pixel value of each image"""
+
+    probs = None
+
+    def __init__(self, *args):
+        self.blobs = {"data": StubBlob(INPUT_SHAPE)}
+
+    def forward(self):
+        rows = np.rint(self.blobs["data"].data.mean(axis=(1, 2, 3))).astype(int)
+        return {"prob": self.probs[rows]}
+
+
+@pytest.fixture
+def caffe_classifier(monkeypatch, tmp_path):
+    """CaffeClassifier factory, imported against a stub caffe, without a model"""
+    module = import_with_stubs(
+        monkeypatch,
+        "multivitamin.applications.images.classifiers.caffe_classifier",
+        stub_caffe(StubNet),
+    )
+
+    def factory(labels=LABELS, **kwargs):
+        (tmp_path / "labels.txt").write_text("\n".join(labels))
+        return module.CaffeClassifier("Stub", "1.0.0", str(tmp_path), gpuid=None, **kwargs)
+
+    return factory
+
+
+def _old_top_n(probs, labels, top_n):
+    """Per-row LOGOEXCLUDE loop that CaffeClassifier._top_n replaced"""
+    rows = []
+    for p in probs:
+        p_indexes = np.flip(np.argsort(p), 0)
+        while len(p_indexes) > 1 and labels[p_indexes[0]] in ("Garbage", "Messy", "MessyDark"):
+            p_indexes = np.delete(p_indexes, 0)
+        rows.append([(index, p[index]) for index in p_indexes[:top_n]])
+    return rows
+
+
+@pytest.mark.parametrize("labels", [LABELS, ["Messy", "Garbage", "MessyDark"]])
+@pytest.mark.parametrize("top_n", [1, 2, 3, 5])
+def test_top_n_matches_per_row_loop(caffe_classifier, labels, top_n):
+    classifier = caffe_classifier(labels, top_n=top_n)
+    rng = np.random.RandomState(0)
+    probs = rng.permutation(np.arange(100 * len(labels))).reshape(100, len(labels))
+    probs = probs.astype(np.float32) / probs.max()
+    if labels is LABELS:
+        # rows whose one, or all leading labels but one are excluded
+        probs[0] = [0.5, 0.1, 0.3, 0.05, 0.05]
+        probs[1] = [0.4, 0.05, 0.3, 0.1, 0.15]
+
+    indexes, confidences, valid = classifier._top_n(probs)
+
+    actual = [
+        [(indexes[row, col], confidences[row, col]) for col in np.flatnonzero(valid[row])]
+        for row in range(len(probs))
+    ]
+    assert actual == _old_top_n(probs, classifier.labels, top_n)
+
+
+def test_failing_frame_is_skipped(caffe_classifier, monkeypatch):
+    monkeypatch.setattr(StubNet, "probs", np.eye(len(LABELS), dtype=np.float32))
+    classifier = caffe_classifier()
+    classifier.response = Response()
+
+    images = [np.full((16, 12, 3), 1, dtype=np.uint8), np.full((16, 12, 3), 3, dtype=np.uint8)]
+    # a grayscale frame does not fit the 3 channels of the input blob
+    images.insert(1, np.full((16, 12), 1, dtype=np.uint8))
+    classifier.process_images(images, [0.0, 1.0, 2.0], [None, None, None])
+
+    labels = [
+        (frame_ann["t"], region["props"][0]["value"])
+        for frame_ann in classifier.response.frame_anns
+        for region in frame_ann["regions"]
+    ]
+    assert labels == [(0.0, "Nike"), (2.0, "Adidas")]
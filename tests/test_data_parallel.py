@@ -0,0 +1,194 @@
+import os
+import time
+import random
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from multivitamin.data import Request, Response
+from multivitamin.data.response.dtypes import Region, Property
+from multivitamin.module import Codes, ImagesModule, DataParallelImagesModule
+from multivitamin.module import data_parallel
+
+NUM_FRAMES = 30
+
+
+class MeanModule(ImagesModule):
+    """Labels each frame with its mean pixel value, and the device of the replica"""
+
+    def __init__(self, device=None, fail_at=None, **kwargs):
+        super().__init__("Mean", "1.0.0", prop_type="mean", **kwargs)
+        self.device = device
+        self.fail_at = fail_at
+        self.threads = set()
+
+    def process_images(self, images, tstamps, prev_regions=None):
+        self.threads.add(threading.get_ident())
+        time.sleep(random.random() * 0.01)  # finish batches out of order
+        for image, tstamp in zip(images, tstamps):
+            if self.fail_at is not None and tstamp >= self.fail_at:
+                raise ValueError(f"Problem at {tstamp}")
+            prop = Property(
+                server=self.name,
+                ver=self.version,
+                value=str(int(image.mean())),
+                property_type=self.prop_type,
+                company=str(self.device),
+            )
+            self.response.append_region(t=tstamp, region=Region(props=[prop]))
+
+
+@pytest.fixture(scope="module")
+def video_url(tmp_path_factory):
+    filepath = os.path.join(str(tmp_path_factory.mktemp("media")), "video.mp4")
+    writer = cv2.VideoWriter(filepath, cv2.VideoWriter_fourcc(*"mp4v"), 10, (64, 48))
+    for i in range(NUM_FRAMES):
+        writer.write(np.full((48, 64, 3), i * 8, dtype=np.uint8))
+    writer.release()
+    return filepath
+
+
+def _process(module, url):
+    response = Response(Request({"url": url, "sample_rate": 100.0}))
+    return module.process(response)
+
+
+def _labels(response):
+    return [
+        (frame_ann["t"], region["props"][0]["value"])
+        for frame_ann in response.frame_anns
+        for region in frame_ann["regions"]
+    ]
+
+
+@pytest.mark.parametrize("batch_size", [1, 4])
+def test_data_parallel_matches_single_replica(video_url, batch_size):
+    expected = _process(MeanModule(batch_size=batch_size), video_url)
+
+    replicas = []
+
+    def factory(device):
+        replica = MeanModule(device, batch_size=batch_size)
+        replicas.append(replica)
+        return replica
+
+    module = DataParallelImagesModule(factory, devices=[None, None, None])
+    try:
+        assert module.name == "Mean" and module.batch_size == batch_size
+        response = _process(module, video_url)
+        # a second request reuses the replicas
+        response2 = _process(module, video_url)
+    finally:
+        module.close()
+
+    assert module.code == Codes.SUCCESS
+    assert len(replicas) == 3
+    assert len(set.union(*(r.threads for r in replicas))) > 1
+    assert len(_labels(expected)) > 0
+    assert _labels(response) == _labels(expected)
+    assert _labels(response2) == _labels(expected)
+    assert [t for t, _ in _labels(response)] == sorted(t for t, _ in _labels(response))
+    assert module.tstamps_processed == expected.footprints[-1]["tstamps"]
+    assert response.footprints[-1]["code"] == Codes.SUCCESS.name
+
+
+def test_data_parallel_problematic_frames(video_url):
+    module = DataParallelImagesModule(
+        lambda device: MeanModule(device, fail_at=0.0), devices=[None, None]
+    )
+    try:
+        response = _process(module, video_url)
+    finally:
+        module.close()
+    assert module.code == Codes.ERROR_PROCESSING
+    assert response.footprints[-1]["code"] == Codes.ERROR_PROCESSING.name
+
+
+@pytest.mark.parametrize("fail_at", [1.85, 1.95])
+def test_data_parallel_problematic_last_batches(video_url, fail_at):
+    # the last 10 or 9 batches fail, their errors surface after the last batch is queued
+    expected = MeanModule(fail_at=fail_at)
+    _process(expected, video_url)
+    module = DataParallelImagesModule(
+        lambda device: MeanModule(device, fail_at=fail_at), devices=[None, None, None]
+    )
+    try:
+        response = _process(module, video_url)
+    finally:
+        module.close()
+    assert module.code == expected.code
+    assert response.footprints[-1]["code"] == expected.code.name
+    assert module.num_problematic_frames == expected.num_problematic_frames
+
+
+def test_data_parallel_factory_error():
+    def factory(device):
+        if device == 1:
+            raise RuntimeError("No such device")
+        return MeanModule(device)
+
+    with pytest.raises(RuntimeError):
+        DataParallelImagesModule(factory, devices=[0, 1])
+
+
+def test_select_devices(monkeypatch):
+    monkeypatch.setattr(data_parallel.GPUUtility, "get_gpus", lambda self: [])
+    assert data_parallel.select_devices(num_cpu_replicas=2) == [None, None]
+    monkeypatch.setattr(data_parallel.GPUUtility, "get_gpus", lambda self: [2, 0])
+    assert data_parallel.select_devices(priority="first") == [2, 0]
+
+
+class PrevRegionModule(ImagesModule):
+    """Appends a property to each prev region, like CaffeClassifier"""
+
+    def __init__(self, device=None, **kwargs):
+        super().__init__("PrevRegion", "1.0.0", prop_type="prev", **kwargs)
+        self.set_prev_props_of_interest([{"property_type": "mean"}])
+        self.prev_regions = []
+
+    def process_images(self, images, tstamps, prev_regions=None):
+        time.sleep(random.random() * 0.01)  # finish batches out of order
+        for image, tstamp, prev_region in zip(images, tstamps, prev_regions):
+            self.prev_regions.append(prev_region)
+            prop = Property(
+                server=self.name,
+                ver=self.version,
+                value=str(int(image.mean())),
+                property_type=self.prop_type,
+            )
+            prev_region.get("props").append(prop)
+
+
+def _props(response):
+    return [
+        (frame_ann["t"], [(p["property_type"], p["value"]) for p in region["props"]])
+        for frame_ann in response.frame_anns
+        for region in frame_ann["regions"]
+    ]
+
+
+def test_data_parallel_prev_regions(video_url):
+    expected = PrevRegionModule(batch_size=4).process(_process(MeanModule(), video_url))
+
+    replicas = []
+
+    def factory(device):
+        replica = PrevRegionModule(device, batch_size=4)
+        replicas.append(replica)
+        return replica
+
+    module = DataParallelImagesModule(factory, devices=[None, None])
+    try:
+        response = module.process(_process(MeanModule(), video_url))
+    finally:
+        module.close()
+
+    assert module.code == Codes.SUCCESS
+    assert len(_props(expected)) > 0
+    assert _props(response) == _props(expected)
+    assert all(len(props) == 2 for _, props in _props(response))
+    # replicas append to copies of the prev regions, merged by the main thread
+    regions = {id(region) for frame_ann in response.frame_anns for region in frame_ann["regions"]}
+    assert not regions & {id(region) for r in replicas for region in r.prev_regions}
@@ -0,0 +1,98 @@
+import os
+from io import BytesIO
+
+import pytest
+import cv2
+import numpy as np
+
+from multivitamin.media import config, downloader
+from multivitamin.media.opencv_media_retriever import OpenCVMediaRetriever
+from multivitamin.media.http_fileobj import HTTPFile
+from multivitamin.media.file_retriever import FileRetriever
+
+from utils import RangeRequestHandler, serve_directory
+
+CONTENT = os.urandom(3 * 2 ** 20 + 12345)
+
+
+@pytest.fixture
+def media_dir(tmp_path):
+    with open(os.path.join(str(tmp_path), "video.mp4"), "wb") as f:
+        f.write(CONTENT)
+    return str(tmp_path)
+
+
+@pytest.mark.parametrize("headers", [False, True])
+@pytest.mark.parametrize("part_size", [2 ** 18, 2 ** 30])
+def test_download(media_dir, part_size, headers):
+    with serve_directory(media_dir) as base_url:
+        url = base_url + "/video.mp4"
+        head = downloader.request(url, method="HEAD").headers if headers else None
+        outf = BytesIO(b"prefix")
+        outf.seek(0, 2)
+        num_bytes = downloader.download(url, outf, headers=head, part_size=part_size, workers=4)
+    assert num_bytes == len(CONTENT)
+    assert outf.getvalue() == b"prefix" + CONTENT
+
+
+def test_request_retries(media_dir, monkeypatch):
+    monkeypatch.setattr(downloader.time, "sleep", lambda seconds: None)
+
+    class FailingHandler(RangeRequestHandler):
+        failures = [503, 502]
+
+    with serve_directory(media_dir, FailingHandler) as base_url:
+        response = downloader.request(base_url + "/video.mp4", retries=2)
+        assert response.status_code == 200
+        assert response.content == CONTENT
+
+        FailingHandler.failures = [503, 503]
+        response = downloader.request(base_url + "/video.mp4", retries=1)
+        assert response.status_code == 503
+
+
+def test_http_file_read_ahead(media_dir):
+    with serve_directory(media_dir) as base_url:
+        f = HTTPFile(base_url + "/video.mp4", read_ahead=2 ** 16)
+        assert f.seekable() and f.content_length == len(CONTENT)
+        data = b"".join(iter(lambda: f.read(1000), b""))
+        assert data == CONTENT
+        f.seek(-10, 2)
+        assert f.read() == CONTENT[-10:]
+        f.seek(100)
+        assert f.read(5) == CONTENT[100:105]
+
+
+def test_missing_remote_file(media_dir):
+    with serve_directory(media_dir) as base_url:
+        assert FileRetriever(base_url + "/video.mp4").exists
+        with pytest.raises(FileNotFoundError):
+            FileRetriever(base_url + "/missing.mp4")
+
+
+def test_media_retriever_probes_once(media_dir, monkeypatch):
+    monkeypatch.setattr(config, "MEDIA_CACHE_VIDEOS", False)
+    requests_made = []
+
+    class CountingHandler(RangeRequestHandler):
+        def do_HEAD(self):
+            requests_made.append("HEAD")
+            super().do_HEAD()
+
+        def do_GET(self):
+            requests_made.append("GET")
+            super().do_GET()
+
+    filepath = os.path.join(media_dir, "clip.mp4")
+    writer = cv2.VideoWriter(filepath, cv2.VideoWriter_fourcc(*"mp4v"), 10, (64, 48))
+    for _ in range(10):
+        writer.write(np.zeros((48, 64, 3), dtype=np.uint8))
+    writer.release()
+    with serve_directory(media_dir, CountingHandler) as base_url:
+        med_ret = OpenCVMediaRetriever(base_url + "/clip.mp4")
+        assert med_ret.is_video and not med_ret.is_image
+        assert med_ret.content_length == os.path.getsize(filepath)
+        assert med_ret.accepts_ranges
+        assert requests_made == ["HEAD"]
+        assert med_ret.get_w_h() == (64, 48)
+        assert "HEAD" not in requests_made[1:]
@@ -0,0 +1,59 @@
+import copy
+import pickle
+from dataclasses import asdict
+
+import pytest
+
+from multivitamin.data.response.dtypes import (
+    Point,
+    Property,
+    Region,
+    ImageAnn,
+    ResponseInternal,
+    Footprint,
+    to_builtins,
+)
+
+
+def test_slotted():
+    p = Point(0.5, 0.25)
+    assert not hasattr(p, "__dict__")
+    with pytest.raises(AttributeError):
+        p.z = 1.0
+
+
+def test_dict_access():
+    region = Region(props=[Property(value="car")])
+    assert region["props"][0]["value"] == "car"
+    region["father_id"] = "1"
+    assert region.father_id == "1"
+    assert list(region) == ["contour", "props", "father_id", "features", "id"]
+    assert len(region) == 5
+    assert region.get("not_a_field") is None
+    with pytest.raises(KeyError):
+        region["not_a_field"] = 1
+    with pytest.raises(TypeError):
+        del region["props"]
+
+
+def test_asdict_copy_pickle():
+    ann = ImageAnn(t=1.23456789, regions=[Region(id="1")])
+    assert ann.t == 1.2346
+    d = asdict(ann)
+    assert d["regions"][0]["contour"][1] == {"x": 1.0, "y": 0.0}
+    assert copy.deepcopy(ann) == ann
+    assert pickle.loads(pickle.dumps(ann)) == ann
+    assert asdict(ResponseInternal())["media_annotation"]["w"] == 0
+
+
+def test_to_builtins():
+    internal = ResponseInternal()
+    internal.media_annotation.codes.append(Footprint(tstamps=[0.0, 0.5]))
+    internal.media_annotation.frames_annotation.append(
+        ImageAnn(t=0.5, regions=[Region(props=[Property(value="car")])])
+    )
+    d = to_builtins(internal)
+    assert d == asdict(internal)
+    assert type(d["media_annotation"]["frames_annotation"][0]) is dict
+    d["media_annotation"]["codes"][0]["tstamps"].append(1.0)
+    assert internal.media_annotation.codes[0].tstamps == [0.0, 0.5]
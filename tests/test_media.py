@@ -1,9 +1,15 @@
+import os
+import cv2
 import numpy as np
 import pytest
+import math
 import random
 import glog as log
 
 from multivitamin.media import OpenCVMediaRetriever
+from multivitamin.media import media_retriever
+from multivitamin.media.media_retriever import imdecode, imread_mmap, scaled_size
+from multivitamin.media.opencv_media_retriever import OpenCVFramesIterator
 
 VIDEO_URL = "https://s3.amazonaws.com/video-ann-testing/NHL_GAME_VIDEO_NJDMTL_M2_NATIONAL_20180401_1520698069177.t.mp4"
 IMAGE_URL = "https://upload.wikimedia.org/wikipedia/commons/0/0b/Cat_poster_1.jpg"
@@ -47,6 +53,76 @@ def test_image():
     assert(mr.is_image)
 
 
+def test_imread_mmap(tmp_path):
+    image = np.random.randint(0, 256, (48, 64, 3), dtype=np.uint8)
+    filepath = os.path.join(str(tmp_path), "image.png")
+    cv2.imwrite(filepath, image)
+    assert np.array_equal(imread_mmap(filepath), image)
+    with open(filepath, "rb") as f:
+        assert np.array_equal(imdecode(f.read()), image)
+
+    cv2.imwrite(filepath, image[:, :, 0])
+    assert imread_mmap(filepath).shape == (48, 64, 3)
+
+    open(filepath, "wb").close()
+    assert imread_mmap(filepath) is None
+    assert imdecode(b"not an image") is None
+
+
+def test_local_image(tmp_path):
+    image = np.random.randint(0, 256, (48, 64, 3), dtype=np.uint8)
+    filepath = os.path.join(str(tmp_path), "image.png")
+    cv2.imwrite(filepath, image)
+    mr = OpenCVMediaRetriever(filepath)
+    assert mr.is_image
+    assert mr.get_w_h() == (64, 48)
+    assert np.array_equal(mr.image, image)
+    assert np.array_equal(mr.get_frame(), image)
+
+
+def test_local_image_pil_fallback(tmp_path, monkeypatch):
+    image = np.random.randint(0, 256, (48, 64, 3), dtype=np.uint8)
+    filepath = os.path.join(str(tmp_path), "image.png")
+    cv2.imwrite(filepath, image)
+    monkeypatch.setattr(media_retriever, "imread_mmap", lambda filepath, flags: None)
+    assert np.array_equal(OpenCVMediaRetriever(filepath).image, image)
+
+
+def test_scaled_size():
+    assert scaled_size(3840, 2160, (300, 300)) == (533, 300)
+    assert scaled_size(2160, 3840, (300, 300)) == (300, 533)
+    assert scaled_size(640, 480, (224, 224)) == (299, 224)
+    # never upscaled
+    assert scaled_size(200, 100, (300, 300)) == (200, 100)
+    assert scaled_size(640, 200, (300, 300)) == (640, 200)
+
+
+def test_local_image_target_size(tmp_path):
+    image = np.random.randint(0, 256, (600, 800, 3), dtype=np.uint8)
+    filepath = os.path.join(str(tmp_path), "image.jpg")
+    cv2.imwrite(filepath, image)
+    mr = OpenCVMediaRetriever(filepath)
+    assert mr.get_w_h() == (800, 600)
+    (frame, tstamp), = mr.get_frames_iterator(target_size=(100, 100))
+    assert frame.shape == (100, 133, 3) and tstamp == 0.0
+    assert mr._image is None  # reduced decode, the full size image is not decoded
+    assert mr.image.shape == (600, 800, 3)
+    assert mr.get_image((100, 100)).shape == (100, 133, 3)
+    assert mr.get_image((1000, 1000)) is mr.image
+
+
+def test_local_video_target_size(tmp_path):
+    filepath = os.path.join(str(tmp_path), "clip.mp4")
+    writer = cv2.VideoWriter(filepath, cv2.VideoWriter_fourcc(*"mp4v"), 10, (64, 48))
+    for i in range(10):
+        writer.write(np.full((48, 64, 3), i * 20, dtype=np.uint8))
+    writer.release()
+    mr = OpenCVMediaRetriever(filepath)
+    assert mr.get_w_h() == (64, 48)
+    frames = [frame for frame, _ in mr.get_frames_iterator(target_size=(24, 24))]
+    assert frames and all(frame.shape == (24, 32, 3) for frame in frames)
+
+
 def test_download():
     mr = OpenCVMediaRetriever(IMAGE_URL)
     filelike_obj = mr.download(return_filelike=True)
@@ -54,6 +130,86 @@ def test_download():
     assert len(filelike_obj.read()) > 0
 
 
+class FakeVideoCapture():
+    """Minimal cv2.VideoCapture over integer frames, counting decoded frames"""
+
+    def __init__(self, fps, num_frames):
+        self.fps = fps
+        self.num_frames = num_frames
+        self.pos = 0
+        self.grabbed = False
+        self.num_retrieved = 0
+
+    def get(self, prop):
+        return self.pos * 1000.0 / self.fps
+
+    def set(self, prop, msec):
+        self.pos = int(round(msec * self.fps / 1000.0))
+
+    def grab(self):
+        self.grabbed = self.pos < self.num_frames
+        if self.grabbed:
+            self.pos += 1
+        return self.grabbed
+
+    def retrieve(self):
+        if not self.grabbed:
+            return False, None
+        self.num_retrieved += 1
+        return True, self.pos - 1
+
+
+@pytest.mark.parametrize("sample_rate", [100, 7, 1, 0.2])
+def test_frames_iterator_strategies(sample_rate):
+    results = {}
+    for strategy in ["grab", "seek", "auto"]:
+        cap = FakeVideoCapture(fps=30.0, num_frames=3000)
+        results[strategy] = list(
+            OpenCVFramesIterator(cap, 30.0, sample_rate=sample_rate, strategy=strategy)
+        )
+    assert results["grab"] == results["seek"] == results["auto"]
+    assert len(results["grab"]) == 3000 // max(math.ceil(30.0 / sample_rate), 1)
+
+
+def test_frames_iterator_targeted_tstamps():
+    cap = FakeVideoCapture(fps=30.0, num_frames=3000)
+    tstamps = [90.0, 1.0, 1.1, 50.0, 1.0, 200.0]
+    frames_iter = OpenCVFramesIterator(cap, 30.0, tstamps=tstamps, gop_size=30)
+    results = list(frames_iter)
+    assert [t for _, t in results] == [1.0, 1.1, 50.0, 90.0]
+    assert [f for f, _ in results] == [30, 33, 1500, 2700]
+    assert cap.num_retrieved == 4
+
+
+def test_pims_frames_iterator_targeted_tstamps():
+    pytest.importorskip("pims")
+    from multivitamin.media.pims_media_retriever import PIMSFramesIterator
+
+    # RGB frames filled with their index
+    video = [np.full((4, 4, 3), idx, dtype=np.int32) for idx in range(300)]
+    tstamps = [9.0, 1.0, 1.1, 5.0, 1.0, 20.0]
+    results = list(PIMSFramesIterator(video, 30.0, tstamps=tstamps, end_tstamp=10.0))
+    assert [t for _, t in results] == [1.0, 1.1, 5.0, 9.0]
+    assert [int(f[0, 0, 0]) for f, _ in results] == [30, 33, 150, 270]
+
+
+def test_pims_random_access():
+    pytest.importorskip("pims")
+    from multivitamin.media import PIMSMediaRetriever
+
+    mr = PIMSMediaRetriever(VIDEO_URL)
+    tstamps = [2.0, 0.0, 1.0, 2.0]
+    frames, actual_tstamps = mr.get_frames(tstamps)
+    assert frames.shape == (len(tstamps),) + tuple(mr.shape)
+    assert np.allclose(actual_tstamps, tstamps, atol=1.0 / mr.fps)
+    for frame, tstamp in zip(frames, tstamps):
+        assert np.array_equal(frame, mr.get_frame(tstamp))
+
+    frames_iter = mr.get_frames_iterator(sample_rate=1.0, end_tstamp=2.0)
+    for frame, tstamp in frames_iter:
+        assert np.array_equal(frame, mr[mr.tstamp_to_frame_index(tstamp)])
+
+
 # @pytest.mark.parametrize("video_url", VIDEO_URLS)
 # def test_get_frame(video_url):
 #     efficient_mr, fast_mr = create_media_retrievers(video_url)
@@ -0,0 +1,94 @@
+import os
+
+import pytest
+import requests
+
+from multivitamin.media import cache, file_retriever
+from multivitamin.media.cache import MediaCache
+from multivitamin.media.file_retriever import FileRetriever
+
+URL = "https://example.com/media/image.jpg"
+
+
+def test_media_cache(tmp_path):
+    media_cache = MediaCache(str(tmp_path), max_bytes=25)
+    key = MediaCache.key(URL, '"etag1"')
+    assert key.endswith(".jpg")
+    assert key != MediaCache.key(URL, '"etag2"')
+
+    assert media_cache.get(key) is None
+    path = media_cache.put(key, [b"0123456789"])
+    assert media_cache.get(key) == path
+    with open(path, "rb") as f:
+        assert f.read() == b"0123456789"
+    assert media_cache.stats() == {"hits": 1, "misses": 1}
+    assert not [name for name in os.listdir(str(tmp_path)) if name.startswith(cache.TMP_PREFIX)]
+
+    # key2 is the least recently used entry once key is read again
+    key2 = MediaCache.key(URL + "2")
+    key3 = MediaCache.key(URL + "3")
+    media_cache.put(key2, [b"0123456789"])
+    os.utime(media_cache.get(key2), (0, 0))
+    media_cache.put(key3, [b"0123456789"])
+    assert media_cache.get(key2) is None
+    assert media_cache.get(key) is not None
+    assert media_cache.get(key3) is not None
+
+    # the last entry is kept even if it is bigger than the cache
+    key4 = MediaCache.key(URL + "4")
+    media_cache.put(key4, [b"0" * 100])
+    assert media_cache.get(key4) is not None
+    assert sorted(os.listdir(str(tmp_path))) == [key4]
+
+
+class _FakeResponse:
+    ok = True
+
+    def __init__(self, headers):
+        self.headers = headers
+
+
+def test_file_retriever_download_is_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "_media_cache", MediaCache(str(tmp_path), max_bytes=2 ** 20))
+    etag = {"ETag": '"v1"'}
+    gets = []
+
+    def head(url, method="GET"):
+        assert method == "HEAD"
+        return _FakeResponse(dict(etag, **{"Content-Type": "image/jpeg"}))
+
+    def download(url, outf, headers=None):
+        gets.append(url)
+        outf.write(b"image bytes")
+
+    monkeypatch.setattr(file_retriever, "request", head)
+    monkeypatch.setattr(file_retriever, "download", download)
+
+    assert FileRetriever(URL).download(return_filelike=True).read() == b"image bytes"
+    assert FileRetriever(URL).download(return_filelike=True).read() == b"image bytes"
+    assert len(gets) == 1
+    assert cache.get_media_cache().stats() == {"hits": 1, "misses": 1}
+
+    etag["ETag"] = '"v2"'
+    FileRetriever(URL).download(return_filelike=True)
+    assert len(gets) == 2
+
+
+def test_failed_cached_download_is_not_repeated(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "_media_cache", MediaCache(str(tmp_path), max_bytes=2 ** 20))
+    gets = []
+
+    def head(url, method="GET"):
+        return _FakeResponse({"ETag": '"v1"', "Content-Type": "image/jpeg"})
+
+    def download(url, outf, headers=None):
+        gets.append(url)
+        raise requests.ConnectionError("dead url")
+
+    monkeypatch.setattr(file_retriever, "request", head)
+    monkeypatch.setattr(file_retriever, "download", download)
+
+    with pytest.raises(requests.ConnectionError):
+        FileRetriever(URL).download(return_filelike=True)
+    assert len(gets) == 1
+    assert os.listdir(str(tmp_path)) == []
@@ -1,4 +1,12 @@
+import pytest
+
 from multivitamin.module import Module
+from multivitamin.module.utils import (
+    compile_props_matcher,
+    crop_batch_generator,
+    convert_props_to_pandas_query,
+    pandas_query_matches_props,
+)
 
 
 def test_prev_props_of_interest():
@@ -11,3 +19,63 @@ def test_prev_props_of_interest():
     cmod = ConcreteModule(server_name, version)
     pois = [{"property_type": "object", "value": "car"}]
     cmod.set_prev_props_of_interest(pois)
+    assert cmod.prev_pois_matcher([{"property_type": "object", "value": "car"}])
+    assert not cmod.prev_pois_matcher([{"property_type": "object", "value": "face"}])
+
+
+def test_props_matcher_matches_pandas_query():
+    pd = pytest.importorskip("pandas")
+
+    pois = [
+        {"property_type": "object", "value": "face"},
+        {"value": "car"},
+        {"company": "gumgum", "confidence": 0.5},
+    ]
+    props_lists = [
+        [{"property_type": "object", "value": "face", "company": "x", "confidence": 1.0}],
+        [{"property_type": "logo", "value": "face", "company": "x", "confidence": 1.0}],
+        [
+            {"property_type": "logo", "value": "nike", "company": "x", "confidence": 1.0},
+            {"property_type": "object", "value": "car", "company": "x", "confidence": 1.0},
+        ],
+        [{"property_type": "logo", "value": "nike", "company": "gumgum", "confidence": "0.5"}],
+        [{"property_type": "logo", "value": "nike", "company": "gumgum", "confidence": 0.5}],
+        [{"property_type": "logo", "value": None, "company": None, "confidence": 0.0}],
+    ]
+    bool_exp = convert_props_to_pandas_query(pois)
+    matcher = compile_props_matcher(pois)
+    for props in props_lists:
+        expected = pandas_query_matches_props(bool_exp, pd.DataFrame(props))
+        assert matcher(props) == expected
+
+
+def test_crop_batch_generator():
+    np = pytest.importorskip("numpy")
+
+    frame = np.arange(100 * 200 * 3, dtype=np.uint8).reshape(100, 200, 3)
+    region = {
+        "contour": [
+            {"x": 0.0, "y": 0.0},
+            {"x": 0.5, "y": 0.0},
+            {"x": 0.5, "y": 0.5},
+            {"x": 0.0, "y": 0.5},
+        ]
+    }
+    empty_region = {
+        "contour": [
+            {"x": 0.5, "y": 0.5},
+            {"x": 0.5, "y": 0.5},
+            {"x": 0.5, "y": 0.5},
+            {"x": 0.5, "y": 0.5},
+        ]
+    }
+    malformed_region = {"contour": region["contour"][:3]}
+    items = [(frame, 0.0, region), (frame, 0.5, empty_region), (frame, 1.0, region)] * 2
+    items.insert(1, (frame, 0.2, malformed_region))
+    batches = list(crop_batch_generator(items, 3, (16, 32)))
+    assert [len(tstamps) for _, tstamps, _ in batches] == [3, 1]
+    crops, tstamps, regions = batches[0]
+    assert crops.shape == (3, 16, 32, 3) and crops.flags["C_CONTIGUOUS"]
+    assert tstamps == [0.0, 1.0, 0.0]
+    assert all(r is region for r in regions)
+    assert np.array_equal(crops[0], crops[1])
@@ -0,0 +1,31 @@
+import pytest
+
+from multivitamin.media import PrefetchingFramesIterator
+
+
+def frames(n, fail_at=None):
+    for i in range(n):
+        if i == fail_at:
+            raise ValueError("decoding failed")
+        yield f"frame_{i}", float(i)
+
+
+def test_same_frames_in_order():
+    assert list(PrefetchingFramesIterator(frames(100), buffer_size=4)) == list(frames(100))
+
+
+def test_decoding_error_is_raised():
+    frames_iter = PrefetchingFramesIterator(frames(10, fail_at=5), buffer_size=2)
+    for _ in range(5):
+        next(frames_iter)
+    with pytest.raises(ValueError):
+        next(frames_iter)
+
+
+def test_close_before_end():
+    frames_iter = PrefetchingFramesIterator(frames(1000), buffer_size=2)
+    assert next(frames_iter) == ("frame_0", 0.0)
+    frames_iter.close()
+    assert not frames_iter._thread.is_alive()
+    with pytest.raises(StopIteration):
+        next(frames_iter)
@@ -0,0 +1,128 @@
+import time
+import threading
+
+import pytest
+
+from multivitamin.apis import CommAPI, PushDispatcher
+
+
+class RecordingCommAPI(CommAPI):
+    def __init__(self, failures=0, delay=0.0, release=None):
+        self.failures = failures
+        self.delay = delay
+        self.release = release
+        self.pushed = []
+        self.lock = threading.Lock()
+
+    def pull(self, n=1):
+        raise NotImplementedError()
+
+    def push(self, response):
+        time.sleep(self.delay)
+        if self.release is not None:
+            self.release.wait()
+        with self.lock:
+            if self.failures > 0:
+                self.failures -= 1
+                raise IOError("push failed")
+            self.pushed.append(response)
+
+
+def test_fan_out_to_all_comms():
+    comms = [RecordingCommAPI(), RecordingCommAPI()]
+    completed = []
+    dispatcher = PushDispatcher(
+        comms, n_workers=4, on_complete=lambda res, ok: completed.append((res, ok))
+    )
+    for idx in range(20):
+        dispatcher.push(idx)
+    dispatcher.close()
+
+    for comm in comms:
+        assert sorted(comm.pushed) == list(range(20))
+    assert sorted(completed) == [(idx, True) for idx in range(20)]
+
+
+def test_retry_after_failure():
+    comm = RecordingCommAPI(failures=2)
+    completed = []
+    dispatcher = PushDispatcher(
+        [comm], retries=2, backoff=0.01, on_complete=lambda res, ok: completed.append(ok)
+    )
+    dispatcher.push("response")
+    dispatcher.close()
+
+    assert comm.pushed == ["response"]
+    assert completed == [True]
+
+
+def test_fan_out_of_equal_responses():
+    comm = RecordingCommAPI()
+    completed = []
+    dispatcher = PushDispatcher(
+        [comm], n_workers=4, on_complete=lambda res, ok: completed.append((res, ok))
+    )
+    for _ in range(10):
+        dispatcher.push("response")
+    dispatcher.close()
+
+    assert comm.pushed == ["response"] * 10
+    assert completed == [("response", True)] * 10
+
+
+@pytest.mark.parametrize("failures", [0, 1])
+def test_timed_out_push_is_not_retried(failures):
+    release = threading.Event()
+    slow_comm = RecordingCommAPI(failures=failures, release=release)
+    completed = []
+    dispatcher = PushDispatcher(
+        [slow_comm],
+        retries=2,
+        timeout=0.05,
+        backoff=0.01,
+        on_complete=lambda res, ok: completed.append(ok),
+    )
+    dispatcher.push("response")
+    time.sleep(0.3)
+    # the abandoned push may still succeed, so the response is neither retried nor failed
+    assert completed == []
+    release.set()
+    dispatcher.close()
+
+    assert completed == [failures == 0]
+    assert slow_comm.pushed == (["response"] if failures == 0 else [])
+
+
+def test_hanging_comm_does_not_block_push():
+    release = threading.Event()
+    completed = []
+    dispatcher = PushDispatcher(
+        [RecordingCommAPI(release=release)],
+        max_queue_size=1,
+        timeout=0.05,
+        on_complete=lambda res, ok: completed.append(res),
+    )
+    pusher = threading.Thread(target=lambda: [dispatcher.push(idx) for idx in range(3)])
+    pusher.start()
+    pusher.join(2)
+    assert not pusher.is_alive()
+
+    release.set()
+    dispatcher.close()
+    assert sorted(completed) == [0, 1, 2]
+
+
+def test_push_finishing_after_close_is_not_completed():
+    release = threading.Event()
+    slow_comm = RecordingCommAPI(release=release)
+    completed = []
+    dispatcher = PushDispatcher(
+        [slow_comm], timeout=0.05, on_complete=lambda res, ok: completed.append(ok)
+    )
+    dispatcher.push("response")
+    dispatcher.close()
+    release.set()
+    time.sleep(0.1)
+
+    assert slow_comm.pushed == ["response"]
+    assert completed == []
@@ -0,0 +1,65 @@
+from multivitamin.data import Response
+from multivitamin.data.response.dtypes import (
+    Region,
+    Property,
+    Point,
+    create_bbox_contour_from_points,
+)
+
+
+def _bbox_region(i, value="car"):
+    return Region(
+        contour=create_bbox_contour_from_points(0.1 * i, 0.2, 0.5, 0.6),
+        props=[Property(server="Test", value=value, confidence=0.5 + 0.01 * i)],
+        id=str(1000 + i),
+    )
+
+
+def _other_region(i):
+    return Region(
+        contour=[Point(0.0, 0.0), Point(0.5, 0.1), Point(0.3, 0.9)],
+        props=[Property(server="Test", value="polygon")],
+        id=str(2000 + i),
+    )
+
+
+def _fill(response):
+    for i in range(5):
+        t = float(i % 3)
+        response.append_region(t, _bbox_region(i, value="car" if i % 2 else "face"))
+        if i == 3:
+            response.append_region(t, _other_region(i))
+        response.append_regions(t, [_bbox_region(i + 10), _bbox_region(i + 20)])
+    return response
+
+
+def test_columnar_to_dict_matches_objects():
+    expected = _fill(Response(columnar=False)).to_dict()
+    response = _fill(Response(columnar=True))
+    assert len(response._region_store) > 0
+    assert response.to_dict() == expected
+    assert len(response._region_store) > 0
+
+
+def test_columnar_frame_anns_flush():
+    expected = _fill(Response(columnar=False))
+    response = _fill(Response(columnar=True))
+    assert response.get_timestamps_from_frames_ann() == [0.0, 1.0, 2.0]
+    assert response.frame_anns == expected.frame_anns
+    assert len(response._region_store) == 0
+    regions = response.get_regions_from_tstamp(1.0)
+    regions[0]["props"].append(Property(value="added"))
+    assert response.to_dict() != expected.to_dict()
+
+
+def test_columnar_map_props():
+    def set_id(prop):
+        prop["property_id"] = 7 if prop["value"] == "car" else 3
+
+    expected = _fill(Response(columnar=False))
+    expected.map_frame_anns_props(set_id)
+    response = _fill(Response(columnar=True))
+    response.map_frame_anns_props(set_id)
+    response.append_region(3.0, _bbox_region(4, value="car"))
+    expected.append_region(3.0, _bbox_region(4, value="car"))
+    assert response.to_dict() == expected.to_dict()
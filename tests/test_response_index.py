@@ -0,0 +1,83 @@
+import random
+
+from multivitamin.data import Response
+from multivitamin.data.response.index import TstampIndex, IntervalIndex
+from multivitamin.data.response.dtypes import (
+    Region,
+    Property,
+    VideoAnn,
+    ImageAnn,
+    Footprint,
+)
+
+
+def _region(value):
+    return Region(props=[Property(server="Test", value=value)])
+
+
+def test_tstamp_index():
+    index = TstampIndex()
+    for t in [1.0, 2.0, 0.5, 3.0, 2.0]:
+        index.add(t, str(t))
+    assert len(index) == 4
+    assert 0.5 in index and 1.5 not in index
+    assert index.tstamps() == [0.5, 1.0, 2.0, 3.0]
+    assert index.tstamps(0.75, 2.0) == [1.0, 2.0]
+    assert index.values(2.0) == ["2.0", "3.0"]
+    assert index.get(1.5, "missing") == "missing"
+
+
+def test_interval_index():
+    rng = random.Random(0)
+    intervals = []
+    index = IntervalIndex()
+    for i in range(300):
+        t1 = rng.uniform(0.0, 100.0)
+        t2 = t1 + rng.expovariate(0.2)
+        intervals.append((t1, t2, i))
+        index.add(t1, t2, i)
+    for _ in range(100):
+        q1 = rng.uniform(-5.0, 105.0)
+        q2 = q1 + rng.uniform(0.0, 10.0)
+        expected = [i for t1, t2, i in sorted(intervals) if t1 <= q2 and t2 >= q1]
+        assert index.overlapping(q1, q2) == expected
+
+
+def test_frame_anns_between():
+    response = Response()
+    for t in [3.0, 1.0, 2.0, 0.0]:
+        response.append_region(t, _region(str(t)))
+    assert [r.props[0].value for r in response.get_regions_between(0.5, 2.0)] == ["1.0", "2.0"]
+
+    response.sort_image_anns_by_timestamp()
+    assert [image_ann.t for image_ann in response.frame_anns] == [0.0, 1.0, 2.0, 3.0]
+    assert response.get_regions_from_tstamp(3.0)[0].props[0].value == "3.0"
+    response.append_region(3.0, _region("3.0b"))
+    assert len(response.frame_anns[3].regions) == 2
+
+    response.frame_anns.append(ImageAnn(t=5.0, regions=[_region("5.0")]))
+    assert response.get_timestamps_from_frames_ann() == [0.0, 1.0, 2.0, 3.0, 5.0]
+    assert response.get_regions_between(4.0, 6.0)[0].props[0].value == "5.0"
+
+
+def test_tracks_between():
+    response = Response()
+    response.append_track(VideoAnn(t1=0.0, t2=10.0))
+    response.append_track(VideoAnn(t1=2.0, t2=3.0))
+    response.append_track(VideoAnn(t1=5.0, t2=6.0))
+    assert [track.t1 for track in response.get_tracks_between(4.0, 5.0)] == [0.0, 5.0]
+    response.tracks.append(VideoAnn(t1=4.5, t2=4.6))
+    assert [track.t1 for track in response.get_tracks_between(4.0, 5.0)] == [0.0, 4.5, 5.0]
+    response.tracks = []
+    assert response.get_tracks_between(0.0, 10.0) == []
+
+
+def test_get_timestamps():
+    response = Response()
+    response.append_footprint(Footprint(server="A", tstamps=[0.0, 1.0, 2.0]))
+    response.append_footprint(Footprint(server="B", tstamps=[1.0, 3.0]))
+    assert response.get_timestamps() == [0.0, 1.0, 2.0, 3.0]
+    assert response.get_timestamps("B") == [1.0, 3.0]
+    response.footprints[1].tstamps.append(4.0)
+    response.append_footprint(Footprint(server="B", tstamps=[5.0]))
+    assert response.get_timestamps("B") == [1.0, 3.0, 4.0, 5.0]
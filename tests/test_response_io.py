@@ -0,0 +1,151 @@
+import io
+import sys
+import json
+import logging
+import threading
+
+import pytest
+
+from multivitamin.data import Response
+from multivitamin.data.response.io import AvroIO, get_avro_io
+from multivitamin.data.response.dtypes import (
+    Region,
+    Property,
+    create_bbox_contour_from_points,
+)
+
+
+def _response(columnar=False):
+    response = Response(columnar=columnar)
+    for i in range(10):
+        response.append_region(
+            i / 10.0,
+            Region(
+                contour=create_bbox_contour_from_points(0.1, 0.2, 0.3, 0.4),
+                props=[Property(server="Test", value="car", confidence=0.5)],
+            ),
+        )
+    return response
+
+
+def test_get_avro_io_is_cached():
+    assert get_avro_io() is get_avro_io()
+    assert get_avro_io(codec="avro") is not get_avro_io(codec="fastavro")
+
+
+def test_codecs_roundtrip():
+    pytest.importorskip("fastavro")
+    doc = _response().to_dict()
+    avro_bytes = AvroIO(codec="avro").encode(doc)
+    fastavro_bytes = AvroIO(codec="fastavro").encode(doc)
+    assert avro_bytes == fastavro_bytes
+    decoded = get_avro_io(codec="avro").decode(avro_bytes)
+    assert get_avro_io(codec="fastavro").decode(avro_bytes) == decoded
+    frame_ann = decoded["media_annotation"]["frames_annotation"][3]
+    assert frame_ann["regions"][0]["props"][0]["value"] == "car"
+
+
+@pytest.mark.parametrize("codec", ["avro", "fastavro"])
+def test_is_valid_avro_doc(codec):
+    if codec == "fastavro":
+        pytest.importorskip("fastavro")
+    avro_io = get_avro_io(codec=codec)
+    doc = _response().to_dict()
+    assert avro_io.is_valid_avro_doc(doc)
+    assert AvroIO.is_valid_avro_doc_static(doc, avro_io.get_schema())
+    doc["media_annotation"]["frames_annotation"][0]["regions"][0]["props"][0]["value"] = 1
+    assert not avro_io.is_valid_avro_doc(doc)
+    assert not avro_io.is_valid_avro_doc(None)
+
+
+def test_trusted_response_skips_validation():
+    doc = _response().to_dict()
+    doc["media_annotation"]["codes"] = None
+    with pytest.raises(ValueError):
+        Response(doc)
+    assert len(Response(doc, trusted=True).frame_anns) == 10
+
+
+@pytest.mark.parametrize("codec", ["avro", "fastavro"])
+@pytest.mark.parametrize("columnar", [False, True])
+def test_write_stream(codec, columnar):
+    if codec == "fastavro":
+        pytest.importorskip("fastavro")
+    response = _response(columnar=columnar)
+    response.append_region(
+        0.5,
+        Region(
+            contour=create_bbox_contour_from_points(0.0, 0.0, 1.0, 1.0),
+            props=[Property(server="Test", value="person", confidence=0.9)],
+        ),
+    )
+    avro_io = get_avro_io(codec=codec)
+    expected = get_avro_io().decode(response.to_bytes())
+
+    outf = io.BytesIO()
+    avro_io.write_stream(outf, response.to_dict(), block_size=3)
+    assert avro_io.decode(outf.getvalue()) == expected
+
+    outf = io.BytesIO()
+    response.write_avro(outf, block_size=4)
+    assert get_avro_io().decode(outf.getvalue()) == expected
+
+
+def test_write_stream_invalid_doc():
+    doc = _response().to_dict()
+    doc["media_annotation"]["frames_annotation"][5]["t"] = "5"
+    with pytest.raises(Exception):
+        get_avro_io().write_stream(io.BytesIO(), doc, block_size=3)
+
+
+def test_to_bytes_matches_encode():
+    response = _response()
+    assert response.to_bytes() == get_avro_io().encode(response.to_dict())
+
+
+def test_str_is_lazy(monkeypatch):
+    response = _response()
+    calls = []
+    to_dict = response.to_dict
+    monkeypatch.setattr(response, "to_dict", lambda: calls.append(1) or to_dict())
+    logger = logging.getLogger("multivitamin.test")
+    logger.setLevel(logging.INFO)
+    logger.debug("response.to_dict(): %s", response)
+    assert not calls
+    assert json.loads(str(response)) == to_dict()
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_concurrent_serialization(columnar):
+    # e.g. a response pushed to several output comms by the PushDispatcher
+    response = _response(columnar=columnar)
+    expected = get_avro_io().decode(response.to_bytes())
+    barrier = threading.Barrier(2)
+    outputs = [[], []]
+
+    def serialize(outputs, write_avro):
+        barrier.wait()
+        for _ in range(50):
+            if write_avro:
+                outf = io.BytesIO()
+                response.write_avro(outf, block_size=3)
+                outputs.append(outf.getvalue())
+            else:
+                outputs.append(response.to_bytes())
+
+    threads = [
+        threading.Thread(target=serialize, args=(outputs[0], True)),
+        threading.Thread(target=serialize, args=(outputs[1], False)),
+    ]
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads often, to interleave serializations
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    for avro_bytes in outputs[0] + outputs[1]:
+        assert get_avro_io().decode(avro_bytes) == expected
+    assert len(response.frame_anns) == 10
@@ -0,0 +1,111 @@
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from multivitamin.server import Server
+from multivitamin.apis import CommAPI
+from multivitamin.module import ImagesModule, PropertiesModule
+from multivitamin.data import Request
+from multivitamin.data.response.dtypes import Property, VideoAnn
+
+
+URLS = [f"file://media/image_{idx}.jpg" for idx in range(10)]
+
+
+class ListCommAPI(CommAPI):
+    def __init__(self, urls):
+        self.messages = [{"url": url} for url in urls]
+        self.pushed = []
+        self.pull_sizes = []
+        self.acked = []
+        self.closed = False
+
+    def pull(self, n=1):
+        self.pull_sizes.append(n)
+        if not self.messages:
+            return [Request({"kill_flag": "true"})]
+        requests = [Request(m) for m in self.messages[:n]]
+        self.messages = self.messages[n:]
+        return requests
+
+    def push(self, responses):
+        self.pushed.append(responses)
+
+    def ack(self, requests):
+        self.acked.extend(requests)
+
+    def close(self):
+        assert not self.closed
+        self.closed = True
+
+
+class SummaryModule(PropertiesModule):
+    def process_properties(self):
+        prop = Property(server=self.name, ver=self.version, value=self.request.url)
+        self.response.append_media_summary(VideoAnn(props=[prop]))
+
+
+@pytest.mark.parametrize("max_inflight", [1, 4])
+def test_pipeline_preserves_order(max_inflight):
+    comm = ListCommAPI(URLS)
+    modules = [SummaryModule("First", "1.0.0"), SummaryModule("Second", "1.0.0")]
+    server = Server(modules, comm, max_inflight=max_inflight)
+    server._start()
+
+    assert [res.url for res in comm.pushed] == URLS
+    assert len(comm.acked) == len(URLS)
+    assert comm.closed
+    for res in comm.pushed:
+        assert [fp["server"] for fp in res.footprints] == ["First", "Second"]
+        assert len(res.media_summary) == 2
+
+
+def test_pipeline_with_push_dispatcher():
+    comm = ListCommAPI(URLS)
+    server = Server(SummaryModule("First", "1.0.0"), comm, max_inflight=4, push_workers=2)
+    server._start()
+
+    assert sorted(res.url for res in comm.pushed) == sorted(URLS)
+    assert len(comm.acked) == len(URLS)
+    assert comm.closed
+
+
+@pytest.mark.parametrize("max_inflight", [1, 4])
+def test_pull_size(max_inflight):
+    comm = ListCommAPI(URLS)
+    server = Server(SummaryModule("First", "1.0.0"), comm, max_inflight=max_inflight, pull_size=4)
+    server._start()
+
+    assert comm.pull_sizes == [4, 4, 4, 4]
+    assert [res.url for res in comm.pushed] == URLS
+
+
+class ThreadModule(ImagesModule):
+    """Records the threads init_thread and process_images run on"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.init_threads = []
+        self.process_threads = set()
+
+    def init_thread(self):
+        self.init_threads.append(threading.get_ident())
+
+    def process_images(self, images, tstamps, prev_regions=None):
+        self.process_threads.add(threading.get_ident())
+
+
+def test_pipeline_inits_module_threads(tmp_path):
+    filepath = str(tmp_path / "image.jpg")
+    cv2.imwrite(filepath, np.zeros((48, 64, 3), dtype=np.uint8))
+    comm = ListCommAPI([filepath] * 3)
+    module = ThreadModule("Thread", "1.0.0")
+    server = Server(module, comm, max_inflight=2)
+    server._start()
+
+    assert len(comm.pushed) == 3
+    assert len(module.process_threads) == 1
+    assert module.init_threads == list(module.process_threads)
+    assert module.init_threads[0] != threading.get_ident()
@@ -0,0 +1,173 @@
+import json
+import time
+
+import pytest
+
+from multivitamin.apis import SQSAPI
+
+
+class StubSQS:
+    """In-memory stand-in for boto3.client("sqs") that counts API calls
+
+    If default_visibility is set, received messages are hidden for their visibility timeout,
+    then delivered again unless they were deleted.
+    """
+
+    def __init__(self, n_messages, default_visibility=None):
+        self.queue = [
+            {"Body": json.dumps({"url": f"file://{i}.jpg"}), "ReceiptHandle": f"rh-{i}"}
+            for i in range(n_messages)
+        ]
+        self.default_visibility = default_visibility
+        self.hidden = {}
+        self.calls = {}
+        self.deleted = []
+        self.extended = []
+        self.redelivered = []
+
+    def _count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def get_queue_url(self, QueueName):
+        self._count("get_queue_url")
+        return {"QueueUrl": f"https://sqs.local/{QueueName}"}
+
+    def receive_message(
+        self, QueueUrl, MaxNumberOfMessages=1, WaitTimeSeconds=0, VisibilityTimeout=None
+    ):
+        self._count("receive_message")
+        assert 1 <= MaxNumberOfMessages <= 10
+        now = time.monotonic()
+        for rh, (message, visible_at) in list(self.hidden.items()):
+            if visible_at <= now:
+                del self.hidden[rh]
+                self.redelivered.append(rh)
+                self.queue.append(message)
+        batch = self.queue[:MaxNumberOfMessages]
+        self.queue = self.queue[MaxNumberOfMessages:]
+        if self.default_visibility is not None:
+            if VisibilityTimeout is None:
+                VisibilityTimeout = self.default_visibility
+            for message in batch:
+                self.hidden[message["ReceiptHandle"]] = (message, now + VisibilityTimeout)
+        if not batch:
+            return {}
+        return {"Messages": batch}
+
+    def delete_message_batch(self, QueueUrl, Entries):
+        self._count("delete_message_batch")
+        assert len(Entries) <= 10
+        self.deleted.extend(e["ReceiptHandle"] for e in Entries)
+        for e in Entries:
+            self.hidden.pop(e["ReceiptHandle"], None)
+        return {"Successful": [{"Id": e["Id"]} for e in Entries]}
+
+    def change_message_visibility_batch(self, QueueUrl, Entries):
+        self._count("change_message_visibility_batch")
+        assert len(Entries) <= 10
+        self.extended.extend(e["ReceiptHandle"] for e in Entries)
+        for e in Entries:
+            if e["ReceiptHandle"] in self.hidden:
+                message = self.hidden[e["ReceiptHandle"]][0]
+                self.hidden[e["ReceiptHandle"]] = (
+                    message, time.monotonic() + e["VisibilityTimeout"]
+                )
+        return {"Successful": [{"Id": e["Id"]} for e in Entries]}
+
+
+def test_batched_pull_and_delete():
+    stub = StubSQS(25)
+    sqs_api = SQSAPI("test-queue", sqs_client=stub, heartbeat=False)
+
+    requests = sqs_api.pull(25)
+    assert len(requests) == 25
+    assert stub.calls["receive_message"] == 3
+
+    sqs_api.ack(requests)
+    sqs_api.close()
+    assert sorted(stub.deleted) == sorted(r.request_id for r in requests)
+    assert stub.calls["delete_message_batch"] == 3
+
+
+def test_deletes_are_batched_until_due():
+    stub = StubSQS(12)
+    sqs_api = SQSAPI("test-queue", sqs_client=stub, heartbeat=False, delete_interval=0.2)
+
+    requests = sqs_api.pull(3)
+    sqs_api.ack(requests[:1])
+    sqs_api.pull(3)  # pulling does not flush acked messages
+    sqs_api.ack(requests[1:2])
+    assert "delete_message_batch" not in stub.calls
+
+    time.sleep(0.25)
+    sqs_api.ack(requests[2:])
+    assert stub.calls["delete_message_batch"] == 1
+    assert stub.deleted == [r.request_id for r in requests]
+
+    requests = sqs_api.pull(3)
+    sqs_api.ack(requests)
+    assert stub.calls["delete_message_batch"] == 1
+    sqs_api.close()
+    assert stub.calls["delete_message_batch"] == 2
+    assert len(stub.deleted) == 6
+
+
+def test_pull_returns_partial_batch():
+    stub = StubSQS(3)
+    sqs_api = SQSAPI("test-queue", sqs_client=stub, heartbeat=False)
+    assert len(sqs_api.pull(10)) == 3
+
+
+def test_heartbeat_extends_inflight_only():
+    stub = StubSQS(4)
+    sqs_api = SQSAPI("test-queue", sqs_client=stub, heartbeat_interval=0.05)
+    requests = sqs_api.pull(4)
+    sqs_api.ack(requests[:1])
+    sqs_api.nack(requests[1:2])
+    time.sleep(0.3)
+    sqs_api.close()
+
+    assert set(stub.extended) == {r.request_id for r in requests[2:]}
+    assert stub.deleted == [requests[0].request_id]
+
+
+def test_pulled_messages_outlive_default_visibility():
+    stub = StubSQS(4, default_visibility=0.1)
+    sqs_api = SQSAPI(
+        "test-queue", sqs_client=stub, visibility_timeout=1, heartbeat_interval=0.5
+    )
+    requests = sqs_api.pull(2)
+    # processing takes longer than the default visibility of the queue, but not than the
+    # visibility set on receipt, and the first heartbeat has not fired yet
+    time.sleep(0.3)
+    requests.extend(sqs_api.pull(2))
+    assert len(requests) == 4
+    sqs_api.ack(requests)
+    sqs_api.close()
+
+    assert stub.redelivered == []
+    assert sorted(stub.deleted) == sorted(r.request_id for r in requests)
+
+
+def test_against_moto():
+    moto = pytest.importorskip("moto")
+    import boto3
+
+    mock = getattr(moto, "mock_aws", None) or getattr(moto, "mock_sqs")
+    with mock():
+        client = boto3.client("sqs", region_name="us-east-1")
+        url = client.create_queue(QueueName="test-queue")["QueueUrl"]
+        for i in range(12):
+            client.send_message(QueueUrl=url, MessageBody=json.dumps({"url": f"{i}.jpg"}))
+
+        sqs_api = SQSAPI("test-queue", sqs_client=client, heartbeat=False)
+        requests = []
+        while len(requests) < 12:
+            requests.extend(sqs_api.pull(12 - len(requests)))
+        sqs_api.ack(requests)
+        sqs_api.close()
+
+        attrs = client.get_queue_attributes(
+            QueueUrl=url, AttributeNames=["ApproximateNumberOfMessages"]
+        )
+        assert attrs["Attributes"]["ApproximateNumberOfMessages"] == "0"
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from multivitamin.data import Response
+from utils import stub_caffe, import_with_stubs
+
+LABELMAP = {1: "net", 2: "glass"}
+
+
+class StubBlob:
+    def __init__(self, shape):
+        self.data = np.zeros(shape, dtype=np.float32)
+
+    def reshape(self, *shape):
+        self.data = np.zeros(shape, dtype=np.float32)
+
+
+class StubNet:
+    """Returns the detection_out class attribute, whatever the input"""
+
+    detection_out = None
+
+    def __init__(self, *args):
+        self.blobs = {"data": StubBlob((1, 3, 8, 8))}
+
+    def forward(self):
+        return {"detection_out": self.detection_out}
+
+
+@pytest.fixture
+def detector(monkeypatch, tmp_path):
+    """SSDDetector imported against a stub caffe, without a model"""
+    module = import_with_stubs(
+        monkeypatch,
+        "multivitamin.applications.images.detectors.ssd_detector",
+        stub_caffe(StubNet),
+    )
+    monkeypatch.setattr(module, "load_label_prototxt", lambda prototxt_file: LABELMAP)
+    return module.SSDDetector("Stub", "1.0.0", str(tmp_path), confidence_min=0.3, gpuid=None)
+
+
+def _detection_out(rows):
+    return np.array(rows, dtype=np.float32).reshape(1, 1, -1, 7)
+
+
+def test_decode(detector):
+    predictions = _detection_out([
+        [0, 1, 0.9, -0.1, 0.2, 0.5, 1.2],  # clipped to the frame
+        [1, 2, 0.2, 0.1, 0.1, 0.3, 0.3],  # below confidence_min
+        [-1, 1, 0.9, 0.1, 0.1, 0.3, 0.3],  # padding row of an empty batch
+        [1, 7, 0.9, 0.1, 0.1, 0.3, 0.3],  # unknown label
+        [2, 2, 0.5, 0.1, 0.2, 0.3, 0.6],
+    ])
+
+    image_ids, labels, confidences, boxes, areas = detector._decode(predictions)
+
+    assert image_ids.tolist() == [0, 2]
+    assert labels == ["net", "glass"]
+    np.testing.assert_allclose(confidences, [0.9, 0.5], rtol=1e-6)
+    np.testing.assert_allclose(boxes, [[0.0, 0.2, 0.5, 1.0], [0.1, 0.2, 0.3, 0.6]], rtol=1e-6)
+    np.testing.assert_allclose(areas, [0.4, 0.08], rtol=1e-5)
+
+
+def test_detections_are_routed_to_their_frame(detector, monkeypatch):
+    monkeypatch.setattr(StubNet, "detection_out", _detection_out([
+        [2, 2, 0.8, 0.1, 0.2, 0.3, 0.6],
+        [0, 1, 0.9, 0.0, 0.0, 0.5, 0.5],
+        [2, 1, 0.4, 0.5, 0.5, 1.0, 1.0],
+    ]))
+    detector.response = Response()
+    images = [np.zeros((16, 12, 3), dtype=np.uint8)] * 3
+    detector.process_images(images, [0.0, 1.0, 2.0])
+
+    detections = [
+        (frame_ann["t"], region["props"][0]["value"], round(region["contour"][0]["x"], 3))
+        for frame_ann in detector.response.frame_anns
+        for region in frame_ann["regions"]
+    ]
+    assert sorted(detections) == [(0.0, "net", 0.0), (2.0, "glass", 0.1), (2.0, "net", 0.5)]
+    assert all(fa["t"] != 1.0 for fa in detector.response.frame_anns)
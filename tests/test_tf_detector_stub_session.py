@@ -0,0 +1,90 @@
+import types
+from unittest import mock
+
+import numpy as np
+import pytest
+
+from multivitamin.data import Response
+from utils import import_with_stubs
+
+MAX_DETECTIONS = 3
+
+
+class StubSession:
+    """Detects one box per frame, whose class is the pixel value of the frame, and whose
+    xmin is the width of the frame over 1000"""
+
+    def __init__(self):
+        self.batch_shapes = []
+
+    def run(self, fetches, feed_dict):
+        batch = feed_dict["image_tensor:0"]
+        self.batch_shapes.append(batch.shape)
+        n = len(batch)
+        boxes = np.zeros((n, MAX_DETECTIONS, 4), dtype=np.float32)
+        boxes[:, 0] = [[0.0, batch.shape[2] / 1000, 1.0, 1.0]]
+        scores = np.zeros((n, MAX_DETECTIONS), dtype=np.float32)
+        scores[:, 0] = 0.9
+        scores[:, 1] = 0.8  # beyond num_detections
+        classes = np.zeros((n, MAX_DETECTIONS), dtype=np.float32)
+        classes[:, 0] = batch[:, 0, 0, 0]
+        num = np.ones(n, dtype=np.float32)
+        return boxes, scores, classes, num
+
+
+@pytest.fixture
+def detector(monkeypatch, tmp_path):
+    """TFDetector imported against a stub tensorflow, without a model"""
+    session = StubSession()
+    tf = types.ModuleType("tensorflow")
+    tf.Graph = mock.MagicMock()
+    tf.Graph.return_value.get_tensor_by_name.side_effect = lambda name: name
+    for name in ("device", "GraphDef", "gfile", "import_graph_def", "ConfigProto"):
+        setattr(tf, name, mock.MagicMock())
+    tf.Session = mock.MagicMock(return_value=session)
+    module = import_with_stubs(
+        monkeypatch, "multivitamin.applications.images.detectors.tf_detector", [tf]
+    )
+    (tmp_path / "idmap.txt").write_text("1\tball\n2\tnet\n3\tglass\n")
+    detector = module.TFDetector("Stub", "1.0.0", str(tmp_path), gpuid=0)
+    detector.response = Response()
+    return detector, session
+
+
+def test_stack_frames_groups_by_shape(detector):
+    detector, _ = detector
+    images = [np.full(shape, idx, dtype=np.uint8) for idx, shape in enumerate(
+        [(4, 6, 3), (8, 6, 3), (4, 6, 3), (4, 2, 3), (8, 6, 3)]
+    )]
+    images[0][..., 0] = 100  # blue channel, which becomes the last one
+
+    groups = detector._stack_frames(images)
+
+    assert [indexes for indexes, _ in groups] == [[0, 2], [1, 4], [3]]
+    for indexes, batch in groups:
+        assert batch.shape == (len(indexes),) + images[indexes[0]].shape
+        for image_idx, frame in zip(indexes, batch):
+            np.testing.assert_array_equal(frame, images[image_idx][..., ::-1])
+
+
+def test_detections_follow_input_order(detector):
+    detector, session = detector
+    shapes = [(4, 6, 3), (8, 10, 3), (4, 6, 3), (8, 10, 3), (6, 4, 3)]
+    images = [np.full(shape, idx % 3 + 1, dtype=np.uint8) for idx, shape in enumerate(shapes)]
+    tstamps = [0.0, 1.0, 2.0, 3.0, 4.0]
+
+    detector.process_images(images, tstamps)
+
+    assert session.batch_shapes == [(2, 4, 6, 3), (2, 8, 10, 3), (1, 6, 4, 3)]
+    detections = {
+        frame_ann["t"]: [
+            (region["props"][0]["value"], round(region["contour"][0]["x"], 3))
+            for region in frame_ann["regions"]
+        ]
+        for frame_ann in detector.response.frame_anns
+    }
+    labels = {1: "ball", 2: "net", 3: "glass"}
+    assert detections == {
+        t: [(labels[idx % 3 + 1], shape[1] / 1000)]
+        for idx, (t, shape) in enumerate(zip(tstamps, shapes))
+    }
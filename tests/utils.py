@@ -1,6 +1,16 @@
+import os
+import sys
+import time
+import types
+import threading
+import importlib
+import importlib.machinery
 import boto3
 
 from io import BytesIO
+from contextlib import contextmanager
+from socketserver import ThreadingMixIn
+from http.server import HTTPServer, SimpleHTTPRequestHandler
 
 
 def load_fileobj(s3_bucket_name, key):
@@ -18,3 +28,143 @@ def generate_fileobj_from_s3_folder(s3_bucket_name, s3_folder_key):
             continue
         bytes_obj = load_fileobj(obj.bucket_name, obj.key)
         yield obj.key, bytes_obj
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """SimpleHTTPRequestHandler answering "Range: bytes=start-end" requests with 206
+
+    Class attributes, set on a subclass:
+        root (str): served directory
+        bytes_per_sec (float): throughput of each connection, None for no limit
+        failures (list[int]): status codes of the first responses to GET requests
+    """
+
+    protocol_version = "HTTP/1.1"
+    root = None
+    bytes_per_sec = None
+    failures = []
+
+    def log_message(self, *args):
+        pass
+
+    def translate_path(self, path):
+        return os.path.join(self.root, path.split("?")[0].lstrip("/"))
+
+    def end_headers(self):
+        self.send_header("Accept-Ranges", "bytes")
+        super().end_headers()
+
+    def do_GET(self):
+        if self.failures:
+            self.send_response(self.failures.pop(0))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        path = self.translate_path(self.path)
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        byte_range = self.headers.get("Range")
+        if byte_range:
+            start, end = byte_range.split("=")[1].split("-")
+            start, end = int(start), min(int(end or size - 1), size - 1)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(remaining, 2 ** 16))
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+                if self.bytes_per_sec:
+                    time.sleep(len(chunk) / self.bytes_per_sec)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@contextmanager
+def serve_directory(directory, handler=RangeRequestHandler):
+    """Serve a directory over HTTP on localhost, in a background thread
+
+    Yields:
+        str: base url of the server
+    """
+    class Handler(handler):
+        pass
+
+    Handler.root = directory
+    server = _ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class StubTransformer:
+    """Stand-in for caffe.io.Transformer, with only the attributes preprocess_batch reads"""
+
+    def __init__(self, inputs):
+        self.inputs = inputs
+        self.transpose = {}
+        self.channel_swap = {}
+        self.raw_scale = {}
+        self.mean = {}
+        self.input_scale = {}
+
+    def set_transpose(self, in_, order):
+        self.transpose[in_] = order
+
+    def set_mean(self, in_, mean):
+        self.mean[in_] = mean
+
+
+def stub_caffe(net_cls):
+    """Stand-in caffe package, whose Net is net_cls
+
+    Returns:
+        list[module]: caffe and its submodules
+    """
+    import cv2
+
+    caffe = types.ModuleType("caffe")
+    caffe.TEST = 1
+    caffe.Net = net_cls
+    caffe.set_mode_cpu = lambda: None
+    caffe.set_mode_gpu = lambda: None
+    caffe.set_device = lambda gpuid: None
+    caffe.io = types.ModuleType("caffe.io")
+    caffe.io.Transformer = StubTransformer
+    caffe.io.resize_image = lambda image, dims: cv2.resize(image, tuple(dims[::-1]))
+    caffe.proto = types.ModuleType("caffe.proto")
+    caffe.proto.caffe_pb2 = types.ModuleType("caffe.proto.caffe_pb2")
+    return [caffe, caffe.io, caffe.proto, caffe.proto.caffe_pb2]
+
+
+def import_with_stubs(monkeypatch, name, stubs):
+    """Import a fresh copy of a module while stub modules stand in for its dependencies
+
+    Args:
+        monkeypatch: pytest monkeypatch fixture, which restores sys.modules
+        name (str): module to import
+        stubs (list[module]): modules to register in sys.modules under their names
+
+    Returns:
+        module: the imported module, which is not left in sys.modules
+    """
+    for stub in stubs:
+        stub.__spec__ = importlib.machinery.ModuleSpec(stub.__name__, None)
+        monkeypatch.setitem(sys.modules, stub.__name__, stub)
+    monkeypatch.delitem(sys.modules, name, raising=False)
+    module = importlib.import_module(name)
+    monkeypatch.delitem(sys.modules, name)
+    return module